@@ -1,18 +1,91 @@
 import os
-from typing import Optional
+import json
+import asyncio
+import threading
+from typing import List, Optional
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, Form, HTTPException
-from helper.Load_data import load_data
-from helper.Vector_db import add_documents_to_pinecone
-from helper.Full_chain import get_response
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from helper.Load_data import stream_data
+from helper.Vector_db import add_documents_to_pinecone, add_files_to_pinecone
+from helper.Full_chain import (get_response, stream_response, aget_response, astream_response, warm_up, is_warm,
+                               aopen_clients, aclose_clients)
+from helper.Clients import registry
+from helper.Answer_cache import answer_cache_stats
+from helper.Metrics import metrics
+from helper.Context_packing import packing_stats
+from helper.Coalescing import response_flight
+from helper.MySQL_DB import (close_chat_history, close_async_chat_history, get_chat_history_page, aget_chat_history_page,
+                             chat_history_enabled, migrate_chat_history)
+from helper.Job_queue import ingestion_queue, QueueFullError, INGEST_JOB_MAX_IN_FLIGHT
+from helper.Uploads import spool_files, remove_spooled, UploadError, UploadTooLargeError
+from helper.Transcripts import split_urls
+from helper.Tenants import normalize_tenant, tenant_user, active_tenants, InvalidTenantError
 
 _ = load_dotenv(override=True)
 
+# "background" (default): build the chain in a thread, so the worker serves /health at once;
+# "blocking": build it before accepting requests; "off": build it on the first request.
+WARM_UP = os.getenv("WARM_UP", "background").lower()
+# Serve queries with the async clients on the event loop (default), or with the sync chain
+# in the threadpool, which needs a thread per in-flight conversation.
+ASYNC_QUERY_PATH = os.getenv("ASYNC_QUERY_PATH", "true").lower() == "true"
+
+
+def _warm_up():
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"⚠️ Could not warm up the retrieval chain: {e}")
+
+
+def _migrate():
+    try:
+        migrate_chat_history()
+    except Exception as e:
+        print(f"⚠️ Could not create the chat history table or index: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the shared retrieval chain at startup so the first request doesn't pay for it,
+    create the chat history table and index if missing, and flush buffered chat history
+    on shutdown.
+
+    Heavy libraries and external clients (Gemini, Pinecone, MySQL) are only loaded here or
+    on first use, never at import, so workers start fast even if a dependency is down.
+
+    On the async query path the vector store's HTTP session is opened alongside (or by the
+    first query when WARM_UP=off) and closed on shutdown together with the async MySQL pool.
+    """
+    if chat_history_enabled():
+        # In a thread, so a database that is down doesn't hold up the worker's startup
+        threading.Thread(target=_migrate, name="migrate", daemon=True).start()
+    if WARM_UP == "blocking":
+        _warm_up()
+    elif WARM_UP == "background":
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+    if ASYNC_QUERY_PATH and WARM_UP == "blocking":
+        await aopen_clients()
+    elif ASYNC_QUERY_PATH and WARM_UP == "background":
+        asyncio.ensure_future(aopen_clients())
+    yield
+    ingestion_queue.shutdown(wait=True)
+    close_chat_history()
+    if ASYNC_QUERY_PATH:
+        await aclose_clients()
+        await close_async_chat_history()
+
+
 app = FastAPI(
     debug=True,
     title="Customer Support Chatbot",
     description="A chatbot for E-Commerce websites.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 
@@ -20,68 +93,267 @@ app = FastAPI(
 async def root():
     return {"message": "Hello World"}
 
+
+@app.get("/health")
+async def Health():
+    """
+    Liveness/readiness probe: `warm` is true once the retrieval chain is built.
+    """
+    return {"status": "ok", "warm": is_warm()}
+
+
+@app.get("/stats")
+async def Stats():
+    """
+    Report answer-cache hit rate and latency saved, context tokens saved by packing,
+    request coalescing, client reuse, tenants held in memory and ingestion queue state.
+    """
+    embedding_model = registry.peek("cached_embedding_model")
+    return {"answer_cache": answer_cache_stats(),
+            "context": packing_stats.stats(),
+            "coalescing": {"get_response": response_flight.stats(),
+                           "query_embedding": embedding_model.query_batcher.stats() if embedding_model else None},
+            "clients": registry.stats(),
+            "tenants": active_tenants.stats(),
+            "ingestion": ingestion_queue.stats(),
+            "stages": metrics.snapshot()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def Metrics_Endpoint():
+    """
+    Export stage latency histograms, counters and cache/queue gauges in the Prometheus text format.
+    """
+    cache = answer_cache_stats()
+    metrics.set_gauge("rag_answer_cache_entries", cache["entries"])
+    metrics.set_gauge("rag_answer_cache_saved_seconds", cache["saved_seconds"])
+    for tenant, stats in cache["tenants"].items():
+        metrics.set_gauge("rag_answer_cache_entries", stats["entries"], tenant=tenant)
+        metrics.set_gauge("rag_answer_cache_saved_seconds", stats["saved_seconds"], tenant=tenant)
+    ingestion = ingestion_queue.stats()
+    metrics.set_gauge("rag_ingestion_jobs_active", ingestion["active"])
+    for state, count in ingestion["states"].items():
+        metrics.set_gauge("rag_ingestion_jobs", count, state=state)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _tenant(tenant):
+    try:
+        tenant = normalize_tenant(tenant)
+    except InvalidTenantError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    active_tenants.use(tenant)
+    return tenant
+
+
+def _ingest(job, file_paths=None, sources=None, urls=None, tenant=None):
+    """
+    Ingestion job run by the background queue; removes the uploaded files when done.
+
+    Files are ingested incrementally under their original names (`sources`): unchanged
+    files are skipped and stale vectors of updated files are deleted (see `add_files_to_pinecone`).
+    Files that could not be parsed are listed in the result's `failed_files`; the job fails
+    when every file that was not skipped failed, like a URL job with nothing ingested.
+
+    Video transcripts are fetched concurrently; videos that failed are listed in the
+    result's `failed_urls`, and the job fails only when no chunk at all was ingested (URLs
+    of the same video are fetched once, so comparing URL counts would not tell).
+    """
+    on_progress = lambda chunks: setattr(job, "progress", chunks)
+    try:
+        if file_paths:
+            report = add_files_to_pinecone(file_paths, max_in_flight=INGEST_JOB_MAX_IN_FLIGHT, on_progress=on_progress,
+                                           sources=sources, tenant=tenant)
+            loaded = set(sources or file_paths) - set(report.skipped_files) - set(report.failed_files)
+            if report.failed_files and not loaded:
+                raise ValueError(f"Could not load any file: {report.errors}")
+            return report.as_dict()
+
+        failed_urls = {}
+        report = add_documents_to_pinecone(stream_data(urls=urls, report=failed_urls),
+                                           max_in_flight=INGEST_JOB_MAX_IN_FLIGHT, on_progress=on_progress,
+                                           tenant=tenant)
+        if not report.chunks:
+            raise ValueError(f"Could not retrieve any transcript: {failed_urls}" if failed_urls
+                             else "The transcripts were empty")
+        return {**report.as_dict(), "failed_urls": failed_urls}
+    finally:
+        remove_spooled(file_paths or [])
+
+
 @app.post("/add_data")
-async def Add_Data_Pinecone(files_data: Optional[UploadFile]=None,
-                            url: Optional[str] = Form(None),
-                            case: str=Form(..., description='Case', enum=['URL', 'Document'])):
+async def Add_Data_Pinecone(files_data: Optional[List[UploadFile]] = File(None),
+                            url: Optional[List[str]] = Form(None),
+                            case: str=Form(..., description='Case', enum=['URL', 'Document']),
+                            tenant: Optional[str] = Form(None, description='Tenant (brand or catalog) to index into')):
     """
     Endpoint to upload and process documents or YouTube video transcripts.
 
-    - If a file is uploaded, it will be processed and stored in Pinecone.
-    - If a YouTube URL is provided, the transcript will be extracted and stored.
+    - If files are uploaded (one or more `files_data` parts), they will be processed and stored in Pinecone.
+    - If YouTube URLs are provided (repeated `url` fields, or several URLs in one field
+      separated by newlines, spaces or commas), their transcripts will be extracted and stored.
+      Transcripts are fetched concurrently (TRANSCRIPT_CONCURRENCY, TRANSCRIPT_RATE_LIMIT)
+      and cached, so re-ingesting a video does not fetch it again.
+
+    Uploads are copied to unique spool files in 1 MiB chunks, so memory stays flat
+    whatever their size; files over UPLOAD_MAX_FILE_MB, or batches over
+    UPLOAD_MAX_TOTAL_MB, are rejected with 413.
+
+    With a `tenant`, the content goes to the tenant's own namespace and is only searched
+    by queries for that tenant; without one it goes to the default namespace.
+
+    Processing runs in the background; the response carries a `job_id` to poll with
+    `GET /add_data/{job_id}`. Returns 429 when the ingestion queue is full.
     """
     try:
+        tenant = _tenant(tenant)
+        files_data = [upload for upload in files_data or [] if upload.filename]
+        urls = split_urls(url)
         # if files_data and files_data.filename:
         if case == 'Document':
-            if not files_data or not files_data.filename:
+            if not files_data:
                 raise HTTPException(status_code=400, detail="No file uploaded for Document case")
-            if url:
+            if urls:
                 raise HTTPException(status_code=400, detail="URL should not be provided for Document case")
             
-            temp_file_path = os.path.join(os.getcwd(), files_data.filename)
-            with open(temp_file_path, "wb") as temp_file:
-                temp_file.write(await files_data.read())
+            # The copy runs in a worker thread so large uploads don't block the event loop
+            spooled = await run_in_threadpool(spool_files, [(upload.file, upload.filename) for upload in files_data])
+            file_paths, sources = [path for path, _ in spooled], [name for _, name in spooled]
             
-            data = load_data(file_paths=[temp_file_path])
-            add_documents_to_pinecone(data)
-            _ = os.remove(temp_file_path)
-            return {"message": "✅ Files uploaded and processed successfully. 📁"}
+            try:
+                job = ingestion_queue.submit(case, _ingest, file_paths=file_paths, sources=sources, tenant=tenant,
+                                             on_cancel=lambda: remove_spooled(file_paths))
+            except QueueFullError:
+                remove_spooled(file_paths)
+                raise
+            return {"message": f"✅ {len(file_paths)} file(s) uploaded, processing started. 📁", "job_id": job.id,
+                    "files": sources, "tenant": tenant}
         
         # elif url:
         elif case == 'URL':
-            if not url:
+            if not urls:
                 raise HTTPException(status_code=400, detail="No URL provided for URL case")
             if files_data:
                 raise HTTPException(status_code=400, detail="File should not be provided for URL case")
             
-            data = load_data(url=url)
-            add_documents_to_pinecone(data)
-            return {"message": "✅ URL processed successfully. 🔗"}
+            job = ingestion_queue.submit(case, _ingest, urls=urls, tenant=tenant)
+            return {"message": f"✅ {len(urls)} URL(s) received, processing started. 🔗", "job_id": job.id,
+                    "tenant": tenant}
         
         else:
             return HTTPException(status_code=400, detail="Please provide either file or url.")
-    
+
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         return HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/add_data/{job_id}")
+async def Add_Data_Status(job_id: str):
+    """
+    Report the state (`queued`, `running`, `succeeded`, `failed`) and progress of an ingestion job.
+
+    `progress` is the number of chunks upserted so far; `result` holds the upsert report
+    once the job has succeeded.
+    """
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.as_dict()
     
 
 @app.post("/get_response")
-async def Get_Response(user_query: str = Form(...), user_id: str = Form(None)):
+async def Get_Response(user_query: str = Form(...), user_id: str = Form(None), tenant: Optional[str] = Form(None)):
     """
     Get a response from the conversational retrieval chain based on the user's query.
 
     Retrieves the chat history for the user, creates a conversational retrieval chain, and uses it to
     generate a response. The response is then saved to the chat history.
 
+    With ASYNC_QUERY_PATH (the default) the whole query is awaited on the event loop, so a
+    single worker serves hundreds of conversations at once; otherwise it runs in the threadpool.
+
     Args:
         user_query (str): The user's query.
         user_id (str): The ID of the user.
+        tenant (str, optional): Only search this tenant's documents (see `/add_data`).
 
     Returns:
         dict: A dictionary containing the response and other metadata.
     """    
+    tenant = _tenant(tenant)
     try:
-        return {"message": get_response(user_query=user_query, user_id=user_id)}
+        if ASYNC_QUERY_PATH:
+            return {"message": await aget_response(user_query=user_query, user_id=user_id, tenant=tenant)}
+        # Run in the threadpool so concurrent requests overlap (and can be coalesced)
+        return {"message": await run_in_threadpool(get_response, user_query=user_query, user_id=user_id,
+                                                   tenant=tenant)}
     
     except Exception as e:
-        return HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        return HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/chat_history/{user_id}")
+async def Chat_History(user_id: str, limit: int = 20, before_id: Optional[int] = None, tenant: Optional[str] = None):
+    """
+    Return one page of a user's chat history (in `tenant`, if given), newest first.
+
+    Pass the returned `next_before_id` as `before_id` to get the next (older) page.
+    """
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    user_id = tenant_user(user_id, _tenant(tenant))
+    try:
+        if ASYNC_QUERY_PATH:
+            page = await aget_chat_history_page(user_id, limit=limit, before_id=before_id)
+        else:
+            page = await run_in_threadpool(get_chat_history_page, user_id, limit=limit, before_id=before_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"turns": [{"id": row[0], "user_query": row[1], "chatbot_answer": row[2]} for row in page["turns"]],
+            "next_before_id": page["next_before_id"]}
+
+
+@app.post("/get_response/stream")
+async def Get_Response_Stream(user_query: str = Form(...), user_id: str = Form(None),
+                              tenant: Optional[str] = Form(None)):
+    """
+    Stream a response as Server-Sent Events.
+
+    The `sources` event (with the `video-url` of the top source document) is sent as soon
+    as retrieval finishes, followed by one `token` event per generated chunk and a final
+    `done` event carrying the full answer. Errors are sent as an `error` event.
+
+    Args:
+        user_query (str): The user's query.
+        user_id (str): The ID of the user.
+        tenant (str, optional): Only search this tenant's documents (see `/add_data`).
+
+    Returns:
+        StreamingResponse: A `text/event-stream` response.
+    """
+    tenant = _tenant(tenant)
+
+    def events():
+        try:
+            for event in stream_response(user_query=user_query, user_id=user_id, tenant=tenant):
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    async def aevents():
+        try:
+            async for event in astream_response(user_query=user_query, user_id=user_id, tenant=tenant):
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(aevents() if ASYNC_QUERY_PATH else events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
\ No newline at end of file
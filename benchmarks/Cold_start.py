@@ -0,0 +1,117 @@
+"""
+Cold-start budget check for API workers.
+
+Each measurement runs in a fresh interpreter, the way an autoscaler starts a worker:
+
+- import:         seconds to `import backend`
+- first_response: seconds from interpreter start to the first `GET /` answer (lifespan included)
+- ready:          seconds until `GET /health` reports the retrieval chain as warm (with the
+                  local stand-ins of `benchmarks/Fakes.py`, so no credentials are needed)
+
+Usage (from the repository root):
+    python -m benchmarks.Cold_start --runs 5 --import-budget 1.0 --first-response-budget 1.5 --ready-budget 3.0
+
+The median of each measurement is compared with its budget; the exit code is 1 when a
+budget is exceeded. The slowest imports (from `python -X importtime`) are listed to show
+what to make lazy next.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT = """
+import time
+start = time.perf_counter()
+import backend
+print("seconds", time.perf_counter() - start)
+"""
+
+_FIRST_RESPONSE = """
+import time
+start = time.perf_counter()
+from fastapi.testclient import TestClient
+import backend
+with TestClient(backend.app) as client:
+    client.get("/").raise_for_status()
+    print("seconds", time.perf_counter() - start)
+"""
+
+_READY = """
+import time, tempfile
+start = time.perf_counter()
+from benchmarks import Fakes
+Fakes.install(tempfile.mkdtemp(prefix="rag-cold-start-"))
+from fastapi.testclient import TestClient
+import backend
+with TestClient(backend.app) as client:
+    while not client.get("/health").json()["warm"]:
+        time.sleep(0.01)
+    print("seconds", time.perf_counter() - start)
+"""
+
+
+def _measure(script: str, runs: int) -> list:
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+        # Background threads may log after the measurement, so look for its line
+        lines = [line for line in output.stdout.splitlines() if line.startswith("seconds ")]
+        if not lines:
+            raise RuntimeError(f"No measurement in the output:\n{output.stdout}\n{output.stderr}")
+        timings.append(float(lines[-1].split()[1]))
+    return timings
+
+
+def slowest_imports(top: int = 10) -> list:
+    """Return the `top` modules with the largest cumulative import time, in seconds."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend"], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative) / 1e6, name.strip()))
+    return [{"module": name, "seconds": round(seconds, 3)} for seconds, name in sorted(modules, reverse=True)[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold start against budgets.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1.0, help="Seconds to import backend.")
+    parser.add_argument("--first-response-budget", type=float, default=1.5, help="Seconds to the first response.")
+    parser.add_argument("--ready-budget", type=float, default=3.0, help="Seconds until the chain is warm.")
+    parser.add_argument("--output", help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    budgets = {"import": args.import_budget, "first_response": args.first_response_budget,
+               "ready": args.ready_budget}
+    scripts = {"import": _IMPORT, "first_response": _FIRST_RESPONSE, "ready": _READY}
+    report = {"results": {}, "slowest_imports": slowest_imports()}
+    exceeded = []
+    for name, script in scripts.items():
+        timings = _measure(script, args.runs)
+        median = statistics.median(timings)
+        report["results"][name] = {"median_seconds": round(median, 3), "max_seconds": round(max(timings), 3),
+                                   "budget_seconds": budgets[name]}
+        if median > budgets[name]:
+            exceeded.append(f"{name}: {median:.3f}s > {budgets[name]}s")
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    for line in exceeded:
+        print(f"❌ Over budget: {line}")
+    if exceeded:
+        sys.exit(1)
+    print("✅ Cold start within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Concurrent conversations served by a single API worker.
+
+Runs `--conversations` simultaneous multi-turn conversations (each with its own user,
+so every turn after the first carries chat history) against one in-process instance of
+the FastAPI app, over ASGI, with the local stand-ins of `benchmarks/Fakes.py` for Gemini,
+Pinecone and MySQL. The same load is run twice:
+
+- async:      ASYNC_QUERY_PATH=true, queries awaited on the event loop
+- threadpool: ASYNC_QUERY_PATH=false, the sync chain in the threadpool (one thread per
+              in-flight conversation, 40 by default)
+
+Usage (from the repository root):
+    python -m benchmarks.Concurrency --conversations 300 --turns 3 --min-speedup 2.0
+
+The exit code is 1 when a request fails or the async path's throughput is less than
+`--min-speedup` times the threadpool's.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks import Fakes
+from benchmarks.Corpus import generate_corpus, generate_queries
+from benchmarks.Run_benchmarks import latency_summary
+
+
+async def run_conversations(app, conversations: int, turns: int, queries: list, label: str) -> dict:
+    """
+    Run `conversations` concurrent conversations of `turns` turns and summarise turn latency and throughput.
+    """
+    import httpx
+
+    latencies, errors = [], 0
+
+    async def converse(client, number):
+        nonlocal errors
+        for turn in range(turns):
+            user_query = f"{queries[(number + turn) % len(queries)]} ({label} conversation {number}, turn {turn})"
+            start = time.perf_counter()
+            try:
+                response = await client.post("/get_response", data={"user_query": user_query,
+                                                                    "user_id": f"{label}-{number}"})
+                response.raise_for_status()
+                if "message" not in response.json():
+                    raise ValueError(response.json())
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors += 1
+                print(f"❌ {label} conversation {number}, turn {turn}: {e}")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(converse(client, number) for number in range(conversations)))
+        seconds = time.perf_counter() - started
+    summary = latency_summary(latencies, errors)
+    summary["seconds"] = round(seconds, 3)
+    summary["turns_per_sec"] = round(len(latencies) / seconds, 2)
+    return summary
+
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="rag-concurrency-")
+    Fakes.install(workdir, embed_latency=args.embed_latency, llm_latency=args.llm_latency,
+                  index_latency=args.index_latency, db_latency=args.db_latency)
+    import backend
+    from helper.Load_data import stream_data
+    from helper.Vector_db import add_documents_to_pinecone
+
+    add_documents_to_pinecone(stream_data(file_paths=generate_corpus(os.path.join(workdir, "corpus"), args.docs)))
+    queries = generate_queries(args.queries)
+
+    results = {}
+    async with backend.app.router.lifespan_context(backend.app):
+        for label, async_path in (("async", True), ("threadpool", False)):
+            backend.ASYNC_QUERY_PATH = async_path  # read by the endpoints on every request
+            print(f"⏱️ {label}")
+            results[label] = await run_conversations(backend.app, args.conversations, args.turns, queries, label)
+    backend.ASYNC_QUERY_PATH = True
+    threadpool = results["threadpool"]["turns_per_sec"]
+    results["speedup"] = round(results["async"]["turns_per_sec"] / threadpool, 2) if threadpool else 0.0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent conversations on one API worker.")
+    parser.add_argument("--conversations", type=int, default=300, help="Concurrent conversations.")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per conversation.")
+    parser.add_argument("--docs", type=int, default=6, help="Synthetic documents to ingest.")
+    parser.add_argument("--queries", type=int, default=50, help="Distinct questions to draw from.")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding call.")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds per (non-streamed) LLM call.")
+    parser.add_argument("--index-latency", type=float, default=0.02, help="Seconds per vector index call.")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Seconds per chat history query.")
+    parser.add_argument("--min-speedup", type=float, default=2.0,
+                        help="Required async / threadpool throughput ratio.")
+    parser.add_argument("--output", help="Write the JSON report here.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    failed = results["async"]["errors"] + results["threadpool"]["errors"]
+    if failed:
+        print(f"❌ {failed} request(s) failed")
+    if results["speedup"] < args.min_speedup:
+        print(f"❌ Async speedup {results['speedup']}x < {args.min_speedup}x")
+    if failed or results["speedup"] < args.min_speedup:
+        sys.exit(1)
+    print(f"✅ {args.conversations} concurrent conversations, async path {results['speedup']}x the threadpool")
+
+
+if __name__ == "__main__":
+    main()
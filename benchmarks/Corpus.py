@@ -0,0 +1,119 @@
+import os
+import random
+import zipfile
+from typing import List
+from xml.sax.saxutils import escape
+
+_WORDS = ("order shipping refund invoice account password delivery warranty discount subscription "
+          "website hosting design marketing support ticket customer payment card plan upgrade "
+          "domain email server backup security analytics campaign store product catalog").split()
+_ARABIC_WORDS = "الطلب الشحن الاسترداد الفاتورة الحساب التوصيل الضمان الخصم الاشتراك الدعم".split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f"SKU-{rng.randint(10000, 99999)}")
+    return " ".join(words).capitalize() + "."
+
+
+def _pages(rng: random.Random, pages: int, lines_per_page: int = 40) -> List[List[str]]:
+    return [[_sentence(rng) for _ in range(lines_per_page)] for _ in range(pages)]
+
+
+def write_txt(path: str, pages: List[List[str]]):
+    with open(path, "w", encoding="utf-8") as txt_file:
+        txt_file.write("\n\n".join("\n".join(lines) for lines in pages))
+
+
+def write_docx(path: str, pages: List[List[str]]):
+    """Write a minimal .docx (one paragraph per line) with the standard library only."""
+    paragraphs = "".join(f"<w:p><w:r><w:t>{escape(line)}</w:t></w:r></w:p>" for lines in pages for line in lines)
+    document = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+                f'<w:body>{paragraphs}</w:body></w:document>')
+    content_types = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                     '<Default Extension="xml" ContentType="application/xml"/>'
+                     '<Override PartName="/word/document.xml" ContentType="application/'
+                     'vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/></Types>')
+    relationships = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+                     'relationships/officeDocument" Target="word/document.xml"/></Relationships>')
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx_file:
+        docx_file.writestr("[Content_Types].xml", content_types)
+        docx_file.writestr("_rels/.rels", relationships)
+        docx_file.writestr("word/document.xml", document)
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """Write a minimal text PDF (Helvetica, one text line per sentence) with the standard library only."""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        text = " ".join("({}) Tj T*".format(line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)"))
+                        for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 36 806 Td {text} ET".encode("latin-1", "replace")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>"
+
+    output, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        body = body if isinstance(body, bytes) else body.encode("latin-1")
+        output += f"{number} 0 obj\n".encode("latin-1") + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(output)
+
+
+def generate_corpus(directory: str, documents: int = 30, pages: int = 5, seed: int = 7) -> List[str]:
+    """
+    Write a deterministic synthetic corpus of .pdf, .docx and .txt files (in turn).
+
+    Args:
+        directory (str): Where to write the files.
+        documents (int): Number of files.
+        pages (int): Pages per file (about 40 sentences each).
+        seed (int): Random seed; the same seed always gives the same corpus.
+
+    Returns:
+        list: The file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    writers = [("pdf", write_pdf), ("docx", write_docx), ("txt", write_txt)]
+    paths = []
+    for number in range(documents):
+        extension, writer = writers[number % len(writers)]
+        path = os.path.join(directory, f"document_{number:04d}.{extension}")
+        content = _pages(rng, pages)
+        if extension != "pdf":
+            content[0].append(" ".join(rng.choice(_ARABIC_WORDS) for _ in range(12)))
+        writer(path, content)
+        paths.append(path)
+    return paths
+
+
+def generate_queries(count: int, seed: int = 11) -> List[str]:
+    """Return `count` deterministic customer questions."""
+    rng = random.Random(seed)
+    templates = ["How do I {} my {}?", "What is your {} policy for {}?", "Can I get a {} on {}?",
+                 "Where is my {} {}?", "Is SKU-{} covered by the {}?"]
+    queries = []
+    for _ in range(count):
+        template = rng.choice(templates)
+        if "SKU" in template:
+            queries.append(template.format(rng.randint(10000, 99999), rng.choice(_WORDS)))
+        else:
+            queries.append(template.format(rng.choice(_WORDS), rng.choice(_WORDS)))
+    return queries
@@ -0,0 +1,360 @@
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic stand-in for Gemini embeddings: a normalized bag of hashed words.
+
+    Texts sharing words get similar vectors, so retrieval still behaves sensibly.
+    `latency` seconds are slept per call to mimic the API round trip (awaited by the
+    async methods, so concurrent calls overlap like real HTTP requests).
+    """
+
+    def __init__(self, dimensions: int = 768, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dimensions] += 1.0 if digest & (1 << 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str], task_type: Optional[str] = None) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str], task_type: Optional[str] = None) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+
+class FakeChatModel(SimpleChatModel):
+    """
+    Stand-in for the Gemini chat model.
+
+    Waits `latency` seconds before the first token and `token_latency` between tokens,
+    then answers with a fixed sentence that quotes the start of the prompt.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-fake-chat-model"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        prompt = " ".join(str(message.content) for message in messages)
+        return f"Thanks for asking! Based on our documentation ({len(prompt)} characters of context): " \
+               f"{' '.join(prompt.split()[:30])}"
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+              run_manager=None, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(messages)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if self.latency:
+            time.sleep(self.latency)
+        for word in self._answer(messages).split(" "):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for word in self._answer(messages).split(" "):
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeTranscriptSource:
+    """
+    Stand-in for YouTube transcripts: every video ID gets a generated transcript, except
+    the IDs in `unavailable`. `latency` seconds are slept per fetch; `calls` counts them.
+    """
+
+    def __init__(self, latency: float = 0.0, unavailable=(), language: str = "en"):
+        self.latency = latency
+        self.unavailable = set(unavailable)
+        self.language = language
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, video_id: str, languages: List[str]):
+        from helper.Transcripts import TranscriptUnavailable
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if video_id in self.unavailable or self.language not in languages:
+            raise TranscriptUnavailable(f"NoTranscriptFound: {video_id}")
+        return self.language, f"Welcome to the Kindix product tour {video_id}. " \
+                              f"In this video we show how to set up and use product {video_id.upper()}."
+
+
+class FakePineconeIndex:
+    """
+    Stand-in for a Pinecone `Index`: `upsert`, `delete` and exact cosine `query`, with
+    `latency` seconds slept per call to mimic the network.
+
+    It is accepted by `PineconeVectorStore(index=...)`, so retrieval runs the real
+    LangChain code path.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.config = SimpleNamespace(host="benchmark", api_key="benchmark")
+        self._lock = threading.Lock()
+        self._records: Dict[Optional[str], Dict[str, dict]] = {}
+        self._matrices: Dict[Optional[str], tuple] = {}
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upsert(self, vectors: List[dict], namespace: Optional[str] = None):
+        self._wait()
+        with self._lock:
+            records = self._records.setdefault(namespace, {})
+            for record in vectors:
+                records[record["id"]] = record
+            self._matrices.pop(namespace, None)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: List[str], namespace: Optional[str] = None):
+        self._wait()
+        with self._lock:
+            records = self._records.get(namespace, {})
+            for chunk_id in ids:
+                records.pop(chunk_id, None)
+            self._matrices.pop(namespace, None)
+
+    def count(self, namespace: Optional[str] = None) -> int:
+        return len(self._records.get(namespace, {}))
+
+    def query(self, vector: List[float], top_k: int = 10, include_values: bool = False,
+              include_metadata: bool = True, namespace: Optional[str] = None, filter: Optional[dict] = None):
+        self._wait()
+        return self._search(vector, top_k, include_values, include_metadata, namespace)
+
+    def _search(self, vector: List[float], top_k: int, include_values: bool, include_metadata: bool,
+                namespace: Optional[str]):
+        with self._lock:
+            if namespace not in self._matrices:
+                records = list(self._records.get(namespace, {}).values())
+                matrix = np.asarray([record["values"] for record in records], dtype=np.float32)
+                self._matrices[namespace] = (records, matrix)
+            records, matrix = self._matrices[namespace]
+        if not records:
+            return {"matches": []}
+
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ query / ((np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)) + 1e-12)
+        best = np.argsort(-scores)[:top_k]
+        matches = []
+        for position in best:
+            record = records[position]
+            match = {"id": record["id"], "score": float(scores[position]),
+                     "metadata": dict(record["metadata"]) if include_metadata else {}}
+            if include_values:
+                match["values"] = record["values"]
+            matches.append(match)
+        return {"matches": matches}
+
+
+class FakeAsyncPineconeIndex:
+    """
+    Stand-in for Pinecone's `IndexAsyncio`: awaits `latency` and searches the records of the
+    sync `FakePineconeIndex`. `sessions` counts the HTTP sessions a real client would open.
+    """
+
+    def __init__(self, index: FakePineconeIndex):
+        self.index = index
+        self.sessions = 0
+
+    async def __aenter__(self):
+        self.sessions += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def query(self, vector: List[float], top_k: int = 10, include_values: bool = False,
+                    include_metadata: bool = True, namespace: Optional[str] = None, filter: Optional[dict] = None):
+        if self.index.latency:
+            await asyncio.sleep(self.index.latency)
+        return self.index._search(vector, top_k, include_values, include_metadata, namespace)
+
+
+class FakePineconeAsyncio:
+    """Stand-in for the `PineconeAsyncio` client `PineconeVectorStore` opens for async searches."""
+
+    def __init__(self, index: FakePineconeIndex, **kwargs):
+        self.index = index
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def IndexAsyncio(self, host: str = None, **kwargs) -> FakeAsyncPineconeIndex:
+        return FakeAsyncPineconeIndex(self.index)
+
+
+class FakeAsyncPool:
+    """
+    aiomysql-style pool over a SQLite file: `acquire()`, `cursor()`, awaitable `execute` and
+    `fetchall`. Queries run in worker threads after awaiting `latency` seconds.
+    """
+
+    def __init__(self, database: str, latency: float = 0.0):
+        self.database = database
+        self.latency = latency
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self  # each query opens its own SQLite connection in its worker thread
+
+    @asynccontextmanager
+    async def cursor(self):
+        yield _FakeAsyncCursor(self)
+
+    def close(self):
+        pass
+
+    async def wait_closed(self):
+        pass
+
+
+class _FakeAsyncCursor:
+    def __init__(self, pool: FakeAsyncPool):
+        self.pool = pool
+        self.rows = []
+
+    async def execute(self, sql: str, params: tuple = ()):
+        if self.pool.latency:
+            await asyncio.sleep(self.pool.latency)
+        def run():
+            conn = sqlite3.connect(self.pool.database, check_same_thread=False)
+            try:
+                return conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+        self.rows = await asyncio.to_thread(run)
+
+    async def fetchall(self):
+        return self.rows
+
+
+class FakePinecone:
+    """Stand-in for the Pinecone client: every `Index(...)` is the same `FakePineconeIndex`."""
+
+    def __init__(self, index: FakePineconeIndex):
+        self.index = index
+
+    def Index(self, name: str = None, **kwargs) -> FakePineconeIndex:
+        return self.index
+
+
+def install(workdir: str, embed_latency: float = 0.0, llm_latency: float = 0.0,
+            token_latency: float = 0.0, index_latency: float = 0.0, db_latency: float = 0.0) -> Dict[str, Any]:
+    """
+    Point the app at local stand-ins for Gemini, Pinecone, MySQL and YouTube transcripts.
+
+    Caches, indexes, the ingestion manifest and uploads are kept under `workdir`, and chat history goes to a SQLite file
+    there, which the async query path reads through `FakeAsyncPool`. Must be called before
+    the `helper` modules are imported, since they read their settings at import time.
+
+    Returns:
+        dict: The installed stand-ins, by registry name.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    settings = {"GOOGLE_API_KEY": "benchmark", "PINECONE_API_KEY": "benchmark", "DB_HOST": "benchmark",
+                "VECTOR_BACKEND": "pinecone",
+                "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embeddings.sqlite3"),
+                "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index.pkl"),
+                "TRANSCRIPT_CACHE_PATH": os.path.join(workdir, "transcripts.sqlite3"),
+                "MANIFEST_PATH": os.path.join(workdir, "manifest.json"),
+                "ANSWER_CACHE_STAMP_PATH": os.path.join(workdir, "answer_cache.stamp"),
+                "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+                "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index")}
+    os.environ.update(settings)
+
+    from helper.Clients import registry
+    from helper.MySQL_DB import ChatHistoryStore, ChatHistoryWriter, AsyncChatHistoryStore
+    os.environ.update(settings)  # the helpers load .env with override=True
+
+    database = os.path.join(workdir, "chat_history.sqlite3")
+    store = ChatHistoryStore(lambda: sqlite3.connect(database, check_same_thread=False), dialect="sqlite")
+    store.create_table()
+
+    index = FakePineconeIndex(latency=index_latency)
+    # PineconeVectorStore opens its own async client for async searches
+    import langchain_pinecone.vectorstores
+    langchain_pinecone.vectorstores.PineconeAsyncioClient = lambda **kwargs: FakePineconeAsyncio(index, **kwargs)
+
+    async def create_pool():
+        return FakeAsyncPool(database, latency=db_latency)
+
+    fakes = {"embedding_model": HashingEmbeddings(latency=embed_latency),
+             "pinecone_client": FakePinecone(index),
+             "llm": FakeChatModel(latency=llm_latency, token_latency=token_latency),
+             "chat_history_writer": ChatHistoryWriter(store),
+             "async_chat_history_store": AsyncChatHistoryStore(create_pool, dialect="sqlite"),
+             "transcript_source": FakeTranscriptSource(latency=index_latency)}
+    for name, value in fakes.items():
+        registry.override(name, value)
+    return fakes
@@ -0,0 +1,300 @@
+"""
+Offline benchmarks for ingestion throughput and query latency.
+
+Gemini (embeddings and chat), Pinecone and MySQL are replaced by deterministic local
+stand-ins (see `benchmarks/Fakes.py`) with configurable latencies, so runs are
+repeatable and need no credentials. The stages drive the real code paths:
+
+- load:   `load_data` over a synthetic PDF/DOCX/TXT corpus (docs/s, chunks/s)
+- ingest: `add_documents_to_pinecone(stream_data(...))` (docs/s, chunks/s)
+- query:  concurrent `get_response` calls (p50/p95/p99 latency)
+- api:    the FastAPI app in `backend.py`: `/add_data` jobs, `/get_response`, time to
+          first token of `/get_response/stream`, and bursts of identical (coalesced) and
+          distinct (micro-batched query embeddings) concurrent questions
+
+Usage (from the repository root):
+    python -m benchmarks.Run_benchmarks --output report.json
+    python -m benchmarks.Run_benchmarks --baseline baseline.json --tolerance 0.2
+
+With `--baseline`, metrics worse than the baseline by more than `--tolerance` are
+reported and the exit code is 1. Save a report of a known-good version as the baseline.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from benchmarks import Fakes
+from benchmarks.Corpus import generate_corpus, generate_queries
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of `values` (q in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(q / 100 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies: List[float], errors: int = 0) -> Dict[str, float]:
+    return {"requests": len(latencies) + errors, "errors": errors,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0}
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process and its (parse pool) children, in MB."""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / scale, 1)
+
+
+def run_concurrently(work: Callable, items: List, concurrency: int):
+    """Run `work(item)` for every item on `concurrency` threads; return (latencies, errors, seconds)."""
+    def timed(item):
+        start = time.perf_counter()
+        try:
+            work(item)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return None, e
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, items))
+    seconds = time.perf_counter() - started
+
+    errors = [error for _, error in results if error is not None]
+    if errors:
+        print(f"⚠️ {len(errors)} requests failed, first error: {errors[0]}")
+    return [latency for latency, _ in results if latency is not None], len(errors), seconds
+
+
+def bench_load(paths: List[str]) -> dict:
+    from helper.Load_data import load_data
+
+    start = time.perf_counter()
+    chunks = load_data(file_paths=paths)
+    seconds = time.perf_counter() - start
+    return {"docs": len(paths), "chunks": len(chunks), "seconds": round(seconds, 3),
+            "docs_per_sec": round(len(paths) / seconds, 2), "chunks_per_sec": round(len(chunks) / seconds, 1)}
+
+
+def bench_ingest(paths: List[str], parse_workers: int) -> dict:
+    from helper.Load_data import stream_data
+    from helper.Vector_db import add_documents_to_pinecone
+
+    start = time.perf_counter()
+    report = add_documents_to_pinecone(stream_data(file_paths=paths, parse_workers=parse_workers))
+    seconds = time.perf_counter() - start
+    return {"docs": len(paths), "chunks": report.chunks, "retries": report.retries, "seconds": round(seconds, 3),
+            "docs_per_sec": round(len(paths) / seconds, 2), "chunks_per_sec": round(report.chunks / seconds, 1)}
+
+
+def _user(number: int, users: int):
+    return f"benchmark-user-{number % users}" if users else None
+
+
+def bench_queries(queries: List[str], concurrency: int, users: int) -> dict:
+    from helper.Full_chain import get_response
+
+    latencies, errors, seconds = run_concurrently(
+        lambda item: get_response(item[1], user_id=_user(item[0], users)), list(enumerate(queries)), concurrency)
+    summary = latency_summary(latencies, errors)
+    summary["requests_per_sec"] = round(len(latencies) / seconds, 2)
+    return summary
+
+
+def bench_api(paths: List[str], queries: List[str], concurrency: int, users: int) -> dict:
+    from fastapi.testclient import TestClient
+    from backend import app
+
+    results = {}
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        job_ids = []
+        for path in paths:
+            while True:
+                with open(path, "rb") as upload:
+                    response = client.post("/add_data", data={"case": "Document"},
+                                           files={"files_data": (os.path.basename(path), upload)})
+                if response.status_code != 429:
+                    break
+                time.sleep(0.05)  # queue full: back off like a client would
+            job_ids.append(response.json()["job_id"])
+
+        chunks, failed = 0, 0
+        for job_id in job_ids:
+            while True:
+                job = client.get(f"/add_data/{job_id}").json()
+                if job["state"] in ("succeeded", "failed"):
+                    break
+                time.sleep(0.02)
+            if job["state"] == "failed":
+                failed += 1
+            chunks += (job.get("result") or {}).get("chunks", 0)
+        seconds = time.perf_counter() - start
+        results["ingest"] = {"docs": len(paths), "chunks": chunks, "failed_jobs": failed, "seconds": round(seconds, 3),
+                             "docs_per_sec": round(len(paths) / seconds, 2),
+                             "chunks_per_sec": round(chunks / seconds, 1)}
+
+        def query(item):
+            number, user_query = item
+            data = {"user_query": user_query}
+            if users:
+                data["user_id"] = _user(number, users)
+            response = client.post("/get_response", data=data)
+            response.raise_for_status()
+
+        latencies, errors, seconds = run_concurrently(query, list(enumerate(queries)), concurrency)
+        results["query"] = latency_summary(latencies, errors)
+        results["query"]["requests_per_sec"] = round(len(latencies) / seconds, 2)
+
+        def first_token(item):
+            number, user_query = item
+            start = time.perf_counter()
+            with client.stream("POST", "/get_response/stream",
+                               data={"user_query": f"{user_query} (stream)"}) as response:
+                for line in response.iter_lines():
+                    if line.startswith("event: token"):
+                        first_tokens.append(time.perf_counter() - start)
+                        break
+
+        first_tokens = []
+        _, errors, _ = run_concurrently(first_token, list(enumerate(queries)), concurrency)
+        results["stream_first_token"] = latency_summary(first_tokens, errors)
+        results.update(bench_bursts(client, queries, concurrency))
+    return results
+
+
+def bench_bursts(client, queries: List[str], concurrency: int) -> dict:
+    """
+    Send bursts of `4 * concurrency` simultaneous new questions through the API: all
+    identical (coalesced onto one answer) and all distinct (query embeddings micro-batched).
+    """
+    from helper.Coalescing import response_flight
+    from helper.Embedding_cache import get_cached_embedding_model
+
+    batcher = get_cached_embedding_model().query_batcher
+    size = 4 * concurrency
+
+    def ask(user_query):
+        client.post("/get_response", data={"user_query": user_query}).raise_for_status()
+
+    results = {}
+    for stage, burst in (("burst_identical", [f"{queries[0]} (burst)"] * size),
+                         ("burst_distinct", [f"{query} (burst {number})" for number, query in
+                                             enumerate((queries * size)[:size])])):
+        flight, embedding = response_flight.stats(), batcher.stats()
+        latencies, errors, seconds = run_concurrently(ask, burst, size)
+        results[stage] = latency_summary(latencies, errors)
+        results[stage]["requests_per_sec"] = round(len(latencies) / seconds, 2)
+        results[stage]["executions"] = response_flight.stats()["executions"] - flight["executions"]
+        calls, embedded = batcher.stats()["calls"] - embedding["calls"], batcher.stats()["queries"] - embedding["queries"]
+        results[stage]["query_embedding_calls"] = calls
+        results[stage]["mean_embedding_batch"] = round(embedded / calls, 2) if calls else 0.0
+    return results
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    try:
+        os.environ["PARSE_WORKERS"] = str(args.parse_workers)  # read by `load_data` at import
+        fakes = Fakes.install(workdir, embed_latency=args.embed_latency, llm_latency=args.llm_latency,
+                              token_latency=args.token_latency, index_latency=args.index_latency)
+        paths = generate_corpus(os.path.join(workdir, "corpus"), args.docs, args.pages, seed=args.seed)
+        api_paths = generate_corpus(os.path.join(workdir, "api_corpus"), max(1, args.docs // 3), args.pages,
+                                    seed=args.seed + 1)
+        queries = generate_queries(args.queries, seed=args.seed)
+
+        results = {}
+        print("⏱️ load");   results["load"] = bench_load(paths)
+        print("⏱️ ingest"); results["ingest"] = bench_ingest(paths, args.parse_workers)
+        print("⏱️ query");  results["query"] = bench_queries(queries, args.concurrency, args.users)
+        if not args.skip_api:
+            print("⏱️ api")
+            for stage, summary in bench_api(api_paths, generate_queries(args.queries, seed=args.seed + 1),
+                                            args.concurrency, args.users).items():
+                results[f"api_{stage}"] = summary
+
+        from helper.Answer_cache import answer_cache
+        results["process"] = {"peak_rss_mb": peak_rss_mb()}
+        return {"meta": {"python": platform.python_version(), "platform": platform.platform(),
+                         "cpus": os.cpu_count(), "args": vars(args),
+                         "vectors": fakes["pinecone_client"].index.count(),
+                         "answer_cache": answer_cache.stats()},
+                "results": results}
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Return the metrics that regressed by more than `tolerance` (a fraction) against `baseline`.
+
+    `*_per_sec` metrics regress when they drop; latency (`*_ms`) and memory (`*_mb`) when they grow.
+    """
+    regressions = []
+    for stage, metrics in report["results"].items():
+        for name, value in metrics.items():
+            reference = baseline.get("results", {}).get(stage, {}).get(name)
+            if not reference or not isinstance(value, (int, float)):
+                continue
+            if name.endswith("_per_sec") and value < reference * (1 - tolerance):
+                regressions.append(f"{stage}.{name}: {value} < {reference} (baseline)")
+            elif name.endswith(("_ms", "_mb")) and value > reference * (1 + tolerance):
+                regressions.append(f"{stage}.{name}: {value} > {reference} (baseline)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingestion and query benchmarks.")
+    parser.add_argument("--docs", type=int, default=30, help="Synthetic documents to ingest.")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per document.")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per query stage.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent queries.")
+    parser.add_argument("--users", type=int, default=20, help="Distinct user IDs (0: anonymous, no history).")
+    parser.add_argument("--parse-workers", type=int, default=0, help="PARSE_WORKERS for loading.")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding call.")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds before the first LLM token.")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Seconds between LLM tokens.")
+    parser.add_argument("--index-latency", type=float, default=0.02, help="Seconds per vector index call.")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--skip-api", action="store_true", help="Skip the FastAPI stages.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory.")
+    parser.add_argument("--output", help="Write the JSON report here (use it as a future --baseline).")
+    parser.add_argument("--baseline", help="Compare with this JSON report and exit 1 on regressions.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression, as a fraction.")
+    args = parser.parse_args()
+
+    report = run(args)
+    print(json.dumps(report["results"], indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
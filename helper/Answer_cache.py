@@ -0,0 +1,338 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+import numpy as np
+from helper.Lexical_index import tokenize
+from helper.Tenants import active_tenants, tenant_path
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() == "true"
+# Rewritten on every invalidation, so all worker processes drop their answers when the corpus changes
+ANSWER_CACHE_STAMP_PATH = os.getenv("ANSWER_CACHE_STAMP_PATH", os.path.join(".cache", "answer_cache.stamp"))
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for exact matching: case, surrounding punctuation and whitespace are ignored.
+    """
+    query = re.sub(r"\s+", " ", query.lower()).strip()
+    return query.strip("?!.,;:،؟ ")
+
+
+def query_identifiers(query: str) -> FrozenSet[str]:
+    """
+    Return the tokens of a query that contain digits: order numbers, SKUs, dates, prices.
+
+    Queries differing only in such a token ("status of order 12345" / "... 67890") embed
+    almost identically, so a semantic hit requires them to be exactly the same.
+    """
+    return frozenset(token for token in tokenize(query) if any(char.isdigit() for char in token))
+
+
+class _Entry:
+    __slots__ = ("value", "vector", "identifiers", "created_at", "seconds")
+
+    def __init__(self, value, vector, identifiers, seconds):
+        self.value = value
+        self.vector = vector
+        self.identifiers = identifiers
+        self.created_at = time.time()
+        self.seconds = seconds
+
+
+class AnswerCache:
+    """
+    Two-tier cache of chatbot answers.
+
+    - Exact tier: keyed by the normalized query.
+    - Semantic tier: the query embedding is compared (cosine) with the embeddings of the
+      cached queries with the same identifiers (see `query_identifiers`); the closest one
+      is a hit if its similarity is >= `similarity_threshold`.
+
+    Entries expire after `ttl` seconds and the least recently used ones are evicted beyond
+    `max_entries`. `invalidate()` drops everything; it is called whenever the corpus changes.
+    It also bumps `generation`: an answer computed from the old corpus (its lookup started
+    before the invalidation) is not stored.
+
+    With a `stamp_path`, `invalidate()` also rewrites that file, and every lookup checks
+    it (one `stat`), so an ingestion run by any worker process invalidates the answers
+    cached by all of them.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl: float = ANSWER_CACHE_TTL,
+                 similarity_threshold: float = ANSWER_CACHE_SIMILARITY, stamp_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.stamp_path = stamp_path
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._groups: Dict[FrozenSet[str], Tuple[np.ndarray, List[str]]] = {}
+        self._dirty = True
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.invalidations = 0
+        self.generation = 0
+        self.stale_stores = 0
+        self._stamp = self._read_stamp()
+
+    def _read_stamp(self):
+        if not self.stamp_path:
+            return None
+        try:
+            stat = os.stat(self.stamp_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _clear(self):
+        self._entries.clear()
+        self._dirty = True
+        self.invalidations += 1
+        self.generation += 1
+
+    def _sync(self):
+        """Drop the entries if another process invalidated the cache (call with the lock held)."""
+        stamp = self._read_stamp()
+        if stamp != self._stamp:
+            self._stamp = stamp
+            self._clear()
+
+    def sync(self) -> int:
+        """
+        Pick up invalidations made by other processes; returns the current `generation`.
+        """
+        with self._lock:
+            self._sync()
+            return self.generation
+
+    def _expired(self, entry: _Entry) -> bool:
+        return time.time() - entry.created_at > self.ttl
+
+    def _closest(self, vector: np.ndarray, identifiers: FrozenSet[str]) -> Optional[str]:
+        if self._dirty:
+            keys = {}
+            for key, entry in self._entries.items():
+                if entry.vector is not None:
+                    keys.setdefault(entry.identifiers, []).append(key)
+            self._groups = {group: (np.stack([self._entries[key].vector for key in group_keys]), group_keys)
+                            for group, group_keys in keys.items()}
+            self._dirty = False
+        group = self._groups.get(identifiers)
+        if group is None:
+            return None
+
+        matrix, keys = group
+        similarities = matrix @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    def lookup(self, key: str, vector: Optional[np.ndarray] = None, record_miss: bool = True):
+        """
+        Return the cached value for `key` (exact tier) or for the closest cached query
+        embedding (semantic tier), or None.
+
+        Args:
+            key (str): The normalized query (see `normalize_query`).
+            vector (np.ndarray, optional): The unit-normalized query embedding.
+            record_miss (bool): Count a miss in the stats; False for a first, exact-only probe.
+
+        Returns:
+            tuple: (value, tier) with tier "exact" or "semantic", or None on a miss.
+        """
+        with self._lock:
+            self._sync()
+            tier, entry = "exact", self._entries.get(key)
+            if entry is None and vector is not None:
+                tier, closest = "semantic", self._closest(vector, query_identifiers(key))
+                entry = self._entries.get(closest) if closest else None
+                key = closest
+
+            if entry is not None and self._expired(entry):
+                del self._entries[key]
+                self._dirty = True
+                entry = None
+
+            if entry is None:
+                if record_miss:
+                    self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if tier == "exact":
+                self.hits_exact += 1
+            else:
+                self.hits_semantic += 1
+            self.saved_seconds += entry.seconds
+            return entry.value, tier
+
+    def store(self, key: str, value, seconds: float, vector: Optional[np.ndarray] = None,
+              generation: Optional[int] = None):
+        """
+        Cache `value` under `key`; `seconds` is what computing it cost (reported as saved on hits).
+
+        Pass the `generation` read when the lookup started: if the cache was invalidated
+        since, the value is dropped.
+        """
+        identifiers = query_identifiers(key) if vector is not None else None
+        with self._lock:
+            self._sync()
+            if generation is not None and generation != self.generation:
+                self.stale_stores += 1
+                return
+            self._entries[key] = _Entry(value, vector, identifiers, seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def invalidate(self):
+        """
+        Drop every cached answer, e.g. after documents were added to the index, in this
+        process and (through `stamp_path`) in the others.
+        """
+        with self._lock:
+            self._clear()
+            if not self.stamp_path:
+                return
+            if os.path.dirname(self.stamp_path):
+                os.makedirs(os.path.dirname(self.stamp_path), exist_ok=True)
+            temp_path = f"{self.stamp_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as stamp_file:
+                stamp_file.write(str(time.time_ns()))
+            os.replace(temp_path, self.stamp_path)  # a new inode, so the change is seen even within one mtime tick
+            self._stamp = self._read_stamp()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits_exact + self.hits_semantic + self.misses
+            return {"entries": len(self._entries), "hits_exact": self.hits_exact,
+                    "hits_semantic": self.hits_semantic, "misses": self.misses,
+                    "hit_rate": round((self.hits_exact + self.hits_semantic) / lookups, 4) if lookups else 0.0,
+                    "saved_seconds": round(self.saved_seconds, 3), "invalidations": self.invalidations,
+                    "stale_stores": self.stale_stores}
+
+
+answer_cache = AnswerCache(stamp_path=ANSWER_CACHE_STAMP_PATH)
+_tenant_caches: Dict[str, AnswerCache] = {}
+_tenant_caches_lock = threading.Lock()
+
+
+def get_answer_cache(tenant: Optional[str] = None) -> AnswerCache:
+    """
+    Return the answer cache of a tenant (see `Tenants.py`): `answer_cache` for the default one.
+
+    Each tenant has its own cache, so answers never cross tenants and ingesting into one
+    tenant only invalidates its own answers.
+    """
+    if not tenant:
+        return answer_cache
+    with _tenant_caches_lock:
+        cache = _tenant_caches.get(tenant)
+        if cache is None:
+            cache = _tenant_caches[tenant] = AnswerCache(stamp_path=tenant_path(ANSWER_CACHE_STAMP_PATH, tenant))
+        return cache
+
+
+def _evict_tenant(tenant: str):
+    with _tenant_caches_lock:
+        _tenant_caches.pop(tenant, None)
+
+
+active_tenants.on_evict(_evict_tenant)
+
+
+def answer_cache_stats() -> dict:
+    """
+    Stats of the default tenant's cache, with those of the other tenants under `tenants`.
+    """
+    with _tenant_caches_lock:
+        caches = dict(_tenant_caches)
+    return {**answer_cache.stats(), "tenants": {tenant: cache.stats() for tenant, cache in caches.items()}}
+
+
+def lookup_answer(query: str, embed_query: Optional[Callable[[str], List[float]]] = None,
+                  cache: AnswerCache = answer_cache):
+    """
+    Look `query` up in the exact tier, then (if `embed_query` is given) in the semantic tier.
+
+    Returns:
+        tuple: (hit, key, vector, generation) where hit is (answer, tier) or None; pass key,
+            vector and generation to `cache.store` after computing the answer on a miss.
+    """
+    generation = cache.sync()
+    key = normalize_query(query)
+    vector = None
+    hit = cache.lookup(key, record_miss=embed_query is None)
+    if hit is None and embed_query is not None:
+        vector = np.asarray(embed_query(query), dtype=np.float32)
+        vector /= (np.linalg.norm(vector) or 1.0)
+        hit = cache.lookup(key, vector)
+    return hit, key, vector, generation
+
+
+async def alookup_answer(query: str, aembed_query: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                         cache: AnswerCache = answer_cache):
+    """
+    Async `lookup_answer`: the query is embedded with `aembed_query` on an exact-tier miss.
+    """
+    generation = cache.sync()
+    key = normalize_query(query)
+    vector = None
+    hit = cache.lookup(key, record_miss=aembed_query is None)
+    if hit is None and aembed_query is not None:
+        vector = np.asarray(await aembed_query(query), dtype=np.float32)
+        vector /= (np.linalg.norm(vector) or 1.0)
+        hit = cache.lookup(key, vector)
+    return hit, key, vector, generation
+
+
+async def acached_answer(query: str, compute: Callable[[], Awaitable[dict]],
+                         aembed_query: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                         cache: AnswerCache = answer_cache) -> Tuple[dict, Optional[str]]:
+    """
+    Async `cached_answer`: return the cached answer to `query`, or await `compute()` and cache it.
+    """
+    hit, key, vector, generation = await alookup_answer(query, aembed_query, cache)
+    if hit is not None:
+        return hit
+
+    start = time.perf_counter()
+    value = await compute()
+    cache.store(key, value, time.perf_counter() - start, vector, generation)
+    return value, None
+
+
+def cached_answer(query: str, compute: Callable[[], dict],
+                  embed_query: Optional[Callable[[str], List[float]]] = None,
+                  cache: AnswerCache = answer_cache) -> Tuple[dict, Optional[str]]:
+    """
+    Return the cached answer to `query`, or compute and cache it.
+
+    Args:
+        query (str): The user's query.
+        compute (Callable[[], dict]): Produces the answer on a miss.
+        embed_query (Callable[[str], List[float]], optional): Embeds the query for the semantic
+            tier; the semantic tier is skipped when it is not given.
+        cache (AnswerCache): The cache to use.
+
+    Returns:
+        tuple: (answer, tier) where tier is "exact", "semantic" or None on a miss.
+    """
+    hit, key, vector, generation = lookup_answer(query, embed_query, cache)
+    if hit is not None:
+        return hit
+
+    start = time.perf_counter()
+    value = compute()
+    cache.store(key, value, time.perf_counter() - start, vector, generation)
+    return value, None
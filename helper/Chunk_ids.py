@@ -0,0 +1,18 @@
+import hashlib
+
+
+def content_hash(text: str) -> str:
+    """
+    Return the SHA-256 hex digest of a chunk's text.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def vector_id(text: str) -> str:
+    """
+    Return the deterministic vector ID of a chunk.
+
+    Identical chunks always map to the same ID, so re-ingesting them overwrites the
+    existing vector instead of inserting a duplicate.
+    """
+    return content_hash(text)
@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from helper.Tenants import active_tenants, tenant_key
+
+_ = load_dotenv(override=True)
+
+INDEX_NAME = "rag-customer-support"
+EMBEDDING_MODEL = "models/embedding-001"
+
+
+class Registry:
+    """
+    Process-wide registry of long-lived clients (embeddings, vector stores, LLMs, chains).
+
+    Every entry is built once by its factory and then shared by all requests and threads.
+    An entry is rebuilt when the config it was built with changes (e.g. a rotated API key),
+    so callers always pass the current config and never have to invalidate by hand.
+
+    Each reuse records the construction time it avoided, see `stats()`.
+
+    `override(name, value)` pins an entry to a given object whatever the config, which
+    is how benchmarks swap in local stand-ins for Gemini, Pinecone and MySQL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._entries = {}  # name -> (config, value, build_seconds)
+        self._overrides = {}
+        self._stats = {}
+
+    def _build_lock(self, name):
+        with self._lock:
+            return self._build_locks.setdefault(name, threading.Lock())
+
+    def _record(self, name, key, seconds):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"builds": 0, "reuses": 0,
+                                                  "last_build_seconds": 0.0,
+                                                  "saved_seconds": 0.0})
+            if key == "build":
+                stats["builds"] += 1
+                stats["last_build_seconds"] = seconds
+            else:
+                stats["reuses"] += 1
+                stats["saved_seconds"] += seconds
+
+    def get(self, name, factory, config=()):
+        """
+        Return the entry `name`, building it with `factory()` on first use or when `config` changed.
+
+        Args:
+            name (str): The registry key.
+            factory (callable): Builds the entry; only called once per config.
+            config (tuple): Hashable settings the entry depends on.
+
+        Returns:
+            The shared entry.
+        """
+        if name in self._overrides:
+            return self._overrides[name]
+
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == config:
+            self._record(name, "reuse", entry[2])
+            return entry[1]
+
+        with self._build_lock(name):
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] == config:
+                self._record(name, "reuse", entry[2])
+                return entry[1]
+
+            start = time.perf_counter()
+            value = factory()
+            elapsed = time.perf_counter() - start
+            self._entries[name] = (config, value, elapsed)
+            self._record(name, "build", elapsed)
+            if entry is not None:
+                print(f"🔄 Config changed, rebuilt '{name}' in {elapsed:.3f}s")
+            return value
+
+    def override(self, name, value):
+        """
+        Return `value` for `name` from now on, whatever the config; `value=None` removes the override.
+        """
+        with self._lock:
+            if value is None:
+                self._overrides.pop(name, None)
+            else:
+                self._overrides[name] = value
+
+    def peek(self, name):
+        """Return the entry `name` if it was built (or overridden), without building it."""
+        if name in self._overrides:
+            return self._overrides[name]
+        entry = self._entries.get(name)
+        return entry[1] if entry is not None else None
+
+    def clear(self, name=None):
+        """Drop one entry (or all of them) so the next `get` rebuilds it."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def clear_prefix(self, prefix):
+        """Drop the entries whose name starts with `prefix`, with their build locks and stats."""
+        with self._lock:
+            for table in (self._entries, self._build_locks, self._stats):
+                for name in [name for name in table if name.startswith(prefix)]:
+                    del table[name]
+
+    def stats(self):
+        """
+        Return build/reuse counters per entry.
+
+        `saved_seconds` is the construction time avoided by reusing the entry instead of
+        building it on every request.
+        """
+        with self._lock:
+            return {name: dict(values) for name, values in self._stats.items()}
+
+
+registry = Registry()
+active_tenants.on_evict(lambda tenant: registry.clear_prefix(tenant_key("", tenant)))
+
+
+def vector_backend() -> str:
+    """
+    The configured vector store: "pinecone" (default) or "local" (see `Local_vector_store`).
+    """
+    return os.getenv("VECTOR_BACKEND", "pinecone").lower()
+
+
+def get_embedding_model():
+    """Return the shared Gemini embedding client."""
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings  # heavy, imported on first use
+
+    return registry.get("embedding_model",
+                        lambda: GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=api_key),
+                        config=(EMBEDDING_MODEL, api_key))
+
+
+def get_pinecone_client():
+    """Return the shared Pinecone client."""
+    api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        raise ValueError("PINECONE_API_KEY environment variable is not set.")
+    from pinecone import Pinecone  # heavy, imported on first use
+
+    return registry.get("pinecone_client", lambda: Pinecone(api_key=api_key), config=(api_key,))
@@ -0,0 +1,263 @@
+import os
+import asyncio
+import inspect
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+from helper.Metrics import metrics
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() == "true"
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one execution.
+
+    The first caller of `do(key, compute)` runs `compute`; callers arriving with the same
+    key while it runs wait for it and receive the same result (or exception) instead of
+    computing it again. Once it finishes the key is forgotten, so later calls compute
+    afresh (results are cached elsewhere, e.g. in the answer cache).
+
+    `ado` does the same for coroutines on the event loop; sync and async callers are
+    coalesced separately. The coroutine runs in a task of its own rather than in the
+    first caller, so cancelling any caller (e.g. a client disconnecting) leaves the
+    others waiting on it; it is only cancelled once every caller has been.
+    """
+
+    def __init__(self, name: str, enabled: bool = SINGLE_FLIGHT):
+        self.name = name
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._async_in_flight: Dict[Hashable, _Flight] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, compute: Callable[[], object]) -> Tuple[object, bool]:
+        """
+        Return (result, shared): shared is True when the result came from another caller's execution.
+        """
+        if not self.enabled:
+            return compute(), False
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            metrics.inc("rag_coalesced_requests_total", kind=self.name)
+            return future.result(), True
+
+        try:
+            result = compute()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    async def ado(self, key: Hashable, compute: Callable[[], Awaitable[object]]) -> Tuple[object, bool]:
+        """
+        Async `do`: await (result, shared), running `compute()` only for the first caller of `key`.
+        """
+        if not self.enabled:
+            return await compute(), False
+        flight = self._async_in_flight.get(key)
+        shared = flight is not None
+        if shared:
+            with self._lock:
+                self.coalesced += 1
+            metrics.inc("rag_coalesced_requests_total", kind=self.name)
+        else:
+            flight = self._async_in_flight[key] = _Flight(asyncio.get_running_loop().create_task(compute()))
+            flight.task.add_done_callback(lambda task: self._land(key, flight))
+            with self._lock:
+                self.executions += 1
+
+        flight.waiters += 1
+        try:
+            # shield: a cancelled caller must not cancel the computation the others wait for
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                self._land(key, flight)
+                flight.task.cancel()  # nobody is waiting for the result any more
+
+    def _land(self, key: Hashable, flight: "_Flight"):
+        if self._async_in_flight.get(key) is flight:
+            del self._async_in_flight[key]
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()  # mark it retrieved when every caller was cancelled
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = self.executions + self.coalesced
+            return {"executions": self.executions, "coalesced": self.coalesced,
+                    "in_flight": len(self._in_flight) + len(self._async_in_flight),
+                    "coalesced_rate": round(self.coalesced / calls, 4) if calls else 0.0}
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _Batch:
+    __slots__ = ("texts", "futures", "full")
+
+    def __init__(self, full=None):
+        self.texts: List[str] = []
+        self.futures: List[Future] = []
+        self.full = full or threading.Event()
+
+
+class QueryEmbeddingBatcher:
+    """
+    Micro-batches concurrent `embed_query` calls into single embedding requests.
+
+    The first query opens a batch and waits up to `window_ms` for others (or until
+    `max_size` queries joined), then embeds them all in one `embed_documents` call with the
+    query task type, so the vectors are the same as with `embed_query`. Identical queries
+    in a batch are embedded once. A query arriving alone only pays the window.
+
+    `aembed_query` batches the queries of concurrent coroutines the same way, with
+    `aembed_documents`, without blocking the event loop. Each async batch runs in a task
+    of its own, so a cancelled caller only gives up its own query.
+
+    Models whose `embed_documents` takes no `task_type` (e.g. ones adding a query
+    instruction of their own) are not batched: queries go straight to `embed_query`.
+    """
+
+    def __init__(self, embeddings, window_ms: float = QUERY_BATCH_WINDOW_MS, max_size: int = QUERY_BATCH_MAX_SIZE,
+                 task_type: str = "RETRIEVAL_QUERY"):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000
+        self.max_size = max_size
+        self.task_type = task_type
+        try:
+            self.enabled = window_ms > 0 and max_size > 1 and \
+                "task_type" in inspect.signature(embeddings.embed_documents).parameters
+        except (TypeError, ValueError):
+            self.enabled = False
+        self._lock = threading.Lock()
+        self._open: Optional[_Batch] = None
+        self._async_open: Optional[_Batch] = None
+        self._async_batches = set()  # the event loop only keeps weak references to tasks
+        self.queries = 0
+        self.calls = 0
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        unique = list(dict.fromkeys(texts))
+        with metrics.span("embed_query_batch"):
+            vectors = dict(zip(unique, self.embeddings.embed_documents(unique, task_type=self.task_type)))
+        metrics.inc("rag_query_embedding_calls_total")
+        metrics.inc("rag_query_embeddings_total", len(texts))
+        return [vectors[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if not self.enabled:
+            return self.embeddings.embed_query(text)
+
+        future = Future()
+        with self._lock:
+            self.queries += 1
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+                self.calls += 1
+            batch.texts.append(text)
+            batch.futures.append(future)
+            if len(batch.texts) >= self.max_size:
+                self._open = None
+                batch.full.set()
+        if not leader:
+            return future.result()
+
+        batch.full.wait(self.window)
+        with self._lock:
+            if self._open is batch:
+                self._open = None
+        try:
+            vectors = self._embed(batch.texts)
+        except BaseException as e:
+            for waiting in batch.futures:
+                waiting.set_exception(e)
+            raise
+        for waiting, vector in zip(batch.futures, vectors):
+            waiting.set_result(vector)
+        return future.result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if not self.enabled:
+            return await self.embeddings.aembed_query(text)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._async_open
+        leader = batch is None
+        if leader:
+            batch = self._async_open = _Batch(asyncio.Event())
+            task = loop.create_task(self._aembed_batch(batch))
+            self._async_batches.add(task)
+            task.add_done_callback(self._async_batches.discard)
+        batch.texts.append(text)
+        batch.futures.append(future)
+        if len(batch.texts) >= self.max_size:
+            self._async_open = None
+            batch.full.set()
+        with self._lock:
+            self.queries += 1
+            self.calls += leader
+        return await future
+
+    async def _aembed_batch(self, batch: _Batch):
+        try:
+            try:
+                await asyncio.wait_for(batch.full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            if self._async_open is batch:
+                self._async_open = None
+            unique = list(dict.fromkeys(batch.texts))
+            with metrics.span("embed_query_batch"):
+                vectors = dict(zip(unique, await self.embeddings.aembed_documents(unique, task_type=self.task_type)))
+        except BaseException as e:
+            if self._async_open is batch:
+                self._async_open = None
+            # Callers that were cancelled already have a done future
+            for waiting in batch.futures:
+                if waiting.done():
+                    continue
+                if isinstance(e, Exception):
+                    waiting.set_exception(e)
+                else:
+                    waiting.cancel()  # the batch itself was cancelled (e.g. on shutdown)
+            if not isinstance(e, Exception):
+                raise
+            return
+        metrics.inc("rag_query_embedding_calls_total")
+        metrics.inc("rag_query_embeddings_total", len(batch.texts))
+        for waiting, text in zip(batch.futures, batch.texts):
+            if not waiting.done():
+                waiting.set_result(vectors[text])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "queries": self.queries, "calls": self.calls,
+                    "mean_batch_size": round(self.queries / self.calls, 2) if self.calls else 0.0}
+
+
+response_flight = SingleFlight("get_response")
@@ -0,0 +1,175 @@
+import os
+import re
+import math
+import threading
+from typing import List, Optional, Set, Tuple
+from langchain_core.documents import Document
+from helper.Metrics import metrics
+
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "4"))
+MIN_TRUNCATED_TOKENS = 100
+SHINGLE_SIZE = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of LLM tokens of a text (CHARS_PER_TOKEN characters per token).
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _position(document: Document) -> Optional[Tuple[tuple, int]]:
+    """
+    Return (page key, start offset) of a chunk in its page, or None if its position is unknown.
+    """
+    metadata = document.metadata or {}
+    source = metadata.get("source", metadata.get("url"))
+    if metadata.get("start_index") is None or source is None:
+        return None
+    return (source, metadata.get("page")), int(metadata["start_index"])
+
+
+def merge_adjacent(documents: List[Document]) -> List[Document]:
+    """
+    Merge chunks of the same page that overlap or touch into a single passage.
+
+    The splitter records where each chunk starts in its page (`start_index`); consecutive
+    chunks share `chunk_overlap` characters, which are kept only once. A merged passage
+    takes the rank of its best-ranked chunk and the metadata of its first chunk.
+    """
+    groups = {}
+    for rank, document in enumerate(documents):
+        position = _position(document)
+        key = position[0] if position else (None, rank)
+        groups.setdefault(key, []).append((position[1] if position else 0, rank, document))
+
+    passages = []
+    for chunks in groups.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        start, rank, document = chunks[0]
+        text = document.page_content
+        for next_start, next_rank, next_document in chunks[1:]:
+            content, offset = next_document.page_content, next_start - start
+            # Merge only when the shared characters really match, or the chunks are only
+            # separated by the whitespace the splitter stripped
+            if 0 <= offset <= len(text) and text[offset:offset + len(content)] == content[:len(text) - offset]:
+                text += content[len(text) - offset:]
+            elif len(text) < offset <= len(text) + 2:
+                text += " " * (offset - len(text)) + content
+            else:
+                passages.append((rank, Document(page_content=text, metadata=dict(document.metadata))))
+                start, rank, document, text = next_start, next_rank, next_document, content
+                continue
+            rank = min(rank, next_rank)
+        passages.append((rank, Document(page_content=text, metadata=dict(document.metadata))))
+    return [document for _, document in sorted(passages, key=lambda passage: passage[0])]
+
+
+def _shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {hash(" ".join(words))} if words else set()
+    return {hash(" ".join(words[position:position + size])) for position in range(len(words) - size + 1)}
+
+
+def remove_near_duplicates(documents: List[Document], threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[Document]:
+    """
+    Drop passages whose word 5-grams are mostly (>= `threshold`) contained in a better-ranked passage.
+
+    Containment rather than Jaccard similarity also catches a short chunk repeated
+    inside a longer one, e.g. the same paragraph in two versions of a document.
+    """
+    kept, kept_shingles = [], []
+    for document in documents:
+        shingles = _shingles(document.page_content)
+        if shingles and any(len(shingles & other) / len(shingles) >= threshold for other in kept_shingles):
+            continue
+        kept.append(document)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def fit_to_budget(documents: List[Document], token_budget: int = CONTEXT_TOKEN_BUDGET) -> List[Document]:
+    """
+    Keep passages in rank order until `token_budget` is spent.
+
+    A passage that does not fit is cut at a word boundary when at least
+    MIN_TRUNCATED_TOKENS remain, otherwise skipped in favour of a shorter one further down.
+    """
+    packed, remaining = [], token_budget
+    for document in documents:
+        tokens = estimate_tokens(document.page_content)
+        if tokens <= remaining:
+            packed.append(document)
+            remaining -= tokens
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            text = document.page_content[:int(remaining * CHARS_PER_TOKEN)]
+            text = text[:text.rfind(" ")] if " " in text else text
+            packed.append(Document(page_content=text, metadata=dict(document.metadata)))
+            remaining -= estimate_tokens(text)
+    return packed
+
+
+class PackingStats:
+    """
+    Running totals of context packing, reported by `/stats`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def record(self, tokens_in: int, tokens_out: int, chunks_in: int = 0, passages_out: int = 0):
+        with self._lock:
+            self.queries += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+        metrics.inc("rag_context_tokens_total", tokens_in, stage="retrieved")
+        metrics.inc("rag_context_tokens_total", tokens_out, stage="packed")
+        metrics.inc("rag_context_passages_total", chunks_in, stage="retrieved")
+        metrics.inc("rag_context_passages_total", passages_out, stage="packed")
+
+    def stats(self) -> dict:
+        with self._lock:
+            saved = self.tokens_in - self.tokens_out
+            return {"queries": self.queries, "tokens_in": self.tokens_in, "tokens_out": self.tokens_out,
+                    "tokens_saved": saved,
+                    "tokens_saved_per_query": round(saved / self.queries, 1) if self.queries else 0.0,
+                    "saved_ratio": round(saved / self.tokens_in, 3) if self.tokens_in else 0.0}
+
+
+packing_stats = PackingStats()
+
+
+def pack_context(documents: List[Document], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 threshold: float = CONTEXT_DEDUP_THRESHOLD) -> List[Document]:
+    """
+    Assemble the retrieved chunks into the passages sent to the LLM.
+
+    Adjacent and overlapping chunks of the same page are merged, near-duplicate passages
+    are dropped, and the rest is packed into `token_budget` tokens, best-ranked first.
+    The tokens saved are recorded in `packing_stats`, `rag_context_tokens_total` and
+    `rag_context_passages_total` rather than logged, as this runs on every query.
+
+    Args:
+        documents (List[Document]): Retrieved chunks, best first.
+        token_budget (int): Maximum estimated tokens of context.
+        threshold (float): Containment above which a passage counts as a duplicate.
+
+    Returns:
+        List[Document]: The packed passages, best first.
+    """
+    if not documents:
+        return documents
+    with metrics.span("context_packing"):
+        tokens_in = sum(estimate_tokens(document.page_content) for document in documents)
+        packed = fit_to_budget(remove_near_duplicates(merge_adjacent(documents), threshold), token_budget)
+        tokens_out = sum(estimate_tokens(document.page_content) for document in packed)
+    packing_stats.record(tokens_in, tokens_out, len(documents), len(packed))
+    return packed
+
@@ -0,0 +1,199 @@
+import os
+import time
+import sqlite3
+import threading
+from array import array
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from helper.Clients import registry, get_embedding_model, EMBEDDING_MODEL
+from helper.Chunk_ids import content_hash, vector_id
+from helper.Metrics import metrics
+from helper.Coalescing import QueryEmbeddingBatcher
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(".cache", "embeddings.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Last query embedded in the current request (thread or task context): ((model, text), vector)
+_last_query: ContextVar[Optional[Tuple[Tuple[str, str], List[float]]]] = ContextVar("last_query_embedding", default=None)
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache stored in SQLite, keyed by model name + chunk content hash.
+
+    The cache holds at most `max_entries` vectors; when it grows past that, the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(model: str, digest: str) -> str:
+        return f"{model}:{digest}"
+
+    def get_many(self, model: str, digests: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up cached vectors.
+
+        Args:
+            model (str): The embedding model name.
+            digests (List[str]): Content hashes of the chunks.
+
+        Returns:
+            dict: content hash -> vector, only for the hashes found in the cache.
+        """
+        found = {}
+        if not digests:
+            return found
+
+        keys = [self._key(model, digest) for digest in set(digests)]
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+                for key, blob in rows:
+                    found[key[len(model) + 1:]] = array("f", blob).tolist()
+                self._conn.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({placeholders})", [now, *batch])
+            self._conn.commit()
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, List[float]]):
+        """
+        Store vectors and evict the least recently used entries beyond `max_entries`.
+
+        Args:
+            model (str): The embedding model name.
+            vectors (dict): content hash -> vector.
+        """
+        if not vectors:
+            return
+
+        now = time.time()
+        rows = [(self._key(model, digest), array("f", vector).tobytes(), now) for digest, vector in vectors.items()]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                self._conn.execute("""
+                    DELETE FROM embeddings WHERE key IN (
+                        SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+                    )
+                """, (count - self.max_entries,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that only sends chunks missing from the `EmbeddingCache` to the model.
+
+    Queries are not cached; concurrent ones are micro-batched into a single embedding
+    call by `query_batcher` (see `Coalescing.QueryEmbeddingBatcher`) when one is given.
+    The last query embedded is remembered for the rest of the request (a context
+    variable), so the retriever reuses the vector computed for the answer cache's
+    semantic lookup instead of embedding the same question again.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str = EMBEDDING_MODEL,
+                 query_batcher: QueryEmbeddingBatcher = None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+        self.query_batcher = query_batcher
+        self.hits = 0
+        self.misses = 0
+
+    @metrics.timed("embed_documents")
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        digests = [content_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, digests)
+
+        missing = {}
+        for digest, text in zip(digests, texts):
+            if digest not in vectors:
+                missing.setdefault(digest, text)
+
+        self.hits += len(texts) - sum(1 for digest in digests if digest in missing)
+        self.misses += len(missing)
+        metrics.inc("rag_embedding_cache_total", len(texts) - len(missing), result="hit")
+        metrics.inc("rag_embedding_cache_total", len(missing), result="miss")
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), new_vectors))
+            self.cache.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[digest] for digest in digests]
+
+    def _remembered(self, text: str) -> Optional[List[float]]:
+        last = _last_query.get()
+        if last is None or last[0] != (self.model, text):
+            return None
+        metrics.inc("rag_query_embedding_reused_total")
+        return list(last[1])
+
+    @metrics.timed("embed_query")
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._remembered(text)
+        if vector is not None:
+            return vector
+        if self.query_batcher is not None:
+            vector = self.query_batcher.embed_query(text)
+        else:
+            vector = self.embeddings.embed_query(text)
+        _last_query.set(((self.model, text), vector))
+        return vector
+
+    @metrics.timed("embed_query")
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._remembered(text)
+        if vector is not None:
+            return vector
+        if self.query_batcher is not None:
+            vector = await self.query_batcher.aembed_query(text)
+        else:
+            vector = await self.embeddings.aembed_query(text)
+        _last_query.set(((self.model, text), vector))
+        return vector
+
+
+def get_embedding_cache():
+    """Return the shared on-disk embedding cache."""
+    return registry.get("embedding_cache",
+                        lambda: EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES),
+                        config=(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES))
+
+
+def get_cached_embedding_model():
+    """Return the shared embedding client wrapped with the on-disk cache."""
+    embedding_model = get_embedding_model()
+    cache = get_embedding_cache()
+    return registry.get("cached_embedding_model",
+                        lambda: CachedEmbeddings(embedding_model, cache, EMBEDDING_MODEL,
+                                                 query_batcher=QueryEmbeddingBatcher(embedding_model)),
+                        config=(id(embedding_model), id(cache)))
@@ -1,41 +1,25 @@
 import os
+import time
+import asyncio
 from dotenv import load_dotenv
-from langchain_pinecone import PineconeVectorStore
-from langchain.chains import ConversationalRetrievalChain
-from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import (ChatGoogleGenerativeAI, 
-                                    GoogleGenerativeAIEmbeddings)
+from helper.Clients import registry, vector_backend, INDEX_NAME, EMBEDDING_MODEL
+from helper.MySQL_DB import save_chat_history, chat_history_enabled, get_recent_turns, aget_recent_turns
+from helper.Answer_cache import (get_answer_cache, cached_answer, lookup_answer, acached_answer, alookup_answer,
+                                 normalize_query, ANSWER_CACHE_SEMANTIC)
+from helper.Coalescing import response_flight
+from helper.Lexical_index import get_lexical_index
+from helper.Vector_db import get_vector_index
+from helper.Metrics import metrics, metrics_callbacks
+from helper.Context_packing import CONTEXT_PACKING
+from helper.Tenants import tenant_key, tenant_user
 
 
 _ = load_dotenv(override=True)
 
-def create_retriever_chain():    
-    """
-    Create a conversational retrieval chain with a Google Generative AI model.
-
-    This chain uses a Pinecone vector store as the retriever and a Google Generative AI model as the
-    language model. The chain is configured with a conversational retrieval template and returns the
-    source documents.
+LLM_MODEL = "gemini-2.0-flash-thinking-exp-01-21"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
 
-    Args:
-
-    Returns:
-        ConversationalRetrievalChain
-    """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY environment variable is not set.")
-    
-    
-    embedding_model = GoogleGenerativeAIEmbeddings(model="models/embedding-001", google_api_key=api_key)
-    vectorstore = PineconeVectorStore(embedding=embedding_model, index_name='rag-customer-support',
-                                      pinecone_api_key=os.getenv('PINECONE_API_KEY'))
-    
-    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 5, "fetch_k": 10}, alpha=0.5)
-    llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash-thinking-exp-01-21",
-                                 temperature=0.3, api_key=api_key)
-
-    template = """
+PROMPT_TEMPLATE = """
     You are an AI assistant specializing in customer support and sales for `Kindix`.  
     Your role is to provide accurate, engaging, and user-friendly information to assist customers  
     and promote `Kindix`'s services. Leverage the provided context to give  
@@ -66,44 +50,482 @@ def create_retriever_chain():
     - **Phone:** 050-444-6785 / 050-640-5322  
     ---
     """
-    prompt = PromptTemplate(
-        input_variables=["context", "question"], 
-        template=template
-    )
+
+
+def get_prompt():
+    """Return the shared prompt template."""
+    from langchain_core.prompts import PromptTemplate
+    return registry.get("prompt", lambda: PromptTemplate(input_variables=["context", "question"],
+                                                         template=PROMPT_TEMPLATE))
+
+
+def _config():
+    return (os.getenv("GOOGLE_API_KEY"), os.getenv("PINECONE_API_KEY"), vector_backend(),
+            INDEX_NAME, EMBEDDING_MODEL, LLM_MODEL, RETRIEVAL_MODE, CONTEXT_PACKING)
+
+
+def create_vectorstore():
+    """
+    Create the configured vector store: Pinecone, or the local memory-mapped index when VECTOR_BACKEND=local.
+    """
+    from helper.Embedding_cache import get_cached_embedding_model
+    embedding_model = get_cached_embedding_model()  # queries pass straight through, timed as `embed_query`
+    if vector_backend() == "local":
+        from helper.Local_vector_store import get_local_index
+        return get_local_index().store(embedding=embedding_model)
+    from langchain_pinecone import PineconeVectorStore
+    # Reuses the shared Pinecone client instead of opening a new one
+    return PineconeVectorStore(index=get_vector_index(), embedding=embedding_model)
+
+
+def get_vectorstore():
+    """Return the shared vector store."""
+    return registry.get("vectorstore", create_vectorstore, config=_config())
+
+
+def create_retriever(tenant=None):
+    """
+    Create an MMR retriever over the shared vector store (see `create_vectorstore`).
+
+    A tenant's retriever only searches the tenant's namespace (and lexical index), through
+    the same Pinecone client and async session, so its latency depends on its own corpus
+    size only.
+
+    With RETRIEVAL_MODE=hybrid (the default) its results are fused with BM25 lexical
+    search, so exact product codes and names are found even when embeddings miss them.
+
+    With CONTEXT_PACKING=true (the default) overlapping chunks are merged, near-duplicates
+    dropped and the context capped at CONTEXT_TOKEN_BUDGET tokens (see `Context_packing.py`);
+    both the chain and `stream_response` get the packed passages.
+    """
+    vectorstore = get_vectorstore()
+    search_kwargs = {"k": 5, "fetch_k": 10}
+    if tenant and vector_backend() == "local":
+        from helper.Local_vector_store import get_local_index
+        vectorstore = get_local_index().store(tenant, embedding=vectorstore.embeddings)
+    elif tenant:
+        search_kwargs["namespace"] = tenant
+    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs=search_kwargs, alpha=0.5)
+    if RETRIEVAL_MODE == "hybrid":
+        from helper.Hybrid_retriever import HybridRetriever
+        retriever = HybridRetriever(dense=retriever, lexical=get_lexical_index(tenant), k=5)
+    if CONTEXT_PACKING:
+        from helper.Packed_retriever import PackedRetriever
+        retriever = PackedRetriever(retriever=retriever)
+    return retriever
+
+
+def create_llm():
+    """
+    Create the Google Generative AI chat model.
+    """
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        raise ValueError("GOOGLE_API_KEY environment variable is not set.")
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model=LLM_MODEL,
+                                  temperature=0.3, api_key=api_key)
+
+
+def get_retriever(tenant=None):
+    """Return the shared retriever of a tenant."""
+    return registry.get(tenant_key("retriever", tenant), lambda: create_retriever(tenant), config=_config())
+
+
+def get_llm():
+    """Return the shared chat model."""
+    return registry.get("llm", create_llm, config=_config())
+
+
+@metrics.timed("chain_build")
+def create_retriever_chain(tenant=None):    
+    """
+    Create a conversational retrieval chain with a Google Generative AI model.
+
+    This chain uses a Pinecone vector store as the retriever and a Google Generative AI model as the
+    language model. The chain is configured with a conversational retrieval template and returns the
+    source documents.
+
+    Args:
+        tenant (str, optional): The tenant whose documents are retrieved; None for the default one.
+
+    Returns:
+        ConversationalRetrievalChain
+    """
+    from langchain.chains import ConversationalRetrievalChain
 
     return ConversationalRetrievalChain.from_llm(
-        llm=llm,
-        retriever=retriever,
+        llm=get_llm(),
+        retriever=get_retriever(tenant),
         return_source_documents=True,
-        combine_docs_chain_kwargs={"prompt": prompt, "document_variable_name": "context"},
+        combine_docs_chain_kwargs={"prompt": get_prompt(), "document_variable_name": "context"},
     )
-    
 
-def get_response(user_query, user_id=None):
+
+def get_retriever_chain(tenant=None):
+    """
+    Return the process-wide conversational retrieval chain of a tenant.
+
+    The chain (and the embedding, Pinecone and Gemini clients behind it) is built once by
+    `create_retriever_chain` and reused across requests and threads. It is rebuilt
+    automatically when the API keys or model names change. Tenants share the clients;
+    only their retriever differs.
+
+    Args:
+        tenant (str, optional): The tenant; None for the default one.
+
+    Returns:
+        ConversationalRetrievalChain
+    """
+    return registry.get(tenant_key("retriever_chain", tenant), lambda: create_retriever_chain(tenant),
+                        config=_config())
+
+
+def _video_url(source_documents):
+    """
+    Return the `url` metadata of the top source document, if any.
+    """
+    try:
+        if len(source_documents) > 0:
+            if source_documents[0].metadata: 
+                return source_documents[0].metadata["url"]
+        return None
+    except:
+        return None
+
+
+def warm_up():
+    """
+    Build the shared retrieval chain ahead of the first request.
+    """
+    _ = get_retriever_chain()
+    print("✅ Retrieval chain ready")
+
+
+def is_warm() -> bool:
+    """Whether the shared retrieval chain has been built."""
+    return registry.peek("retriever_chain") is not None
+
+
+_clients_opened = None  # task opening the async clients, on the serving loop
+
+
+async def _aopen_vectorstore():
+    try:
+        vectorstore = await asyncio.to_thread(get_vectorstore)
+        if hasattr(vectorstore, "__aenter__"):
+            await vectorstore.__aenter__()
+    except Exception as e:
+        print(f"⚠️ Could not open the async vector store session: {e}")
+
+
+async def aopen_clients():
+    """
+    Open the vector store's async HTTP session once, so async queries share its connections
+    instead of opening a session per search. A no-op for stores without one (local index).
+
+    Every async query awaits it first, so none races the opening; if it fails, searches
+    open a session each.
+    """
+    global _clients_opened
+    if _clients_opened is None:
+        _clients_opened = asyncio.ensure_future(_aopen_vectorstore())
+    await asyncio.shield(_clients_opened)
+
+
+async def aclose_clients():
+    """
+    Close the session opened by `aopen_clients`; called on shutdown, on the serving loop.
+    """
+    global _clients_opened
+    if _clients_opened is None:
+        return
+    await _clients_opened
+    _clients_opened = None
+    vectorstore = registry.peek("vectorstore")
+    if hasattr(vectorstore, "aclose"):
+        await vectorstore.aclose()
+
+
+async def _aget_retriever_chain(tenant=None):
+    """
+    Return the tenant's shared chain; a cold build runs in a worker thread, off the event loop.
+    """
+    if registry.peek(tenant_key("retriever_chain", tenant)) is not None:
+        return get_retriever_chain(tenant)
+    return await asyncio.to_thread(get_retriever_chain, tenant)
+
+
+def _embed_query():
+    """
+    Query embedder for the semantic tier of the answer cache, or None when it is disabled.
+    """
+    from helper.Embedding_cache import get_cached_embedding_model
+    return get_cached_embedding_model().embed_query if ANSWER_CACHE_SEMANTIC else None
+
+
+def _aembed_query():
+    """
+    Async `_embed_query`.
+    """
+    from helper.Embedding_cache import get_cached_embedding_model
+    return get_cached_embedding_model().aembed_query if ANSWER_CACHE_SEMANTIC else None
+
+
+def _is_anonymous(user_id):
+    return user_id in (None, "", "none", "None")
+
+
+def _scoped_user(user_id, tenant):
+    """
+    The ID a user's chat history is stored under: the same user ID in two tenants is two conversations.
+    """
+    return user_id if _is_anonymous(user_id) else tenant_user(user_id, tenant)
+
+
+def _chat_history(user_id):
+    """
+    Return the recent turns of a known user, or [] for anonymous users or when history is disabled.
+
+    Database errors propagate: answering a follow-up without its context would be wrong.
+    """
+    if not chat_history_enabled() or _is_anonymous(user_id):
+        return []
+    return get_recent_turns(user_id)
+
+
+async def _achat_history(user_id):
+    """
+    Async `_chat_history`.
+    """
+    if not chat_history_enabled() or _is_anonymous(user_id):
+        return []
+    return await aget_recent_turns(user_id)
+
+
+def _format_history(chat_history):
+    return "".join(f"\nHuman: {question}\nAssistant: {answer}" for question, answer in chat_history)
+
+
+def _standalone_question(user_query, chat_history, tenant=None):
+    """
+    Rephrase a follow-up question into a standalone one, like the chain does internally.
+    """
+    if not chat_history:
+        return user_query
+    result = get_retriever_chain(tenant).question_generator.invoke(
+        {"question": user_query, "chat_history": _format_history(chat_history)},
+        config={"callbacks": [metrics_callbacks]})
+    return result["text"]
+
+
+async def _astandalone_question(user_query, chat_history, tenant=None):
+    """
+    Async `_standalone_question`.
+    """
+    if not chat_history:
+        return user_query
+    result = await (await _aget_retriever_chain(tenant)).question_generator.ainvoke(
+        {"question": user_query, "chat_history": _format_history(chat_history)},
+        config={"callbacks": [metrics_callbacks]})
+    return result["text"]
+
+
+@metrics.timed("get_response")
+def get_response(user_query, user_id=None, tenant=None):
     """
     Get a response from the conversational retrieval chain based on the user's query.
 
-    Retrieves the chat history for the user, creates a conversational retrieval chain, and uses it to
+    Retrieves the chat history for the user, uses the shared conversational retrieval chain to
     generate a response. The response is then saved to the chat history.
 
+    The chat history is the user's last turns (see `MySQL_DB.get_recent_turns`). Answers
+    without history are served from the answer cache when the same (or a semantically
+    close) question was answered since the corpus last changed; follow-ups depend on the
+    conversation and are never cached.
+
+    Identical questions without history arriving while one is being answered wait for that
+    answer instead of running retrieval and the LLM again (`Coalescing.SingleFlight`).
+
+    With a tenant, only the tenant's namespace is searched, and its answers and chat
+    history are kept apart from the other tenants' (see `Tenants.py`).
+
     Args:
         user_query (str): The user's query.
         user_id (str): The ID of the user.
+        tenant (str, optional): The tenant (normalized, see `Tenants.normalize_tenant`); None for the default one.
 
     Returns:
         dict: A dictionary containing the response and other metadata.
     """
-    
-    retriever_chain = create_retriever_chain() # Get response
-    result = retriever_chain.invoke({"question": user_query, "chat_history": []})
-    try:    
-        if len(result["source_documents"]) > 0:
-            if result["source_documents"][0].metadata: 
-                url = result["source_documents"][0].metadata["url"]
-            else: url = None
-        else:
-            url = None
-    except:
-        url = None
-    result = {"answer": result['answer'], "video-url": url}
-    return result
\ No newline at end of file
+    user_id = _scoped_user(user_id, tenant)
+    chat_history = _chat_history(user_id)
+
+    def compute():
+        retriever_chain = get_retriever_chain(tenant) # Get response
+        result = retriever_chain.invoke({"question": user_query, "chat_history": chat_history},
+                                        config={"callbacks": [metrics_callbacks]})
+        return {"answer": result['answer'], "video-url": _video_url(result["source_documents"])}
+
+    if chat_history:
+        result = compute()
+    else:
+        (result, tier), shared = response_flight.do(
+            (tenant, normalize_query(user_query)),
+            lambda: cached_answer(user_query, compute, embed_query=_embed_query(), cache=get_answer_cache(tenant)))
+        metrics.inc("rag_answer_cache_lookups_total", tier="coalesced" if shared else tier or "miss")
+    if chat_history_enabled():
+        save_chat_history(user_query, result["answer"], user_id)
+    return dict(result)
+
+
+@metrics.timed("get_response")
+async def aget_response(user_query, user_id=None, tenant=None):
+    """
+    Async `get_response`, used by the API when ASYNC_QUERY_PATH is enabled.
+
+    History, embedding, vector search and generation are awaited with the async clients,
+    so one worker serves many conversations at once; the chat row is buffered for the
+    write-behind writer as in `get_response`. Answers are cached and identical questions
+    coalesced the same way.
+
+    Args:
+        user_query (str): The user's query.
+        user_id (str): The ID of the user.
+        tenant (str, optional): The tenant; None for the default one.
+
+    Returns:
+        dict: A dictionary containing the response and other metadata.
+    """
+    await aopen_clients()
+    user_id = _scoped_user(user_id, tenant)
+    chat_history = await _achat_history(user_id)
+
+    async def compute():
+        retriever_chain = await _aget_retriever_chain(tenant)
+        result = await retriever_chain.ainvoke({"question": user_query, "chat_history": chat_history},
+                                               config={"callbacks": [metrics_callbacks]})
+        return {"answer": result['answer'], "video-url": _video_url(result["source_documents"])}
+
+    if chat_history:
+        result = await compute()
+    else:
+        (result, tier), shared = await response_flight.ado(
+            (tenant, normalize_query(user_query)),
+            lambda: acached_answer(user_query, compute, aembed_query=_aembed_query(), cache=get_answer_cache(tenant)))
+        metrics.inc("rag_answer_cache_lookups_total", tier="coalesced" if shared else tier or "miss")
+    if chat_history_enabled():
+        save_chat_history(user_query, result["answer"], user_id)
+    return dict(result)
+
+
+def stream_response(user_query, user_id=None, tenant=None):
+    """
+    Stream a response to the user's query, token by token.
+
+    Runs the same history, retrieval and prompt as `get_response`, but yields events as
+    soon as they are available instead of waiting for the full answer:
+
+    - `{"event": "sources", "video-url": url}` once the documents are retrieved,
+    - `{"event": "token", "data": text}` for every chunk generated by the LLM,
+    - `{"event": "done", "answer": full_answer, "video-url": url}` at the end.
+
+    Args:
+        user_query (str): The user's query.
+        user_id (str): The ID of the user.
+        tenant (str, optional): The tenant; None for the default one.
+
+    A cached answer is sent as a single `token` event.
+
+    Yields:
+        dict: The events described above.
+    """
+    user_id = _scoped_user(user_id, tenant)
+    cache = get_answer_cache(tenant)
+    chat_history = _chat_history(user_id)
+    hit, key, vector, generation = ((None, None, None, None) if chat_history
+                                    else lookup_answer(user_query, _embed_query(), cache))
+    if not chat_history:
+        metrics.inc("rag_answer_cache_lookups_total", tier=hit[1] if hit else "miss")
+    if hit is not None:
+        cached = hit[0]
+        if chat_history_enabled():
+            save_chat_history(user_query, cached["answer"], user_id)
+        yield {"event": "sources", "video-url": cached["video-url"]}
+        yield {"event": "token", "data": cached["answer"]}
+        yield {"event": "done", "answer": cached["answer"], "video-url": cached["video-url"]}
+        return
+
+    start = time.perf_counter()
+    question = _standalone_question(user_query, chat_history, tenant)
+    source_documents = get_retriever(tenant).invoke(question, config={"callbacks": [metrics_callbacks]})
+    url = _video_url(source_documents)
+    yield {"event": "sources", "video-url": url}
+
+    context = "\n\n".join(document.page_content for document in source_documents)
+    answer = []
+    for chunk in get_llm().stream(get_prompt().format(context=context, question=question),
+                                  config={"callbacks": [metrics_callbacks]}):
+        if chunk.content:
+            answer.append(chunk.content)
+            yield {"event": "token", "data": chunk.content}
+
+    answer = "".join(answer)
+    if not chat_history:
+        cache.store(key, {"answer": answer, "video-url": url}, time.perf_counter() - start, vector, generation)
+    if chat_history_enabled():
+        save_chat_history(user_query, answer, user_id)
+    yield {"event": "done", "answer": answer, "video-url": url}
+
+
+async def astream_response(user_query, user_id=None, tenant=None):
+    """
+    Async `stream_response`: the same events, produced with the async clients.
+
+    Args:
+        user_query (str): The user's query.
+        user_id (str): The ID of the user.
+        tenant (str, optional): The tenant; None for the default one.
+
+    Yields:
+        dict: The events described in `stream_response`.
+    """
+    await aopen_clients()
+    user_id = _scoped_user(user_id, tenant)
+    cache = get_answer_cache(tenant)
+    chat_history = await _achat_history(user_id)
+    hit, key, vector, generation = ((None, None, None, None) if chat_history
+                                    else await alookup_answer(user_query, _aembed_query(), cache))
+    if not chat_history:
+        metrics.inc("rag_answer_cache_lookups_total", tier=hit[1] if hit else "miss")
+    if hit is not None:
+        cached = hit[0]
+        if chat_history_enabled():
+            save_chat_history(user_query, cached["answer"], user_id)
+        yield {"event": "sources", "video-url": cached["video-url"]}
+        yield {"event": "token", "data": cached["answer"]}
+        yield {"event": "done", "answer": cached["answer"], "video-url": cached["video-url"]}
+        return
+
+    start = time.perf_counter()
+    question = await _astandalone_question(user_query, chat_history, tenant)
+    await _aget_retriever_chain(tenant)  # a cold start builds the retriever and LLM off the loop
+    source_documents = await get_retriever(tenant).ainvoke(question, config={"callbacks": [metrics_callbacks]})
+    url = _video_url(source_documents)
+    yield {"event": "sources", "video-url": url}
+
+    context = "\n\n".join(document.page_content for document in source_documents)
+    answer = []
+    async for chunk in get_llm().astream(get_prompt().format(context=context, question=question),
+                                         config={"callbacks": [metrics_callbacks]}):
+        if chunk.content:
+            answer.append(chunk.content)
+            yield {"event": "token", "data": chunk.content}
+
+    answer = "".join(answer)
+    if not chat_history:
+        cache.store(key, {"answer": answer, "video-url": url}, time.perf_counter() - start, vector, generation)
+    if chat_history_enabled():
+        save_chat_history(user_query, answer, user_id)
+    yield {"event": "done", "answer": answer, "video-url": url}
@@ -0,0 +1,64 @@
+import os
+from typing import List
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+from helper.Chunk_ids import vector_id
+from helper.Lexical_index import LexicalIndex
+from helper.Metrics import metrics
+
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+def reciprocal_rank_fusion(rankings: List[List[Document]], k: int, rrf_k: int = RRF_K) -> List[Document]:
+    """
+    Fuse ranked lists with reciprocal rank fusion: score = sum(1 / (rrf_k + rank)).
+
+    Chunks are matched across lists by their content-hash vector ID.
+    """
+    scores, documents = {}, {}
+    for ranking in rankings:
+        for rank, document in enumerate(ranking, start=1):
+            key = vector_id(document.page_content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(key, document)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense retriever fused with BM25 lexical search by reciprocal rank fusion.
+
+    Catches exact tokens (SKUs, order numbers, brand names) the embedding model misses,
+    while keeping the dense ranking for paraphrased questions.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    dense: BaseRetriever
+    lexical: LexicalIndex
+    k: int = 5
+    lexical_k: int = 10
+
+    def _fuse(self, query: str, dense_documents: List[Document]) -> List[Document]:
+        # Changes saved by other processes are picked up by a background reload
+        self.lexical.reload_in_background()
+        lexical_documents = [document for document, _ in self.lexical.search(query, self.lexical_k)]
+        if not lexical_documents:
+            return dense_documents[:self.k]
+        return reciprocal_rank_fusion([dense_documents, lexical_documents], self.k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with metrics.span("dense_search"):
+            dense_documents = self.dense.invoke(query)
+        return self._fuse(query, dense_documents)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        # BM25 search takes about a millisecond, so it runs inline on the event loop (the
+        # index reload doesn't: see `_fuse`)
+        with metrics.span("dense_search"):
+            dense_documents = await self.dense.ainvoke(query)
+        return self._fuse(query, dense_documents)
@@ -0,0 +1,143 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_QUEUED_JOBS = int(os.getenv("INGEST_MAX_QUEUED_JOBS", "20"))
+INGEST_JOB_MAX_IN_FLIGHT = int(os.getenv("INGEST_JOB_MAX_IN_FLIGHT", "2"))
+
+
+class QueueFullError(RuntimeError):
+    """
+    Raised when a job is submitted while the queue already holds its maximum number of jobs.
+    """
+
+
+class Job:
+    """
+    State of one background job, as reported by the status endpoint.
+    """
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = "queued"
+        self.progress = 0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def as_dict(self) -> dict:
+        return {"job_id": self.id, "kind": self.kind, "state": self.state, "progress": self.progress,
+                "result": self.result, "error": self.error, "created_at": self.created_at,
+                "started_at": self.started_at, "finished_at": self.finished_at}
+
+
+class JobQueue:
+    """
+    Bounded background job queue running jobs on a small thread pool.
+
+    Only `max_workers` jobs run at once and at most `max_queued` jobs may be waiting or
+    running; further submissions raise `QueueFullError`. This keeps long ingestion jobs
+    off the event loop without letting them starve query traffic.
+
+    Finished jobs are kept (up to `max_finished`) so their status can still be read.
+    Jobs still queued at `shutdown` never run: they end as "cancelled", and their
+    `on_cancel` callback releases what they were handed (e.g. spooled uploads).
+    """
+
+    def __init__(self, max_workers: int = INGEST_WORKERS, max_queued: int = INGEST_MAX_QUEUED_JOBS,
+                 max_finished: int = 1000):
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = 0
+
+    def submit(self, kind: str, func: Callable, *args, on_cancel: Optional[Callable[[], None]] = None,
+               **kwargs) -> Job:
+        """
+        Queue `func(job, *args, **kwargs)`; `func` may update `job.progress` as it runs.
+
+        Args:
+            kind (str): A label for the job, e.g. "Document" or "URL".
+            func (Callable): The work to run; its return value becomes `job.result`.
+            on_cancel (Callable, optional): Called instead of `func` if the job is cancelled
+                before it starts, to release its inputs.
+
+        Returns:
+            Job: The queued job.
+
+        Raises:
+            QueueFullError: If `max_queued` jobs are already waiting or running.
+        """
+        job = Job(kind)
+        with self._lock:
+            if self._active >= self.max_queued:
+                raise QueueFullError(f"Ingestion queue is full ({self.max_queued} jobs), try again later.")
+            self._active += 1
+            self._jobs[job.id] = job
+            self._evict_finished()
+
+        future = self._executor.submit(self._run, job, func, args, kwargs)
+        future.add_done_callback(lambda future: self._cancelled(job, on_cancel) if future.cancelled() else None)
+        return job
+
+    def _cancelled(self, job: Job, on_cancel: Optional[Callable[[], None]]):
+        job.state = "cancelled"
+        job.error = "The server shut down before the job started."
+        job.finished_at = time.time()
+        with self._lock:
+            self._active -= 1
+        if on_cancel:
+            try:
+                on_cancel()
+            except Exception as e:
+                print(f"⚠️ Cleanup of cancelled job {job.id} failed: {e}")
+
+    def _run(self, job: Job, func: Callable, args, kwargs):
+        job.state = "running"
+        job.started_at = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.state = "succeeded"
+        except Exception as e:
+            job.error = str(e)
+            job.state = "failed"
+            print(f"❌ Job {job.id} ({job.kind}) failed: {e}")
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active -= 1
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = {}
+            for job in self._jobs.values():
+                states[job.state] = states.get(job.state, 0) + 1
+            return {"active": self._active, "max_queued": self.max_queued, "states": states}
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop accepting jobs, cancel the ones still queued and (optionally) wait for running ones.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+ingestion_queue = JobQueue()
@@ -0,0 +1,305 @@
+import os
+import re
+import math
+import pickle
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from helper.Clients import registry
+from helper.File_lock import file_lock
+from helper.Tenants import tenant_key, tenant_path
+from helper.Metrics import metrics
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", os.path.join(".cache", "lexical_index.pkl"))
+# Removed chunks are compacted out of the postings on save once they exceed this share of the index
+LEXICAL_INDEX_COMPACT_RATIO = float(os.getenv("LEXICAL_INDEX_COMPACT_RATIO", "0.2"))
+# Attributes that are not part of the saved index
+_TRANSIENT = ("_lock", "path", "_stamp", "_unsaved_adds", "_unsaved_removes", "_reload_lock", "_reloading")
+
+_ARABIC_DIACRITICS = re.compile(r"[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي",
+                                 "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+                                 "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9"})
+_ARABIC_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+# Words, including codes joined by - _ / . such as "SKU-12345" or "INV/2024/77"
+_TOKEN = re.compile(r"[0-9a-z\u0621-\u064a]+(?:[-_/.][0-9a-z\u0621-\u064a]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenize mixed Arabic/English text for BM25.
+
+    Latin text is lower-cased. Arabic is normalized (diacritics and tatweel removed, alef,
+    ya, ta marbuta and hamza forms unified, Arabic-Indic digits mapped to ASCII) and the
+    definite article prefixes are stripped. Codes such as SKUs and order numbers are kept
+    whole and also indexed by their parts, so "SKU-12345" matches "sku-12345" and "12345".
+    """
+    text = _ARABIC_DIACRITICS.sub("", text.lower()).translate(_ARABIC_LETTERS)
+    tokens = []
+    for match in _TOKEN.findall(text):
+        parts = re.split(r"[-_/.]", match)
+        if len(parts) > 1:
+            tokens.append(match)
+        for part in parts:
+            for prefix in _ARABIC_PREFIXES:
+                if part.startswith(prefix) and len(part) - len(prefix) >= 2:
+                    part = part[len(prefix):]
+                    break
+            tokens.append(part)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    Incremental BM25 inverted index over chunks.
+
+    Each term's postings are two compact typed arrays (chunk numbers and term frequencies);
+    at query time they are viewed as NumPy arrays and scored in a handful of vectorized
+    operations, so lexical scoring stays in the low milliseconds. The chunk text and
+    metadata are kept alongside so lexical-only hits can be returned as Documents.
+
+    Several processes (API workers, ingestion jobs) may update the same file: the chunks
+    added and removed since the last save are kept in a journal, and `save` takes a file
+    lock, reloads the file if another process saved it in the meantime, replays the
+    journal on top and only then writes. Removed chunks are left out of document
+    frequencies and compacted away on save once they exceed LEXICAL_INDEX_COMPACT_RATIO.
+    """
+
+    def __init__(self, path: Optional[str] = LEXICAL_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._lengths = array("I")
+        self._id_to_doc: Dict[str, int] = {}
+        self._deleted = set()
+        self._total_length = 0
+        self._stamp = None
+        self._unsaved_adds: Dict[str, Tuple[str, dict]] = {}
+        self._unsaved_removes = set()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self._ids) - len(self._deleted)
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self):
+        stamp = self._file_stamp()
+        with open(self.path, "rb") as index_file:
+            return stamp, pickle.load(index_file)
+
+    def _apply(self, stamp, state):
+        """
+        Switch to a loaded index, then re-apply this process's unsaved changes on top.
+        """
+        with self._lock:
+            self.__dict__.update(state)
+            self._stamp = stamp
+            for chunk_id, (text, metadata) in self._unsaved_adds.items():
+                self._add(chunk_id, text, metadata)
+            self._remove(self._unsaved_removes)
+
+    def _load(self):
+        self._apply(*self._read())
+
+    def reload_if_changed(self):
+        """
+        Pick up a newer index saved by another process.
+
+        The file is read without holding the index lock, so searches keep running on the
+        current index meanwhile.
+        """
+        if not self.path or self._file_stamp() in (None, self._stamp):
+            return
+        stamp, state = self._read()
+        with self._lock:
+            # Skip it if this process saved (or reloaded) a newer file in the meantime
+            if stamp != self._stamp and stamp == self._file_stamp():
+                self._apply(stamp, state)
+
+    def reload_in_background(self):
+        """
+        Start `reload_if_changed` in a thread if the file changed; returns at once.
+
+        Queries call this so a reload never blocks them (nor the event loop): they are
+        served by the current index until the new one is loaded.
+        """
+        if not self.path or self._file_stamp() in (None, self._stamp):
+            return
+        with self._reload_lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._background_reload, name="lexical-index-reload", daemon=True).start()
+
+    def _background_reload(self):
+        try:
+            self.reload_if_changed()
+        except Exception as e:
+            print(f"⚠️ Could not reload the lexical index {self.path}: {e}")
+        finally:
+            with self._reload_lock:
+                self._reloading = False
+
+    def save(self):
+        """
+        Persist the index atomically, merged with what other processes saved since it was loaded.
+        """
+        if not self.path:
+            return
+        with self._lock, file_lock(f"{self.path}.lock"):
+            if self._file_stamp() not in (None, self._stamp):
+                self._load()
+            if self._deleted and len(self._deleted) > LEXICAL_INDEX_COMPACT_RATIO * len(self._ids):
+                self._compact()
+            state = {key: value for key, value in self.__dict__.items() if key not in _TRANSIENT}
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as index_file:
+                pickle.dump(state, index_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path)
+            self._stamp = self._file_stamp()
+            self._unsaved_adds.clear()
+            self._unsaved_removes.clear()
+
+    def _compact(self):
+        """
+        Drop removed chunks from the postings and renumber the others.
+        """
+        keep = np.array([doc for doc in range(len(self._ids)) if doc not in self._deleted], dtype=np.int64)
+        renumber = np.full(len(self._ids), -1, dtype=np.int64)
+        renumber[keep] = np.arange(len(keep))
+        postings = {}
+        for term, (docs, frequencies) in self._postings.items():
+            docs = renumber[np.frombuffer(docs, dtype=np.uint32)]
+            alive = docs >= 0
+            if alive.any():
+                new_docs, new_frequencies = array("I"), array("H")
+                new_docs.frombytes(docs[alive].astype(np.uint32).tobytes())
+                new_frequencies.frombytes(np.frombuffer(frequencies, dtype=np.uint16)[alive].tobytes())
+                postings[term] = (new_docs, new_frequencies)
+        self._postings = postings
+        self._ids = [self._ids[doc] for doc in keep]
+        self._texts = [self._texts[doc] for doc in keep]
+        self._metadatas = [self._metadatas[doc] for doc in keep]
+        self._lengths = array("I", (self._lengths[doc] for doc in keep))
+        self._id_to_doc = {chunk_id: doc for doc, chunk_id in enumerate(self._ids)}
+        self._deleted = set()
+
+    def add(self, chunk_id: str, text: str, metadata: Optional[dict] = None):
+        """
+        Index a chunk; chunks already indexed under `chunk_id` are skipped.
+        """
+        with self._lock:
+            self._unsaved_removes.discard(chunk_id)
+            self._unsaved_adds[chunk_id] = (text, metadata or {})
+            self._add(chunk_id, text, metadata)
+
+    def _add(self, chunk_id: str, text: str, metadata: Optional[dict] = None):
+        tokens = tokenize(text)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+
+        with self._lock:
+            if chunk_id in self._id_to_doc and self._id_to_doc[chunk_id] not in self._deleted:
+                return
+            doc = len(self._ids)
+            self._ids.append(chunk_id)
+            self._texts.append(text)
+            self._metadatas.append(metadata or {})
+            self._lengths.append(len(tokens))
+            self._id_to_doc[chunk_id] = doc
+            self._total_length += len(tokens)
+            for token, count in counts.items():
+                postings = self._postings.get(token)
+                if postings is None:
+                    postings = self._postings[token] = (array("I"), array("H"))
+                postings[0].append(doc)
+                postings[1].append(min(count, 65535))
+
+    def add_records(self, records: List[dict]):
+        """
+        Index Pinecone-style `{"id", "metadata": {"text", ...}}` upsert records.
+        """
+        for record in records:
+            metadata = dict(record.get("metadata") or {})
+            text = metadata.pop("text", "")
+            self.add(record["id"], text, metadata)
+
+    def remove(self, chunk_ids: List[str]):
+        """
+        Drop chunks from search results (their postings are skipped at query time).
+        """
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._unsaved_adds.pop(chunk_id, None)
+                self._unsaved_removes.add(chunk_id)
+            self._remove(chunk_ids)
+
+    def _remove(self, chunk_ids):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                doc = self._id_to_doc.pop(chunk_id, None)
+                if doc is not None and doc not in self._deleted:
+                    self._deleted.add(doc)
+                    self._total_length -= self._lengths[doc]
+
+    @metrics.timed("lexical_search")
+    def search(self, query: str, k: int = 5) -> List[Tuple[Document, float]]:
+        """
+        Return the `k` best chunks for `query` by BM25, best first.
+        """
+        with self._lock:
+            count = len(self._ids) - len(self._deleted)
+            if not count:
+                return []
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            average_length = max(self._total_length / count, 1.0)
+            norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            alive = None
+            if self._deleted:
+                alive = np.ones(len(self._ids), dtype=bool)
+                alive[list(self._deleted)] = False
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                frequencies = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                # Removed chunks still in the postings don't count towards the document frequency
+                frequency = len(docs) if alive is None else int(np.count_nonzero(alive[docs]))
+                if not frequency:
+                    continue
+                idf = math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+                scores[docs] += idf * frequencies * (self.k1 + 1) / (frequencies + norms[docs])
+            if self._deleted:
+                scores[list(self._deleted)] = 0.0
+
+            k = min(k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(Document(page_content=self._texts[doc], metadata=dict(self._metadatas[doc]), id=self._ids[doc]),
+                     float(scores[doc])) for doc in best if scores[doc] > 0]
+
+
+def get_lexical_index(tenant: Optional[str] = None) -> LexicalIndex:
+    """Return the shared lexical index of a tenant (see `Tenants.py`); each tenant has its own file."""
+    path = tenant_path(os.getenv("LEXICAL_INDEX_PATH", LEXICAL_INDEX_PATH), tenant)
+    return registry.get(tenant_key("lexical_index", tenant), lambda: LexicalIndex(path), config=(path,))
+
@@ -1,43 +1,239 @@
+import os
 import re
-from typing import List
-from youtube_transcript_api import YouTubeTranscriptApi
-from langchain_community.document_loaders import (TextLoader, PyPDFLoader, Docx2txtLoader)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+import time
+import multiprocessing
+from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Optional
+from langchain_core.documents import Document
+from helper.Clients import registry
+from helper.Metrics import metrics
 
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "0"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
 
-def loading_documents(file_paths: List[str]):
+
+def _get_loader(path: str):
+    # The loaders (and the parsers behind them) are only imported when a file is loaded
+    from langchain_community.document_loaders import TextLoader, PyPDFLoader, Docx2txtLoader
+    if path.endswith(".txt"):
+        return TextLoader(path)
+    elif path.endswith(".pdf"):
+        return PyPDFLoader(path)
+    elif path.endswith(".docx"):
+        return Docx2txtLoader(path)
+    return None
+
+
+def _file_report(report: Dict[str, dict], path: str) -> dict:
+    return report.setdefault(path, {"pages": 0, "seconds": 0.0, "pages_per_sec": 0.0, "errors": []})
+
+
+def iter_documents(file_paths: List[str], raise_errors: bool = False,
+                   report: Optional[Dict[str, dict]] = None) -> Iterator[Document]:
     """
-    Load text from documents in the given file paths.
+    Lazily load documents page by page from the given file paths.
 
-    Supported file formats are .txt, .pdf, .docx.
+    Supported file formats are .txt, .pdf, .docx. Only one page is held in memory at a
+    time; each page keeps its `source` file and `page` number in its metadata. A file
+    that fails midway has the pages read before the error yielded, and the error
+    recorded in `report`, so callers can tell it was only partly loaded.
 
     :param file_paths: A list of paths to the files to load
-    :return: A single string containing all the text from the files, with each file's text
-             separated by a line containing "----"
+    :param raise_errors: Raise parse errors instead of printing them and skipping the file
+    :param report: Optional dict filled with per-file `pages` and `errors` (see `iter_documents_parallel`)
+    :return: A generator of one Document per page (one per file for .txt and .docx)
     """
-    full_text = ""
+    report = {} if report is None else report
     for path in file_paths:
+        stats = _file_report(report, path)
         try:
-            if path.endswith(".txt"):
-                loader = TextLoader(path)
-            elif path.endswith(".pdf"):
-                loader = PyPDFLoader(path)
-            elif path.endswith(".docx"):
-                loader = Docx2txtLoader(path)
-            else:
+            loader = _get_loader(path)
+            if loader is None:
+                stats["errors"].append("unsupported file format")
                 print(f"Unsupported file format: {path}")
                 continue
-            
-            documents = loader.load()
-            extracted_text = "\n".join([doc.page_content for doc in documents])
-            full_text += extracted_text + "\n---\n"
-        
+
+            for page_number, document in enumerate(loader.lazy_load()):
+                document.metadata["source"] = path
+                document.metadata.setdefault("page", page_number)
+                stats["pages"] += 1
+                yield document
+
         except Exception as e:
+            stats["errors"].append(str(e))
+            if raise_errors:
+                raise
             print(f"Error processing file {path}: {e}")
             continue
-    
-    return [Document(page_content=full_text)]
+
+
+def _pdf_metadata(metadata: dict) -> dict:
+    """
+    Normalize PDF document info the way `PyPDFLoader` does: keys lowercased without the
+    leading "/", PDF dates as ISO 8601, other values as stripped strings or ints.
+    """
+    normalized = {}
+    for key, value in metadata.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = key.lstrip("/").lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                normalized[key] = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                normalized[key] = value
+        elif key in ("page_count", "file_path"):
+            normalized[{"page_count": "total_pages", "file_path": "source"}[key]] = value
+            normalized[key] = value
+        else:
+            normalized[key] = value.strip() if isinstance(value, str) else value
+    return normalized
+
+
+def _load_pdf_pages(path: str, start: int, end: int) -> List[Document]:
+    """
+    Load pages [start, end) of a PDF with the same text and metadata as `PyPDFLoader`
+    (`producer`, `creator`, `creationdate`, `total_pages`, `page_label`, ...), so the
+    chunks indexed don't depend on PARSE_WORKERS.
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    metadata = _pdf_metadata({"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+                               | dict(reader.metadata or {})
+                               | {"source": path, "total_pages": len(reader.pages)})
+    return [Document(page_content=reader.pages[page].extract_text(extraction_mode="plain").strip(),
+                     metadata={**metadata, "page": page, "page_label": reader.page_labels[page]})
+            for page in range(start, end)]
+
+
+def _plan_parse_tasks(file_paths: List[str], pages_per_task: int):
+    """
+    Split the files into parse tasks: one per page range for PDFs, one per file otherwise.
+    """
+    tasks = []
+    for path in file_paths:
+        if path.endswith(".pdf"):
+            try:
+                from pypdf import PdfReader
+                page_count = len(PdfReader(path).pages)
+            except Exception as e:
+                tasks.append((path, None, None, str(e)))
+                continue
+            for start in range(0, page_count, pages_per_task):
+                tasks.append((path, start, min(start + pages_per_task, page_count), None))
+        else:
+            tasks.append((path, None, None, None))
+    return tasks
+
+
+def _parse_task(task):
+    """
+    Parse one task in a worker process.
+
+    Returns:
+        tuple: (documents, error message or None, seconds spent)
+    """
+    path, start, end, error = task
+    if error:
+        return [], error, 0.0
+
+    began = time.perf_counter()
+    try:
+        if start is not None:
+            documents = _load_pdf_pages(path, start, end)
+        else:
+            documents = list(iter_documents([path], raise_errors=True))
+        return documents, None, time.perf_counter() - began
+    except Exception as e:
+        return [], str(e), time.perf_counter() - began
+
+
+def get_parse_pool(max_workers: int):
+    """Return the shared process pool used for parallel parsing."""
+    return registry.get("parse_pool",
+                        lambda: ProcessPoolExecutor(max_workers=max_workers,
+                                                    mp_context=multiprocessing.get_context("spawn")),
+                        config=(max_workers,))
+
+
+def iter_documents_parallel(file_paths: List[str], max_workers: int = PARSE_WORKERS,
+                            pages_per_task: int = PDF_PAGES_PER_TASK,
+                            report: Optional[Dict[str, dict]] = None) -> Iterator[Document]:
+    """
+    Load documents page by page, parsing files (and large PDFs by page range) in a process pool.
+
+    Pages are yielded in the same order as `iter_documents`, whatever order the workers
+    finish in. At most `2 * max_workers` tasks are in flight, so memory stays bounded.
+    A file that fails to parse, or one of its page ranges, is recorded in `report` and
+    skipped without affecting the others.
+
+    :param file_paths: A list of paths to the files to load
+    :param max_workers: Number of worker processes
+    :param pages_per_task: Number of PDF pages parsed by a single task
+    :param report: Optional dict filled with per-file `pages`, `seconds`, `pages_per_sec` and `errors`
+    :return: A generator of one Document per page (one per file for .txt and .docx)
+    """
+    report = {} if report is None else report
+    tasks = deque()
+    for task in _plan_parse_tasks(file_paths, pages_per_task):
+        path = task[0]
+        if not path.endswith((".txt", ".pdf", ".docx")):
+            _file_report(report, path)["errors"].append("unsupported file format")
+            print(f"Unsupported file format: {path}")
+            continue
+        _file_report(report, path)
+        tasks.append(task)
+
+    remaining = {}
+    for task in tasks:
+        remaining[task[0]] = remaining.get(task[0], 0) + 1
+
+    pool = get_parse_pool(max_workers)
+    in_flight = deque()
+    while tasks or in_flight:
+        while tasks and len(in_flight) < 2 * max_workers:
+            task = tasks.popleft()
+            in_flight.append((task[0], pool.submit(_parse_task, task)))
+
+        path, future = in_flight.popleft()
+        try:
+            documents, error, seconds = future.result()
+        except BrokenProcessPool as e:
+            registry.clear("parse_pool")
+            documents, error, seconds = [], f"worker crashed: {e}", 0.0
+            pool = get_parse_pool(max_workers)
+        except Exception as e:
+            documents, error, seconds = [], str(e), 0.0
+
+        stats = report[path]
+        stats["pages"] += len(documents)
+        stats["seconds"] += seconds
+        if error:
+            stats["errors"].append(error)
+            print(f"Error processing file {path}: {error}")
+        yield from documents
+
+        remaining[path] -= 1
+        if remaining[path] == 0 and stats["seconds"] > 0:
+            stats["pages_per_sec"] = stats["pages"] / stats["seconds"]
+            print(f"📄 Parsed {path}: {stats['pages']} pages in {stats['seconds']:.2f}s "
+                  f"({stats['pages_per_sec']:.1f} pages/s)")
+
+
+def loading_documents(file_paths: List[str]):
+    """
+    Load text from documents in the given file paths.
+
+    Supported file formats are .txt, .pdf, .docx.
+
+    :param file_paths: A list of paths to the files to load
+    :return: A list of Documents, one per page, with `source` and `page` metadata
+    """
+    return list(iter_documents(file_paths))
 
 def extract_video_id(url):
     if len(url) == 11 and re.match(r'^[A-Za-z0-9_-]{11}$', url):
@@ -62,47 +258,95 @@ def loading_youtube_transcript(url):
     """
     Downloads the transcript of a YouTube video given its URL.
 
+    Transcripts are served from the transcript cache when the video was fetched before
+    (see `Transcripts.fetch_transcript`).
+
     :param url: The URL of the YouTube video
-    :return: The transcript of the video as a string
+    :return: A list with the transcript of the video as a single Document
     :raises ValueError: if the transcript could not be retrieved
     """
+    from helper.Transcripts import fetch_transcript, transcript_document
     try:
         # Extract video ID from the URL
         video_id = extract_video_id(url)
         if not video_id:
-            raise print("Invalid YouTube URL or video ID")
+            raise ValueError("Invalid YouTube URL or video ID")
         
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['ar', 'en'])
-        transcript_text = f"video-URL: {url} \n" + ' '.join([item['text'] for item in transcript_list])
-        
-        return [Document(page_content=transcript_text, metadata={"url": url})]
+        language, text = fetch_transcript(video_id)
+        return [transcript_document(url, video_id, language, text)]
     
     except Exception as e:
         raise ValueError(f"Could not retrieve transcript: {str(e)}")
     
 
-def load_data(file_paths: List[str]=None, url: str=None):
+def get_text_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=2000,
+                                          chunk_overlap=200,
+                                          add_start_index=True)
+
+
+def _split_pages(pages: Iterable[Document]) -> Iterator[Document]:
+    splitter = get_text_splitter()
+    for page in pages:
+        with metrics.span("split"):
+            chunks = splitter.split_documents(documents=[page])
+        yield from chunks
+
+
+def stream_data(file_paths: List[str]=None, url: str=None,
+                parse_workers: int=PARSE_WORKERS, urls: List[str]=None,
+                report: Optional[dict]=None) -> Iterator[Document]:
     """
-    Load data from either a list of file paths or a YouTube URL.
+    Lazily load and split data from either a list of file paths or a YouTube URL.
+
+    The arguments are validated (and a transcript fetched) right away; pages are then
+    loaded and split lazily as the result is consumed, so memory stays bounded by a
+    single page no matter how many files are passed. Chunks keep the `source` and
+    `page` metadata of the page they come from.
+
+    Several YouTube videos (`urls`) are fetched concurrently instead (see
+    `Transcripts.iter_transcripts`); videos without a transcript are skipped and
+    reported in `report`. For files, `report` gets each file's parse stats and errors,
+    including files that were only partly read.
 
     Args:
         file_paths (List[str]): A list of file paths to load data from.
         url (str): A YouTube URL to load transcript from.
+        parse_workers (int): Parse files in a pool of this many processes; 0 parses them
+            one at a time on the calling thread.
+        urls (List[str]): YouTube URLs to load transcripts from, in bulk.
+        report (dict, optional): Filled with url -> error for the videos of `urls` that failed, or with
+            path -> `{"pages", "seconds", "pages_per_sec", "errors"}` for `file_paths`.
 
     Returns:
-        List[str]: A list of strings, where each string is a chunk of text from
-            the loaded data. The chunks are determined by the
-            RecursiveCharacterTextSplitter.
+        Iterator[Document]: A generator of chunks produced by the RecursiveCharacterTextSplitter.
     """
-    if url and url.strip():
-        data = loading_youtube_transcript(url)
+    if urls:
+        from helper.Transcripts import iter_transcripts
+        pages = iter_transcripts(urls, report=report)
+    elif url and url.strip():
+        pages = loading_youtube_transcript(url)
     elif file_paths or file_paths == []:
-        data = loading_documents(file_paths)
+        pages = (iter_documents_parallel(file_paths, max_workers=parse_workers, report=report)
+                 if parse_workers > 0 else iter_documents(file_paths, report=report))
     else: 
         raise ValueError("Either file_paths or url must be provided.")
-        
-    splitter = RecursiveCharacterTextSplitter(chunk_size=2000, 
-                                              chunk_overlap=200)
-    
-    final_data = splitter.split_documents(documents=data)
-    return final_data
\ No newline at end of file
+
+    return _split_pages(metrics.timed_iter(pages, "parse_page"))
+
+
+def load_data(file_paths: List[str]=None, url: str=None):
+    """
+    Load data from either a list of file paths or a YouTube URL.
+
+    Args:
+        file_paths (List[str]): A list of file paths to load data from.
+        url (str): A YouTube URL to load transcript from.
+
+    Returns:
+        List[Document]: A list of chunks of the loaded data, determined by the
+            RecursiveCharacterTextSplitter. Use `stream_data` to avoid holding
+            them all in memory.
+    """
+    return list(stream_data(file_paths=file_paths, url=url))
\ No newline at end of file
@@ -0,0 +1,411 @@
+import os
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from helper.Clients import registry
+from helper.File_lock import file_lock
+from helper.Metrics import metrics
+from helper.Tenants import active_tenants
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(".cache", "local_index"))
+SEARCH_BLOCK_ROWS = 65536
+
+
+def _complete_size(path: str) -> int:
+    """
+    Return the size of `path` up to and including its last newline.
+    """
+    with open(path, "rb") as log_file:
+        position = log_file.seek(0, os.SEEK_END)
+        while position > 0:
+            start = max(0, position - 65536)
+            log_file.seek(start)
+            newline = log_file.read(position - start).rfind(b"\n")
+            if newline != -1:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+@metrics.timed("mmr")
+def maximal_marginal_relevance(query: np.ndarray, candidates: np.ndarray, k: int = 4,
+                               lambda_mult: float = 0.5) -> List[int]:
+    """
+    Vectorized MMR over unit-normalized vectors.
+
+    The candidate/candidate similarities are computed with one matrix product and the
+    highest similarity of every candidate to the already selected ones is updated in place,
+    so each of the `k` steps is a single O(n) pass.
+
+    Returns:
+        List[int]: Indices into `candidates`, in selection order.
+    """
+    if len(candidates) == 0 or k <= 0:
+        return []
+    query_similarity = candidates @ query
+    pairwise = candidates @ candidates.T
+    selected = [int(np.argmax(query_similarity))]
+    redundancy = pairwise[selected[0]].copy()
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * query_similarity - (1 - lambda_mult) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store persisted as memory-mapped files.
+
+    Layout of `directory`:
+
+    - `vectors.f32`: a contiguous float32 matrix of unit-normalized vectors, one row per chunk.
+    - `records.jsonl`: an append-only log of `{"row", "id", "text", "metadata"}` entries;
+      a later entry for the same row replaces it and `{"row", "deleted": true}` removes it.
+
+    Adds only append to both files (upserting an existing ID overwrites its row in place), so
+    ingestion is incremental. Writes hold an exclusive file lock on the directory (see
+    `File_lock.file_lock`) from row assignment through both appends, so several processes
+    can write the same store; their writes are picked up by the others on the next search.
+    Vectors are appended before their records: if a write is interrupted, the next writer
+    (or the next process opening the store) drops the incomplete record line and the vector
+    rows no record refers to, so rows and records stay aligned. A store whose records refer
+    to missing vector rows is refused.
+
+    Search is exact: a blocked matrix product over the memory-mapped matrix with an
+    `argpartition` top-k, and MMR re-ranking is vectorized with NumPy. There is no ANN
+    index: every query scans every row, so its cost grows linearly with the store (about
+    50 ms for 200k 768-dimensional vectors on one core). That suits single-box
+    deployments and per-tenant catalogs, not millions of vectors, which stay on Pinecone.
+    """
+
+    def __init__(self, directory: str = LOCAL_INDEX_DIR, embedding: Optional[Embeddings] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.embedding = embedding
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._records_path = os.path.join(directory, "records.jsonl")
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, ".lock")
+        self._lock = threading.RLock()
+        self._dim = None
+        self._ids: List[Optional[str]] = []
+        self._texts: List[str] = []
+        self._metadatas: List[dict] = []
+        self._id_to_row: Dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._matrix = None
+        self._records_offset = 0
+        with self._lock, file_lock(self._lock_path):
+            self._repair()
+
+    def _read_dim(self):
+        if self._dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as meta_file:
+                self._dim = json.load(meta_file)["dim"]
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    # ----- persistence -----
+    def _refresh(self):
+        """
+        Replay records appended since the last call (by this or another process).
+        """
+        if not os.path.exists(self._records_path) or os.path.getsize(self._records_path) == self._records_offset:
+            return
+        with open(self._records_path, "rb") as records_file:
+            records_file.seek(self._records_offset)
+            for line in records_file:
+                if not line.endswith(b"\n"):
+                    break  # partially written by another process, read it next time
+                self._records_offset += len(line)
+                self._apply(json.loads(line))
+        self._matrix = None
+
+    def _repair(self):
+        """
+        Catch up with the files and undo the tail of a write interrupted by a crash.
+
+        Must hold the file lock, so no other write is in progress: a record line without
+        its newline can only be left by a crash and is dropped, as are vector rows past the
+        last row the records refer to (appended, but their records never written).
+
+        Raises:
+            RuntimeError: If the records refer to vector rows missing from `vectors.f32`.
+        """
+        self._read_dim()
+        if os.path.exists(self._records_path):
+            complete = _complete_size(self._records_path)
+            if complete < os.path.getsize(self._records_path):
+                print(f"⚠️ Dropping an incomplete record in {self._records_path}")
+                os.truncate(self._records_path, complete)
+        self._refresh()
+        if not self._dim:
+            return
+
+        row_bytes = 4 * self._dim
+        expected = len(self._ids) * row_bytes
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        if size < expected:
+            raise RuntimeError(f"{self._vectors_path} has {size // row_bytes} rows but its records refer to "
+                               f"{len(self._ids)}; the local index is corrupt, rebuild it by re-ingesting.")
+        if size > expected:
+            print(f"⚠️ Dropping {(size - expected) / row_bytes:g} vector rows without records in {self._vectors_path}")
+            os.truncate(self._vectors_path, expected)
+            self._matrix = None
+
+    def _apply(self, record: dict):
+        row = record["row"]
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._texts.append("")
+            self._metadatas.append({})
+        if len(self._alive) < len(self._ids):
+            self._alive = np.concatenate([self._alive, np.zeros(len(self._ids) - len(self._alive), dtype=bool)])
+
+        old_id = self._ids[row]
+        if old_id is not None and self._id_to_row.get(old_id) == row:
+            del self._id_to_row[old_id]
+        if record.get("deleted"):
+            self._ids[row], self._texts[row], self._metadatas[row] = None, "", {}
+            self._alive[row] = False
+            return
+        self._ids[row] = record["id"]
+        self._texts[row] = record["text"]
+        self._metadatas[row] = record["metadata"]
+        self._id_to_row[record["id"]] = row
+        self._alive[row] = True
+
+    def _get_matrix(self) -> Optional[np.ndarray]:
+        if self._matrix is None and self._dim and os.path.exists(self._vectors_path):
+            rows = os.path.getsize(self._vectors_path) // (4 * self._dim)
+            rows = min(rows, len(self._ids))
+            if rows:
+                self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return self._matrix
+
+    def add_vectors(self, ids: List[str], vectors: np.ndarray, texts: List[str], metadatas: List[dict]):
+        """
+        Append (or overwrite, for known IDs) pre-computed vectors.
+        """
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock, file_lock(self._lock_path):
+            self._repair()
+            if self._dim is None:
+                self._dim = int(vectors.shape[1])
+                with open(self._meta_path, "w") as meta_file:
+                    json.dump({"dim": self._dim}, meta_file)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            records, new_rows, overwrites = [], [], []
+            next_row = len(self._ids)
+            for position, chunk_id in enumerate(ids):
+                row = self._id_to_row.get(chunk_id)
+                if row is None:
+                    row = next_row
+                    next_row += 1
+                    new_rows.append(position)
+                else:
+                    overwrites.append((row, position))
+                records.append({"row": row, "id": chunk_id, "text": texts[position], "metadata": metadatas[position]})
+
+            if overwrites:
+                matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+",
+                                   shape=(len(self._ids), self._dim))
+                for row, position in overwrites:
+                    matrix[row] = vectors[position]
+                matrix.flush()
+                del matrix
+            if new_rows:
+                with open(self._vectors_path, "ab") as vectors_file:
+                    vectors_file.write(np.ascontiguousarray(vectors[new_rows]).tobytes())
+            with open(self._records_path, "a", encoding="utf-8") as records_file:
+                records_file.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            self._refresh()
+
+    def upsert(self, vectors: List[dict], namespace: Optional[str] = None):
+        """
+        Pinecone-style upsert of `{"id", "values", "metadata"}` records (see `UpsertEngine`).
+        """
+        metadatas = [dict(record.get("metadata") or {}) for record in vectors]
+        texts = [metadata.pop("text", "") for metadata in metadatas]
+        self.add_vectors([record["id"] for record in vectors], np.array([record["values"] for record in vectors]),
+                         texts, metadatas)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._lock, file_lock(self._lock_path):
+            self._repair()
+            rows = [self._id_to_row[chunk_id] for chunk_id in ids if chunk_id in self._id_to_row]
+            if rows:
+                with open(self._records_path, "a", encoding="utf-8") as records_file:
+                    records_file.write("".join(json.dumps({"row": row, "deleted": True}) + "\n" for row in rows))
+                self._refresh()
+        return True
+
+    # ----- VectorStore API -----
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        from helper.Chunk_ids import vector_id
+
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [vector_id(text) for text in texts]
+        self.add_vectors(ids, np.array(self.embedding.embed_documents(texts)), texts, metadatas)
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   directory: str = LOCAL_INDEX_DIR, **kwargs: Any) -> "LocalVectorStore":
+        store = cls(directory=directory, embedding=embedding)
+        store.add_texts(texts, metadatas=metadatas, **kwargs)
+        return store
+
+    @metrics.timed("vector_search")
+    def search_vectors(self, queries: np.ndarray, k: int) -> List[List[Tuple[int, float]]]:
+        """
+        Exact cosine top-k for a batch of query vectors.
+
+        The matrix is scanned in blocks of `SEARCH_BLOCK_ROWS` rows, each block multiplied
+        by all queries at once, so memory stays bounded however large the index is.
+
+        Args:
+            queries (np.ndarray): (n_queries, dim) query vectors.
+            k (int): Results per query.
+
+        Returns:
+            list: For every query, (row, score) pairs best first.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        with self._lock:
+            self._refresh()
+            matrix, alive = self._get_matrix(), self._alive
+        if matrix is None:
+            return [[] for _ in queries]
+
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, matrix.shape[0], SEARCH_BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + SEARCH_BLOCK_ROWS])
+            scores = queries @ block.T
+            scores[:, ~alive[start:start + len(block)]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        results = []
+        for rows, scores in zip(best_rows, best_scores):
+            order = np.argsort(-scores)
+            results.append([(int(rows[i]), float(scores[i])) for i in order if np.isfinite(scores[i])])
+        return results
+
+    def _to_document(self, row: int) -> Document:
+        return Document(page_content=self._texts[row], metadata=dict(self._metadatas[row]), id=self._ids[row])
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        hits = self.search_vectors(np.asarray(embedding)[None, :], k)[0]
+        return [(self._to_document(row), score) for row, score in hits]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [document for document, _ in self.similarity_search_by_vector_with_score(embedding, k, **kwargs)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, **kwargs)
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1.0) / 2.0
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+        hits = self.search_vectors(query[None, :], fetch_k)[0]
+        if not hits:
+            return []
+        rows = [row for row, _ in hits]
+        with self._lock:
+            candidates = np.asarray(self._get_matrix()[rows])
+        selected = maximal_marginal_relevance(query, candidates, k=k, lambda_mult=lambda_mult)
+        return [self._to_document(rows[i]) for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(self.embedding.embed_query(query), k, fetch_k,
+                                                            lambda_mult, **kwargs)
+
+
+class LocalIndex:
+    """
+    Directory of `LocalVectorStore`s, one per namespace, with the Pinecone `Index` methods
+    used by ingestion (`upsert`, `delete`).
+    """
+
+    def __init__(self, directory: str = LOCAL_INDEX_DIR):
+        self.directory = directory
+        self._stores: Dict[str, LocalVectorStore] = {}
+        self._lock = threading.Lock()
+
+    def store(self, namespace: Optional[str] = None, embedding: Optional[Embeddings] = None) -> LocalVectorStore:
+        name = namespace or "__default__"
+        with self._lock:
+            store = self._stores.get(name)
+            if store is None:
+                store = self._stores[name] = LocalVectorStore(os.path.join(self.directory, name), embedding)
+        if embedding is not None and store.embedding is None:
+            store.embedding = embedding
+        return store
+
+    def forget(self, namespace: str):
+        """Close a namespace's store; it is reopened from its files on next use."""
+        with self._lock:
+            self._stores.pop(namespace, None)
+
+    def upsert(self, vectors: List[dict], namespace: Optional[str] = None):
+        return self.store(namespace).upsert(vectors)
+
+    def delete(self, ids: List[str], namespace: Optional[str] = None):
+        return self.store(namespace).delete(ids)
+
+
+def get_local_index() -> LocalIndex:
+    """Return the shared local index, so ingestion and retrieval see the same stores."""
+    directory = os.getenv("LOCAL_INDEX_DIR", LOCAL_INDEX_DIR)
+    return registry.get("local_index", lambda: LocalIndex(directory), config=(directory,))
+
+
+def _evict_tenant(tenant: str):
+    local_index = registry.peek("local_index")
+    if local_index is not None:
+        local_index.forget(tenant)
+
+
+active_tenants.on_evict(_evict_tenant)
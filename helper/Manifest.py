@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from helper.Clients import registry
+from helper.File_lock import file_lock
+from helper.Tenants import tenant_key, tenant_path
+
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", os.path.join(".cache", "manifest.json"))
+
+
+def file_fingerprint(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Return the SHA-256 hex digest of a file's bytes, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as source_file:
+        for block in iter(lambda: source_file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """
+    Persisted record of what is in the vector index, per source document.
+
+    Every source maps to the fingerprint of the file it was last ingested from and the
+    vector IDs (content hashes) of its chunks. This lets re-ingestion skip unchanged files,
+    upsert only chunks that are not indexed yet, and delete the vectors of chunks a new
+    version no longer contains.
+
+    Identical chunks in several sources share one vector, so vectors are reference
+    counted: a vector is only reported for deletion once no source references it.
+
+    Several processes may ingest into the same manifest: changes are made inside
+    `locked()`, which holds a file lock, reloads the file if another process saved it
+    since and saves it when the block exits, so reference counts are always computed
+    against the latest version and no process overwrites another's entries.
+    """
+
+    def __init__(self, path: Optional[str] = MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._sources: Dict[str, dict] = {}
+        self._refs: Dict[str, int] = {}
+        self._stamp = None
+        self._load()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        stamp = self._file_stamp() if self.path else None
+        sources = {}
+        if stamp is not None:
+            with open(self.path, encoding="utf-8") as manifest_file:
+                sources = json.load(manifest_file).get("sources", {})
+        with self._lock:
+            self._sources, self._refs, self._stamp = sources, {}, stamp
+            for entry in sources.values():
+                self._reference(entry["chunks"], 1)
+
+    def reload_if_changed(self):
+        """
+        Pick up a newer manifest saved by another process.
+        """
+        if self.path and self._file_stamp() != self._stamp:
+            self._load()
+
+    def _reference(self, chunk_ids: Iterable[str], delta: int) -> List[str]:
+        released = []
+        for chunk_id in chunk_ids:
+            count = self._refs.get(chunk_id, 0) + delta
+            if count > 0:
+                self._refs[chunk_id] = count
+            else:
+                self._refs.pop(chunk_id, None)
+                released.append(chunk_id)
+        return released
+
+    def __len__(self):
+        return len(self._sources)
+
+    def fingerprint(self, source: str) -> Optional[str]:
+        """Return the fingerprint `source` was last ingested with, or None."""
+        with self._lock:
+            entry = self._sources.get(source)
+            return entry["fingerprint"] if entry else None
+
+    def is_indexed(self, chunk_id: str) -> bool:
+        """Whether some source already references the vector `chunk_id`."""
+        with self._lock:
+            return chunk_id in self._refs
+
+    def update(self, source: str, fingerprint: str, chunk_ids: List[str]) -> List[str]:
+        """
+        Record the new version of `source`.
+
+        Returns:
+            list: Vector IDs no source references any more; delete them from the index.
+        """
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        with self._lock:
+            previous = self._sources.get(source, {}).get("chunks", [])
+            self._reference(chunk_ids, 1)
+            released = self._reference(previous, -1)
+            self._sources[source] = {"fingerprint": fingerprint, "chunks": chunk_ids, "updated_at": time.time()}
+            return released
+
+    def remove(self, source: str) -> List[str]:
+        """
+        Forget `source`.
+
+        Returns:
+            list: Vector IDs no source references any more.
+        """
+        with self._lock:
+            entry = self._sources.pop(source, None)
+            return self._reference(entry["chunks"], -1) if entry else []
+
+    @contextmanager
+    def locked(self):
+        """
+        Make a read-modify-write change to the manifest, e.g. `update` or `remove` calls.
+
+        The block runs under the manifest's file lock, on the latest saved version, and
+        the manifest is saved when it exits. If the block raises, its changes are
+        dropped (the saved version is reloaded) so a retry starts from the same state.
+        """
+        if not self.path:
+            with self._lock:
+                yield self
+            return
+        with self._lock, file_lock(f"{self.path}.lock"):
+            self.reload_if_changed()
+            try:
+                yield self
+            except BaseException:
+                self._load()
+                raise
+            self._save()
+
+    def _save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as manifest_file:
+            json.dump({"sources": self._sources}, manifest_file)
+        os.replace(temp_path, self.path)
+        self._stamp = self._file_stamp()
+
+
+def get_manifest(tenant: Optional[str] = None) -> Manifest:
+    """Return the shared manifest of a tenant (see `Tenants.py`); each tenant has its own file."""
+    path = tenant_path(os.getenv("MANIFEST_PATH", MANIFEST_PATH), tenant)
+    return registry.get(tenant_key("manifest", tenant), lambda: Manifest(path), config=(path,))
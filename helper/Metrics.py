@@ -0,0 +1,284 @@
+import os
+import time
+import inspect
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from helper.Tenants import active_tenants
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = "rag_stage_seconds"
+STAGE_ERRORS = "rag_stage_errors_total"
+
+_HELP = {
+    STAGE_SECONDS: "Time spent per pipeline stage.",
+    STAGE_ERRORS: "Exceptions raised per pipeline stage.",
+    "rag_llm_first_token_seconds": "Time from LLM call to its first streamed token.",
+    "rag_answer_cache_lookups_total": "Answer cache lookups by tier (exact, semantic, miss).",
+    "rag_embedding_cache_total": "Chunk embeddings served from the embedding cache (hit) or the model (miss).",
+    "rag_chunks_upserted_total": "Chunks upserted into the vector index.",
+    "rag_upsert_retries_total": "Retried embed/upsert calls.",
+    "rag_chunks_failed_total": "Chunks that still failed after all retries.",
+    "rag_chat_history_rows_written_total": "Chat history rows written to the database.",
+    "rag_context_tokens_total": "Estimated context tokens retrieved and sent to the LLM after packing.",
+    "rag_coalesced_requests_total": "Requests served by another identical in-flight request.",
+    "rag_query_embedding_calls_total": "Batched query embedding calls.",
+    "rag_query_embeddings_total": "Queries embedded by batched calls.",
+    "rag_transcript_cache_total": "Video transcripts served from the transcript cache (hit) or fetched (miss).",
+    "rag_recent_turns_total": "Recent-turn lookups served from memory (hit) or the database (miss).",
+}
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _format_labels(labels: Tuple, extra: str = "") -> str:
+    parts = [f'{key}="{str(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metrics:
+    """
+    In-process counters, gauges and latency histograms, rendered in the Prometheus text format.
+
+    Recording is a lock, a bisect and a few additions (about a microsecond), so it is
+    cheap enough to leave on in production; METRICS_ENABLED=false turns it off.
+
+    Stages are timed with `span`:
+
+        with metrics.span("embed_query"):
+            ...
+
+    which feeds the `rag_stage_seconds{stage=...}` histogram (and
+    `rag_stage_errors_total` when the block raises).
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, enabled: bool = METRICS_ENABLED):
+        self.buckets = tuple(buckets)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._gauges: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, _Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Add `value` to the counter `name`."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """Set the gauge `name` to `value`."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = float(value)
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record a duration in the histogram `name`."""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def forget(self, **labels):
+        """Drop every series (counter, gauge or histogram) carrying all of `labels`."""
+        wanted = set(labels.items())
+        with self._lock:
+            for table in (self._counters, self._gauges, self._histograms):
+                for series in table.values():
+                    for key in [key for key in series if wanted <= set(key)]:
+                        del series[key]
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time the enclosed block as `stage`."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(STAGE_ERRORS, stage=stage)
+            raise
+        finally:
+            self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+
+    def timed(self, stage: str):
+        """Decorator timing every call of the function (or coroutine function) as `stage`."""
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(stage):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, iterable: Iterable, stage: str) -> Iterator:
+        """
+        Yield from `iterable`, timing how long each item takes to produce (not to consume) as `stage`.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except Exception:
+                self.inc(STAGE_ERRORS, stage=stage)
+                raise
+            self.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+            yield item
+
+    def snapshot(self) -> dict:
+        """
+        Return count, total and mean seconds per stage, e.g. for `/stats`.
+        """
+        with self._lock:
+            stages = self._histograms.get(STAGE_SECONDS, {})
+            return {dict(key).get("stage", ""): {"count": histogram.count, "seconds": round(histogram.sum, 3),
+                                                 "mean_ms": round(histogram.sum / histogram.count * 1000, 2)}
+                    for key, histogram in stages.items() if histogram.count}
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+
+        def header(name, kind):
+            if name in _HELP:
+                lines.append(f"# HELP {name} {_HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                header(name, "counter")
+                lines.extend(f"{name}{_format_labels(key)} {value}" for key, value in sorted(series.items()))
+            for name, series in sorted(self._gauges.items()):
+                header(name, "gauge")
+                lines.extend(f"{name}{_format_labels(key)} {value}" for key, value in sorted(series.items()))
+            for name, series in sorted(self._histograms.items()):
+                header(name, "histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        bucket_labels = _format_labels(key, f'le="{le}"')
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+metrics = Metrics()
+active_tenants.on_evict(lambda tenant: metrics.forget(tenant=tenant))
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback timing the retriever and LLM runs inside a chain.
+
+    Pass it in the run config (`{"callbacks": [metrics_callbacks]}`); it records the
+    `retrieval` and `llm_generation` stages and `rag_llm_first_token_seconds` for
+    streamed generations.
+
+    It only takes a lock, so async runs call it inline instead of in an executor thread.
+    """
+
+    run_inline = True
+
+    def __init__(self, registry: Metrics = metrics):
+        self.metrics = registry
+        self._lock = threading.Lock()
+        self._starts: Dict[UUID, Tuple[str, float]] = {}
+        self._first_token: Dict[UUID, bool] = {}
+
+    def _start(self, run_id: UUID, stage: str):
+        with self._lock:
+            self._starts[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID, error: bool = False):
+        with self._lock:
+            started = self._starts.pop(run_id, None)
+            self._first_token.pop(run_id, None)
+        if started is not None:
+            stage, start = started
+            self.metrics.observe(STAGE_SECONDS, time.perf_counter() - start, stage=stage)
+            if error:
+                self.metrics.inc(STAGE_ERRORS, stage=stage)
+
+    def on_retriever_start(self, serialized, query, *, run_id: UUID, **kwargs):
+        self._start(run_id, "retrieval")
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id: UUID, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs):
+        self._start(run_id, "llm_generation")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._start(run_id, "llm_generation")
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs):
+        with self._lock:
+            started = self._starts.get(run_id)
+            if started is None or self._first_token.get(run_id):
+                return
+            self._first_token[run_id] = True
+        self.metrics.observe("rag_llm_first_token_seconds", time.perf_counter() - started[1])
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._end(run_id, error=True)
+
+
+metrics_callbacks = MetricsCallbackHandler()
@@ -1,52 +1,700 @@
 import os
-import mysql.connector
-
-# Connect to MySQL
-conn = mysql.connector.connect(
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    database=os.getenv("DB_NAME")
-)
-cursor = conn.cursor()
+import time
+import atexit
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, List, Optional, Tuple
+from helper.Clients import registry
+from helper.Metrics import metrics
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "20"))
+# How long a caller waits for a free pooled connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+CHAT_HISTORY_FLUSH_SIZE = int(os.getenv("CHAT_HISTORY_FLUSH_SIZE", "50"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "1.0"))
+CHAT_HISTORY_MAX_BUFFER = int(os.getenv("CHAT_HISTORY_MAX_BUFFER", "10000"))
+CHAT_HISTORY_MAX_TURNS = int(os.getenv("CHAT_HISTORY_MAX_TURNS", "6"))
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "1500"))
+CHAT_HISTORY_CACHED_USERS = int(os.getenv("CHAT_HISTORY_CACHED_USERS", "10000"))
+# Cached turns are reloaded after this many seconds, to pick up turns answered by other workers
+CHAT_HISTORY_CACHE_TTL = float(os.getenv("CHAT_HISTORY_CACHE_TTL", "5"))
+# Reads retried while the writer is flushing, before falling back to waiting for the flush
+CHAT_HISTORY_READ_ATTEMPTS = 50
+CHAT_HISTORY_READ_RETRY_DELAY = 0.005
+
+CREATE_TABLE_SQL = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INT(11) NOT NULL AUTO_INCREMENT,
+            user_query TEXT NOT NULL,
+            chatbot_answer TEXT NOT NULL,
+            user_id VARCHAR(255) DEFAULT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id),
+            KEY idx_chat_history_user_id (user_id, id)
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_query TEXT NOT NULL,
+            chatbot_answer TEXT NOT NULL,
+            user_id VARCHAR(255) DEFAULT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """,
+}
+
+# History is always read by user, newest first, and paged on the row ID (ids grow in insert
+# order): (user_id, id) serves both the sort and the `id < before_id` seek without a scan.
+CREATE_INDEX_SQL = "CREATE INDEX idx_chat_history_user_id ON chat_history (user_id, id)"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PoolTimeoutError(RuntimeError):
+    """
+    Raised when no pooled connection became free within the timeout.
+    """
+
+
+class _LimitedConnection:
+    """
+    A borrowed connection that gives its slot back to the `ConnectionLimiter` on `close()`.
+    """
+
+    def __init__(self, conn, slots: threading.BoundedSemaphore):
+        self._conn = conn
+        self._slots = slots
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        slots, self._slots = self._slots, None
+        if slots is None:
+            return
+        try:
+            self._conn.close()
+        finally:
+            slots.release()
+
+
+class ConnectionLimiter:
+    """
+    Hands out at most `size` connections of `connect` at a time.
+
+    `MySQLConnectionPool.get_connection()` raises `PoolError` as soon as the pool is
+    exhausted; sized to the pool, this makes callers queue for a free connection instead,
+    for up to `timeout` seconds (then `PoolTimeoutError`).
+    """
+
+    def __init__(self, connect: Callable, size: int, timeout: float = DB_POOL_TIMEOUT):
+        self.connect = connect
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(size)
+
+    def __call__(self):
+        if not self._slots.acquire(blocking=False):
+            metrics.inc("rag_db_pool_waits_total")
+            if not self._slots.acquire(timeout=self.timeout):
+                raise PoolTimeoutError(f"No database connection became free within {self.timeout}s")
+        try:
+            return _LimitedConnection(self.connect(), self._slots)
+        except BaseException:
+            self._slots.release()
+            raise
+
+
+def _pooled_connection():
+    """
+    Borrow a connection from the MySQL pool, created on first use so importing this
+    module never touches the database.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from mysql.connector import pooling
+                _pool = pooling.MySQLConnectionPool(
+                    pool_name="chat_history",
+                    pool_size=DB_POOL_SIZE,
+                    pool_reset_session=True,
+                    host=os.getenv("DB_HOST"),
+                    port=os.getenv("DB_PORT"),
+                    user=os.getenv("DB_USER"),
+                    password=os.getenv("DB_PASSWORD"),
+                    database=os.getenv("DB_NAME")
+                )
+    return _pool.get_connection()
+
+
+_pool_limiter = ConnectionLimiter(_pooled_connection, DB_POOL_SIZE)
+
+
+def get_connection():
+    """
+    Borrow a connection from the MySQL pool; `close()` returns it to the pool.
+
+    Waits up to `DB_POOL_TIMEOUT` seconds when all `DB_POOL_SIZE` connections are in use.
+    """
+    return _pool_limiter()
+
+
+def _select_sql(placeholder: str, user_id, limit: Optional[int], before_id: Optional[int]) -> Tuple[str, tuple]:
+    """
+    Return the SQL and parameters reading a user's rows, newest first (see `ChatHistoryStore.fetch`).
+    """
+    p = placeholder
+    where, params = f"user_id = {p}", [user_id]
+    if before_id is not None:
+        where += f" AND id < {p}"
+        params.append(before_id)
+    limit_sql = ""
+    if limit is not None:
+        limit_sql = f"LIMIT {p}"
+        params.append(int(limit))
+    return f"""
+        SELECT id, user_query, chatbot_answer
+        FROM chat_history
+        WHERE {where}
+        ORDER BY id DESC
+        {limit_sql}
+    """, tuple(params)
+
+
+class ChatHistoryStore:
+    """
+    Reads and writes the `chat_history` table through any DB-API connection factory.
+
+    Each call borrows its own connection (and cursor), so the store is safe to share
+    between threads. `dialect` selects the SQL flavour: "mysql" for production, "sqlite"
+    for local runs, e.g. `ChatHistoryStore(lambda: sqlite3.connect(path), dialect="sqlite")`.
+    """
+
+    def __init__(self, connect: Callable = get_connection, dialect: str = "mysql"):
+        self.connect = connect
+        self.dialect = dialect
+        self.placeholder = "?" if dialect == "sqlite" else "%s"
+
+    def _execute(self, work):
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            try:
+                return work(cursor, conn)
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    def create_table(self):
+        def work(cursor, conn):
+            cursor.execute(CREATE_TABLE_SQL[self.dialect])
+            conn.commit()
+        self._execute(work)
+        self.create_index()
+
+    def create_index(self):
+        """
+        Add the (user_id, id) index to an existing table; a no-op if it already exists.
+        """
+        def work(cursor, conn):
+            if self.dialect == "sqlite":
+                cursor.execute(CREATE_INDEX_SQL.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS"))
+            else:
+                cursor.execute("""
+                    SELECT COUNT(*) FROM information_schema.statistics
+                    WHERE table_schema = DATABASE() AND table_name = 'chat_history'
+                      AND index_name = 'idx_chat_history_user_id'
+                """)
+                if cursor.fetchone()[0]:
+                    return
+                cursor.execute(CREATE_INDEX_SQL)
+            conn.commit()
+        self._execute(work)
+
+    def insert_many(self, rows: List[Tuple[str, str, Optional[str]]]):
+        """
+        Insert (user_query, chatbot_answer, user_id) rows in one round-trip and transaction.
+        """
+        p = self.placeholder
+        def work(cursor, conn):
+            cursor.executemany(f"""
+                INSERT INTO chat_history (user_query, chatbot_answer, user_id)
+                VALUES ({p}, {p}, {p})
+            """, rows)
+            conn.commit()
+        self._execute(work)
+
+    @metrics.timed("chat_history_fetch")
+    def fetch(self, user_id, limit: Optional[int] = None,
+              before_id: Optional[int] = None) -> List[Tuple[int, str, str]]:
+        """
+        Return (id, user_query, chatbot_answer) rows of a user, newest first.
+
+        Args:
+            user_id (str): The user's ID.
+            limit (int, optional): Return at most this many rows.
+            before_id (int, optional): Only rows older than this row ID (keyset pagination).
+        """
+        sql, params = _select_sql(self.placeholder, user_id, limit, before_id)
+
+        def work(cursor, conn):
+            cursor.execute(sql, params)
+            return [(row[0], row[1], row[2]) for row in cursor.fetchall()]
+        return self._execute(work)
+
+
+async def create_async_pool():
+    """
+    Create the aiomysql connection pool of the async query path, from the same DB_* settings.
+    """
+    import aiomysql
+    return await aiomysql.create_pool(
+        minsize=1,
+        maxsize=DB_ASYNC_POOL_SIZE,
+        host=os.getenv("DB_HOST"),
+        port=int(os.getenv("DB_PORT") or 3306),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        db=os.getenv("DB_NAME"),
+        autocommit=True
+    )
+
+
+class AsyncChatHistoryStore:
+    """
+    Reads the `chat_history` table without blocking the event loop.
+
+    `create_pool` is a coroutine function returning an aiomysql-style pool (`acquire()`,
+    `cursor()`, awaitable `execute` and `fetchall`); the pool is created on first use,
+    on the running loop, and released by `close`. Rows are written by the write-behind
+    `ChatHistoryWriter`, so only reads need the async driver.
+    """
+
+    def __init__(self, create_pool: Callable = create_async_pool, dialect: str = "mysql"):
+        self.create_pool = create_pool
+        self.placeholder = "?" if dialect == "sqlite" else "%s"
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _get_pool(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await self.create_pool()
+        return self._pool
+
+    @metrics.timed("chat_history_fetch")
+    async def fetch(self, user_id, limit: Optional[int] = None,
+                    before_id: Optional[int] = None) -> List[Tuple[int, str, str]]:
+        """
+        Async `ChatHistoryStore.fetch`: (id, user_query, chatbot_answer) rows of a user, newest first.
+        """
+        sql, params = _select_sql(self.placeholder, user_id, limit, before_id)
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(sql, params)
+                return [(row[0], row[1], row[2]) for row in await cursor.fetchall()]
+
+    async def close(self):
+        pool, self._pool = self._pool, None
+        self._pool_lock = asyncio.Lock()  # the next pool may be created on another loop
+        if pool is not None:
+            pool.close()
+            await pool.wait_closed()
+
+
+class ChatHistoryWriter:
+    """
+    Write-behind buffer for chat rows.
+
+    `add` only appends to an in-memory buffer; a background thread batch-inserts the
+    buffered rows once `flush_size` rows are waiting or every `flush_interval` seconds.
+    Rows of a failed flush stay buffered and are retried on the next one; beyond
+    `max_buffer` rows the oldest are dropped. `close` flushes what is left.
+
+    Readers see rows not written yet through `unwritten`; `version` is odd while a flush
+    is writing rows and changes when it ends, so a reader can tell whether the table
+    changed under it (see `get_chat_history_page`).
+    """
+
+    def __init__(self, store: ChatHistoryStore, flush_size: int = CHAT_HISTORY_FLUSH_SIZE,
+                 flush_interval: float = CHAT_HISTORY_FLUSH_INTERVAL, max_buffer: int = CHAT_HISTORY_MAX_BUFFER):
+        self.store = store
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=max_buffer)
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._version = 0
+        self.flushed = 0
+        self._thread = threading.Thread(target=self._loop, name="chat-history-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, user_query: str, chatbot_answer: str, user_id: Optional[str] = None):
+        with self._condition:
+            if len(self._buffer) == self._buffer.maxlen:
+                print("⚠️ Chat history buffer full, dropping the oldest row.")
+            self._buffer.append((user_query, chatbot_answer, user_id))
+            if len(self._buffer) >= self.flush_size:
+                self._condition.notify()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered rows not written yet."""
+        with self._condition:
+            return len(self._buffer)
+
+    @property
+    def version(self) -> int:
+        with self._condition:
+            return self._version
+
+    def unwritten(self, user_id) -> Tuple[List[Tuple[None, str, str]], int]:
+        """
+        Return the buffered rows of a user, newest first as (None, user_query, chatbot_answer)
+        since they have no ID yet, and the current `version`.
+        """
+        with self._condition:
+            rows = [(None, row[0], row[1]) for row in reversed(self._buffer) if row[2] == user_id]
+            return rows, self._version
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._buffer) < self.flush_size:
+                    self._condition.wait(timeout=self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Error while saving chat history: {e}")
+
+    def flush(self):
+        """
+        Insert every buffered row now. On failure the rows are put back and the error is raised.
+        """
+        with self._flush_lock:
+            with self._condition:
+                rows = list(self._buffer)
+                self._buffer.clear()
+                if not rows:
+                    return
+                self._version += 1
+            try:
+                with metrics.span("chat_history_flush"):
+                    self.store.insert_many(rows)
+                self.flushed += len(rows)
+                metrics.inc("rag_chat_history_rows_written_total", len(rows))
+            except Exception:
+                with self._condition:
+                    self._buffer.extendleft(reversed(rows))
+                raise
+            finally:
+                with self._condition:
+                    self._version += 1
+
+    def close(self):
+        """
+        Stop the background thread and flush the remaining rows.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.flush()
+
+
+class RecentTurnsCache:
+    """
+    Per-user LRU of the most recent (user_query, chatbot_answer) turns, oldest first.
+
+    Holds at most `max_turns` turns for at most `max_users` users. New turns are appended
+    only for users already cached; other users are loaded from the database on first read.
+    The cache is per process: an entry is reloaded `ttl` seconds after it was loaded, so
+    turns answered by another worker are seen within `ttl` seconds.
+
+    A miss returns a load token to pass to `put`. A turn appended while the reader was
+    loading invalidates the token, so the (possibly older) rows it read are not cached
+    over it.
+    """
+
+    def __init__(self, max_users: int = CHAT_HISTORY_CACHED_USERS, max_turns: int = CHAT_HISTORY_MAX_TURNS,
+                 ttl: float = CHAT_HISTORY_CACHE_TTL):
+        self.max_users = max_users
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._users: "OrderedDict[str, Tuple[deque, float]]" = OrderedDict()
+        self._loading: "OrderedDict[str, object]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id) -> Tuple[Optional[List[Tuple[str, str]]], Optional[object]]:
+        """
+        Return (turns, None) on a hit, or (None, load token) on a miss.
+        """
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and time.monotonic() - entry[1] <= self.ttl:
+                self._users.move_to_end(user_id)
+                self.hits += 1
+                return list(entry[0]), None
+            self._users.pop(user_id, None)
+            self.misses += 1
+            token = self._loading[user_id] = object()
+            self._loading.move_to_end(user_id)
+            while len(self._loading) > self.max_users:
+                self._loading.popitem(last=False)
+            return None, token
+
+    def put(self, user_id, turns: List[Tuple[str, str]], token: object):
+        """
+        Cache the turns read after the miss that returned `token`, unless a turn was appended since.
+        """
+        with self._lock:
+            if self._loading.get(user_id) is not token:
+                return
+            del self._loading[user_id]
+            self._users[user_id] = (deque(turns[-self.max_turns:], maxlen=self.max_turns), time.monotonic())
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def append(self, user_id, turn: Tuple[str, str]):
+        with self._lock:
+            self._loading.pop(user_id, None)
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry[0].append(turn)
+
+
+recent_turns = RecentTurnsCache()
+
+
+def get_chat_history_writer() -> ChatHistoryWriter:
+    """Return the process-wide write-behind writer, created on first use."""
+    return registry.get("chat_history_writer", lambda: ChatHistoryWriter(ChatHistoryStore()))
+
+
+def get_async_chat_history_store() -> AsyncChatHistoryStore:
+    """Return the process-wide async store the async query path reads history with."""
+    return registry.get("async_chat_history_store", AsyncChatHistoryStore)
+
+
+def chat_history_enabled() -> bool:
+    """Chat history is only saved when a database is configured."""
+    return bool(os.getenv("DB_HOST"))
+
+
+def migrate_chat_history():
+    """
+    Create the chat history table and its (user_id, id) index if they are missing; called
+    at application startup, and safe to run from every worker.
+    """
+    get_chat_history_writer().store.create_table()
+
+
+def close_chat_history():
+    """
+    Flush buffered chat rows; called on application shutdown.
+    """
+    writer = registry.peek("chat_history_writer")
+    if writer is not None:
+        try:
+            writer.close()
+        except Exception as e:
+            print(f"❌ Error while saving chat history: {e}")
+
+atexit.register(close_chat_history)
+
+
+async def close_async_chat_history():
+    """
+    Close the async connection pool; called on application shutdown, on the serving loop.
+    """
+    store = registry.peek("async_chat_history_store")
+    if store is not None:
+        await store.close()
+
 
 # Save chat history
 def save_chat_history(user_query, chatbot_answer, user_id=None):
     """
     Save a user's query and the chatbot's response to the chat history table.
 
+    The row is buffered and written in a batch by the background writer, so this call
+    never waits on the database.
+
     Args:
         user_query (str): The user's query.
         chatbot_answer (str): The chatbot's response.
         user_id (str, optional): The user's ID. Defaults to None.
     """
-    cursor.execute("""
-        INSERT INTO chat_history (user_query, chatbot_answer, user_id)
-        VALUES (%s, %s, %s)
-    """, (user_query, chatbot_answer, user_id))
-    conn.commit()
+    get_chat_history_writer().add(user_query, chatbot_answer, user_id)
+    recent_turns.append(user_id, (user_query, chatbot_answer))
 
 # Retrieve chat history for a user
-def get_chat_history(user_id):
+def get_chat_history(user_id, limit=None, before_id=None):
     """
-    Retrieve the chat history for a user.
+    Retrieve the chat history for a user, including the rows not written yet.
 
     Args:
         user_id (str): The user's ID.
+        limit (int, optional): Return at most this many turns.
+        before_id (int, optional): Only turns older than this row ID.
 
     Returns:
-        list: A list of dictionaries containing the user's query and the chatbot's response.
+        list: A list of (user query, chatbot response) tuples, most recent first.
     """
-    cursor.execute("""
-        SELECT user_query, chatbot_answer
-        FROM chat_history
-        WHERE user_id = %s
-        ORDER BY timestamp DESC
-    """, (user_id,))
-    results = cursor.fetchall()
-    chat_history = [(row[0], row[1]) for row in results]
-    return chat_history
+    return [(row[1], row[2]) for row in get_chat_history_page(user_id, limit, before_id)["turns"]]
+
+
+def _page(unwritten, rows, limit):
+    """
+    Build a page from the unwritten rows (newest, first page only) and the rows read from the table.
+    """
+    stored_limit = limit - len(unwritten) if limit else limit
+    next_before_id = rows[-1][0] if stored_limit and rows and len(rows) == stored_limit else None
+    return {"turns": unwritten + rows, "next_before_id": next_before_id}
+
+
+def _read_plan(writer, user_id, limit, before_id):
+    """
+    Return (unwritten rows, writer version, table row limit) for one read attempt, or None
+    to retry because a flush is writing rows right now.
+
+    The user's buffered rows are newer than every stored one, so they open the first page
+    and the table fills the rest; older pages are read from the table only.
+    """
+    if before_id is not None:
+        return [], None, limit
+    unwritten, version = writer.unwritten(user_id)
+    if version % 2:
+        return None
+    return unwritten, version, limit - len(unwritten) if limit else limit
+
+
+def get_chat_history_page(user_id, limit=20, before_id=None):
+    """
+    Retrieve one page of a user's chat history, newest first.
+
+    Rows still buffered by the write-behind writer are read from the buffer (with a None
+    ID), so a read never waits for a flush. If a flush ends during the read, the read is
+    retried; only when one user has a full page of unwritten rows (or flushes keep
+    overlapping the read) are they written first.
+
+    Args:
+        user_id (str): The user's ID.
+        limit (int): Page size.
+        before_id (int, optional): `next_before_id` of the previous page.
+
+    Returns:
+        dict: `turns` as (id, user query, chatbot response) tuples and `next_before_id`,
+            None on the last page.
+    """
+    writer = get_chat_history_writer()
+    for _ in range(CHAT_HISTORY_READ_ATTEMPTS):
+        plan = _read_plan(writer, user_id, limit, before_id)
+        if plan is None:
+            time.sleep(CHAT_HISTORY_READ_RETRY_DELAY)
+            continue
+        unwritten, version, stored_limit = plan
+        if stored_limit is not None and stored_limit <= 0:
+            break
+        rows = writer.store.fetch(user_id, limit=stored_limit, before_id=before_id)
+        if version is None or writer.version == version:
+            return _page(unwritten, rows, limit)
+
+    writer.flush()
+    return _page([], writer.store.fetch(user_id, limit=limit, before_id=before_id), limit)
+
+
+async def aget_chat_history_page(user_id, limit=20, before_id=None):
+    """
+    Async `get_chat_history_page`: the page is read with the async driver, and the rare
+    fallback flush runs in a worker thread.
+    """
+    writer = get_chat_history_writer()
+    store = get_async_chat_history_store()
+    for _ in range(CHAT_HISTORY_READ_ATTEMPTS):
+        plan = _read_plan(writer, user_id, limit, before_id)
+        if plan is None:
+            await asyncio.sleep(CHAT_HISTORY_READ_RETRY_DELAY)
+            continue
+        unwritten, version, stored_limit = plan
+        if stored_limit is not None and stored_limit <= 0:
+            break
+        rows = await store.fetch(user_id, limit=stored_limit, before_id=before_id)
+        if version is None or writer.version == version:
+            return _page(unwritten, rows, limit)
+
+    await asyncio.to_thread(writer.flush)
+    return _page([], await store.fetch(user_id, limit=limit, before_id=before_id), limit)
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def get_recent_turns(user_id, max_turns=CHAT_HISTORY_MAX_TURNS, max_tokens=CHAT_HISTORY_MAX_TOKENS):
+    """
+    Return the last turns of a user as the `chat_history` of the retrieval chain.
+
+    At most `max_turns` turns are returned, fewer if they would exceed about `max_tokens`
+    tokens. Turns come from the per-user LRU and only hit the database (one indexed,
+    LIMITed query) when the user isn't cached, so the cost doesn't grow with the
+    account's age.
+
+    Args:
+        user_id (str): The user's ID.
+        max_turns (int): Maximum number of turns.
+        max_tokens (int): Approximate token budget for the turns.
+
+    Returns:
+        list: (user query, chatbot response) tuples, oldest first.
+    """
+    turns, token = recent_turns.get(user_id)
+    metrics.inc("rag_recent_turns_total", result="miss" if turns is None else "hit")
+    if turns is None:
+        rows = get_chat_history_page(user_id, limit=recent_turns.max_turns)["turns"]
+        turns = [(row[1], row[2]) for row in reversed(rows)]
+        recent_turns.put(user_id, turns, token)
+    return _token_window(turns, max_turns, max_tokens)
+
+
+async def aget_recent_turns(user_id, max_turns=CHAT_HISTORY_MAX_TURNS, max_tokens=CHAT_HISTORY_MAX_TOKENS):
+    """
+    Async `get_recent_turns`: cache misses are read with the async driver.
+    """
+    turns, token = recent_turns.get(user_id)
+    metrics.inc("rag_recent_turns_total", result="miss" if turns is None else "hit")
+    if turns is None:
+        rows = (await aget_chat_history_page(user_id, limit=recent_turns.max_turns))["turns"]
+        turns = [(row[1], row[2]) for row in reversed(rows)]
+        recent_turns.put(user_id, turns, token)
+    return _token_window(turns, max_turns, max_tokens)
+
+
+def _token_window(turns, max_turns, max_tokens):
+    """
+    Return the last `max_turns` turns that fit in about `max_tokens` tokens, oldest first.
+    """
+    window, tokens = [], 0
+    for user_query, chatbot_answer in reversed(turns[-max_turns:] if max_turns else []):
+        tokens += _estimate_tokens(user_query) + _estimate_tokens(chatbot_answer)
+        if tokens > max_tokens:
+            break
+        window.append((user_query, chatbot_answer))
+    return window[::-1]
 
 
 # # SQL query to create the table
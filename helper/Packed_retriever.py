@@ -0,0 +1,24 @@
+from typing import List
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from helper.Context_packing import pack_context, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
+
+
+class PackedRetriever(BaseRetriever):
+    """
+    Retriever wrapper returning packed context (see `Context_packing.pack_context`) instead of raw chunks.
+    """
+
+    retriever: BaseRetriever
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    threshold: float = CONTEXT_DEDUP_THRESHOLD
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        documents = self.retriever.invoke(query)
+        return pack_context(documents, self.token_budget, self.threshold)
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        documents = await self.retriever.ainvoke(query)
+        return pack_context(documents, self.token_budget, self.threshold)
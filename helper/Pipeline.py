@@ -0,0 +1,104 @@
+import os
+import queue
+import threading
+from typing import Callable, Iterable, List
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+_DONE = object()
+
+
+def _put(out_queue: queue.Queue, item, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            out_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(in_queue: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def run_pipeline(source: Iterable, stages: List[Callable], queue_size: int = PIPELINE_QUEUE_SIZE) -> int:
+    """
+    Stream items from `source` through `stages`, connected by bounded queues.
+
+    The source is iterated on its own thread and every stage but the last runs on its own
+    thread; the last stage runs on the calling thread. Each queue holds at most
+    `queue_size` items, so a slow stage applies backpressure upstream and at most
+    `(len(stages) + 1) * queue_size` items are in memory at once, however long the source is.
+
+    Args:
+        source (Iterable): Items to process, typically a generator.
+        stages (List[Callable]): Functions applied in order; each takes the previous stage's output.
+        queue_size (int): Capacity of each queue between stages.
+
+    Returns:
+        int: The number of items that went through the last stage.
+
+    Raises:
+        Exception: The first error raised by the source or any stage; the pipeline is stopped.
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+
+    def produce():
+        try:
+            for item in source:
+                if stop.is_set():
+                    return
+                _put(queues[0], item, stop)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(queues[0], _DONE, stop)
+
+    def work(stage, in_queue, out_queue):
+        try:
+            while True:
+                item = _get(in_queue, stop)
+                if item is _DONE:
+                    return
+                _put(out_queue, stage(item), stop)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(out_queue, _DONE, stop)
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    for position, stage in enumerate(stages[:-1]):
+        threads.append(threading.Thread(target=work, args=(stage, queues[position], queues[position + 1]),
+                                        daemon=True))
+    for thread in threads:
+        thread.start()
+
+    count = 0
+    try:
+        while True:
+            item = _get(queues[-1], stop)
+            if item is _DONE:
+                break
+            stages[-1](item)
+            count += 1
+    except Exception as e:
+        errors.append(e)
+        stop.set()
+    finally:
+        if errors:
+            stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    return count
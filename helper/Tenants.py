@@ -0,0 +1,117 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+# Lowercase letters, digits, "-" and "_": valid as a Pinecone namespace, a directory name and a key prefix
+TENANT_PATTERN = re.compile(r"[a-z0-9][a-z0-9_-]{0,62}")
+# Comma-separated tenants accepted by the API; empty accepts any valid name
+TENANTS = os.getenv("TENANTS", "")
+# Tenants whose clients, caches and metric series are kept in memory at once (least recently used are evicted)
+MAX_TENANTS = int(os.getenv("MAX_TENANTS", "32"))
+# Starts the user IDs of named tenants; escaped in user IDs, so no user ID can produce it
+USER_SEPARATOR = "|"
+
+
+class InvalidTenantError(ValueError):
+    """Raised for a tenant name that can't be used as a namespace, or one that is not allowed."""
+
+
+ALLOWED_TENANTS = {tenant.strip().lower() for tenant in TENANTS.split(",") if tenant.strip()}
+
+
+def normalize_tenant(tenant: Optional[str]) -> Optional[str]:
+    """
+    Return the canonical name of a tenant (a brand, catalog or any other collection of
+    documents searched on its own), or None for the default tenant.
+
+    Names are case-insensitive; an empty name means the default tenant, whose content
+    lives in the default namespace and the original (un-suffixed) local files, so
+    deployments without tenants are unchanged.
+
+    Raises:
+        InvalidTenantError: If the name has other characters than letters, digits, "-" and "_",
+            or TENANTS is set and does not list it.
+    """
+    tenant = (tenant or "").strip().lower()
+    if not tenant:
+        return None
+    if not TENANT_PATTERN.fullmatch(tenant):
+        raise InvalidTenantError(f"Invalid tenant '{tenant}': use up to 63 letters, digits, '-' or '_'.")
+    if ALLOWED_TENANTS and tenant not in ALLOWED_TENANTS:
+        raise InvalidTenantError(f"Unknown tenant '{tenant}'.")
+    return tenant
+
+
+def tenant_key(name: str, tenant: Optional[str]) -> str:
+    """
+    Scope a key (registry entry, cache key, user ID) to a tenant; the default tenant keeps the bare key.
+    """
+    return f"{tenant}:{name}" if tenant else name
+
+
+def tenant_user(user_id: str, tenant: Optional[str]) -> str:
+    """
+    Return the ID a user's chat history is kept under in a tenant: "|acme|alice".
+
+    Any user ID is accepted (e.g. Twilio's "whatsapp:+15551234567"). "\\" and "|" in it are
+    escaped with a backslash, so an escaped ID never starts with an unescaped "|": IDs of the
+    default tenant (the escaped ID alone, usually the ID unchanged) can't collide with the
+    "|<tenant>|" IDs of named tenants, nor can two tenants' IDs collide with each other.
+    """
+    escaped = user_id.replace("\\", "\\\\").replace(USER_SEPARATOR, "\\" + USER_SEPARATOR)
+    return f"{USER_SEPARATOR}{tenant}{USER_SEPARATOR}{escaped}" if tenant else escaped
+
+
+def tenant_path(path: str, tenant: Optional[str]) -> str:
+    """
+    Return where a tenant keeps its copy of a local file: `<dir>/tenants/<tenant>/<file>`.
+    """
+    if not tenant:
+        return path
+    return os.path.join(os.path.dirname(path), "tenants", tenant, os.path.basename(path))
+
+
+class ActiveTenants:
+    """
+    The tenants with state in this process, least recently used first.
+
+    Per-tenant clients, caches and metric series are created on a tenant's first request,
+    so `use` is called for every request; once more than `capacity` tenants were seen,
+    the least recently used one is evicted: every callback registered with `on_evict`
+    drops its state for that tenant, which is rebuilt if the tenant comes back.
+    """
+
+    def __init__(self, capacity: int = MAX_TENANTS):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._tenants = OrderedDict()
+        self._callbacks: List[Callable[[str], None]] = []
+        self.evictions = 0
+
+    def on_evict(self, callback: Callable[[str], None]):
+        """Call `callback(tenant)` whenever a tenant is evicted."""
+        self._callbacks.append(callback)
+
+    def use(self, tenant: Optional[str]):
+        """Mark `tenant` as used now, evicting the least recently used tenants over capacity."""
+        if not tenant:
+            return
+        with self._lock:
+            self._tenants[tenant] = None
+            self._tenants.move_to_end(tenant)
+            evicted = []
+            while len(self._tenants) > self.capacity:
+                evicted.append(self._tenants.popitem(last=False)[0])
+            self.evictions += len(evicted)
+        for tenant in evicted:
+            for callback in self._callbacks:
+                callback(tenant)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"active": len(self._tenants), "capacity": self.capacity, "evictions": self.evictions}
+
+
+active_tenants = ActiveTenants()
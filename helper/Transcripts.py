@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from langchain_core.documents import Document
+from helper.Clients import registry
+from helper.Metrics import metrics
+
+TRANSCRIPT_CACHE_PATH = os.getenv("TRANSCRIPT_CACHE_PATH", os.path.join(".cache", "transcripts.sqlite3"))
+TRANSCRIPT_LANGUAGES = [language.strip() for language in os.getenv("TRANSCRIPT_LANGUAGES", "ar,en").split(",")]
+TRANSCRIPT_CONCURRENCY = int(os.getenv("TRANSCRIPT_CONCURRENCY", "4"))
+TRANSCRIPT_RATE_LIMIT = float(os.getenv("TRANSCRIPT_RATE_LIMIT", "5"))
+TRANSCRIPT_MAX_RETRIES = int(os.getenv("TRANSCRIPT_MAX_RETRIES", "3"))
+
+
+class TranscriptUnavailable(LookupError):
+    """
+    Raised when a video has no transcript in the requested languages (or is private,
+    removed, etc.). Not retried.
+    """
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: `acquire` blocks so that at most `rate` calls per second
+    start on average, with bursts of up to `burst` calls. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Take the token now, even if it is not there yet, so waiting callers are served in order
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+
+
+class TranscriptCache:
+    """
+    Persistent transcript cache stored in SQLite, keyed by video ID and language.
+
+    Transcripts rarely change, so cached entries never expire; re-ingesting a video, or
+    retrying a bulk ingestion that partly failed, does not fetch it again.
+    """
+
+    def __init__(self, path: str = TRANSCRIPT_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcripts (
+                video_id TEXT NOT NULL,
+                language TEXT NOT NULL,
+                text TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (video_id, language)
+            )
+        """)
+        self._conn.commit()
+
+    def get(self, video_id: str, languages: List[str]) -> Optional[Tuple[str, str]]:
+        """
+        Return the cached (language, text) of `video_id` in the first of `languages` available, or None.
+        """
+        with self._lock:
+            rows = dict(self._conn.execute("SELECT language, text FROM transcripts WHERE video_id = ?",
+                                           (video_id,)).fetchall())
+        for language in languages:
+            if language in rows:
+                return language, rows[language]
+        return None
+
+    def put(self, video_id: str, language: str, text: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO transcripts (video_id, language, text, fetched_at) "
+                               "VALUES (?, ?, ?, ?)", (video_id, language, text, time.time()))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+
+
+class YouTubeTranscriptSource:
+    """
+    Fetches transcripts from YouTube with `youtube_transcript_api`.
+
+    A source is any object with `fetch(video_id, languages) -> (language, text)` raising
+    `TranscriptUnavailable` when there is nothing to fetch; `benchmarks/Fakes.py` has a
+    local one for tests and benchmarks.
+    """
+
+    def fetch(self, video_id: str, languages: List[str]) -> Tuple[str, str]:
+        import youtube_transcript_api as api
+        # Blocked or failed requests are worth retrying; other errors mean there is no transcript
+        transient = tuple(getattr(api, name) for name in ("RequestBlocked", "IpBlocked", "YouTubeRequestFailed")
+                          if hasattr(api, name))
+        try:
+            if hasattr(api.YouTubeTranscriptApi, "get_transcript"):  # youtube-transcript-api < 1.0
+                transcript = api.YouTubeTranscriptApi.list_transcripts(video_id).find_transcript(languages)
+                return transcript.language_code, " ".join(item["text"] for item in transcript.fetch())
+            transcript = api.YouTubeTranscriptApi().fetch(video_id, languages=languages)
+            return transcript.language_code, " ".join(snippet.text for snippet in transcript)
+        except transient:
+            raise
+        except api.CouldNotRetrieveTranscript as e:
+            raise TranscriptUnavailable(f"{type(e).__name__}: {video_id}") from None
+
+
+def get_transcript_source():
+    """Return the shared transcript source."""
+    return registry.get("transcript_source", YouTubeTranscriptSource)
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """Return the shared transcript cache."""
+    path = os.getenv("TRANSCRIPT_CACHE_PATH", TRANSCRIPT_CACHE_PATH)
+    return registry.get("transcript_cache", lambda: TranscriptCache(path), config=(path,))
+
+
+def get_rate_limiter(rate: float = TRANSCRIPT_RATE_LIMIT) -> RateLimiter:
+    """Return the process-wide transcript rate limiter, shared by all ingestion jobs."""
+    return registry.get("transcript_rate_limiter", lambda: RateLimiter(rate, burst=max(1, int(rate))),
+                        config=(rate,))
+
+
+def get_transcript_pool(max_workers: int = TRANSCRIPT_CONCURRENCY) -> ThreadPoolExecutor:
+    """Return the shared thread pool transcripts are fetched on."""
+    return registry.get("transcript_pool",
+                        lambda: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="transcript"),
+                        config=(max_workers,))
+
+
+def split_urls(values: List[str]) -> List[str]:
+    """
+    Split form values that may each hold several URLs (one per line, or separated by
+    spaces or commas) and drop duplicates, keeping their order.
+    """
+    urls = (url for value in values or [] for url in re.split(r"[\s,]+", value) if url)
+    return list(dict.fromkeys(urls))
+
+
+def transcript_document(url: str, video_id: str, language: str, text: str) -> Document:
+    """
+    Return the transcript as a Document, in the format `loading_youtube_transcript` always used.
+    """
+    return Document(page_content=f"video-URL: {url} \n{text}",
+                    metadata={"url": url, "video_id": video_id, "language": language})
+
+
+def fetch_transcript(video_id: str, languages: List[str] = TRANSCRIPT_LANGUAGES, source=None,
+                     cache: Optional[TranscriptCache] = None, limiter: Optional[RateLimiter] = None,
+                     max_retries: int = TRANSCRIPT_MAX_RETRIES) -> Tuple[str, str]:
+    """
+    Return the (language, text) transcript of a video, from the cache or the source.
+
+    Source calls go through the rate limiter and are retried with exponential backoff,
+    except when the transcript does not exist (`TranscriptUnavailable`).
+    """
+    cache = cache or get_transcript_cache()
+    cached = cache.get(video_id, languages)
+    metrics.inc("rag_transcript_cache_total", result="hit" if cached else "miss")
+    if cached:
+        return cached
+
+    source = source or get_transcript_source()
+    limiter = limiter or get_rate_limiter()
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            with metrics.span("youtube_transcript"):
+                language, text = source.fetch(video_id, languages)
+            break
+        except TranscriptUnavailable:
+            raise
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ Transcript fetch for {video_id} failed ({e}), retrying in {delay}s")
+            time.sleep(delay)
+    cache.put(video_id, language, text)
+    return language, text
+
+
+def iter_transcripts(urls: List[str], languages: List[str] = TRANSCRIPT_LANGUAGES,
+                     max_workers: int = TRANSCRIPT_CONCURRENCY,
+                     report: Optional[Dict[str, str]] = None) -> Iterator[Document]:
+    """
+    Fetch the transcripts of many videos concurrently and yield one Document per video.
+
+    At most `max_workers` fetches run at once (on a shared pool) and at most
+    TRANSCRIPT_RATE_LIMIT start per second across the process. Cached transcripts are
+    served without calling YouTube. Documents are yielded in URL order, with at most
+    `2 * max_workers` fetches in flight, so memory stays bounded for long lists.
+
+    A video that fails is reported and skipped without affecting the others.
+
+    Args:
+        urls (List[str]): YouTube URLs or video IDs. Several URLs of the same video are fetched once.
+        languages (List[str]): Preferred transcript languages, in order.
+        max_workers (int): Fetches running at once.
+        report (Dict[str, str], optional): Filled with url -> error for the videos that failed.
+
+    Returns:
+        Iterator[Document]: The transcripts, with `url`, `video_id` and `language` metadata.
+    """
+    from helper.Load_data import extract_video_id
+    report = {} if report is None else report
+    videos, seen = deque(), set()
+    for url in urls:
+        video_id = extract_video_id(url)
+        if not video_id:
+            report[url] = "Invalid YouTube URL or video ID"
+            print(f"❌ Invalid YouTube URL or video ID: {url}")
+        elif video_id not in seen:
+            seen.add(video_id)
+            videos.append((url, video_id))
+
+    pool = get_transcript_pool(max_workers)
+    in_flight = deque()
+    while videos or in_flight:
+        while videos and len(in_flight) < 2 * max_workers:
+            url, video_id = videos.popleft()
+            in_flight.append((url, video_id, pool.submit(fetch_transcript, video_id, languages)))
+
+        url, video_id, future = in_flight.popleft()
+        try:
+            language, text = future.result()
+        except Exception as e:
+            report[url] = str(e)
+            print(f"❌ Could not retrieve transcript of {url}: {e}")
+            continue
+        yield transcript_document(url, video_id, language, text)
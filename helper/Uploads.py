@@ -0,0 +1,126 @@
+import os
+import tempfile
+from typing import BinaryIO, Iterable, List, Tuple
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(".cache", "uploads"))
+UPLOAD_CHUNK_SIZE = 1 << 20
+UPLOAD_MAX_FILE_MB = int(os.getenv("UPLOAD_MAX_FILE_MB", "200"))
+UPLOAD_MAX_TOTAL_MB = int(os.getenv("UPLOAD_MAX_TOTAL_MB", "1024"))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "50"))
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+class UploadError(ValueError):
+    """
+    Raised for an upload that cannot be ingested (unsupported type, duplicate name, too many files).
+    """
+
+
+class UploadTooLargeError(UploadError):
+    """
+    Raised when an uploaded file, or a batch of them, exceeds the configured size limit.
+    """
+
+
+def upload_name(filename: str) -> str:
+    """
+    Return the client-supplied file name without any directory part.
+
+    The name identifies the document (its `source` and manifest entry); it is never used
+    as a path on disk.
+    """
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if not name:
+        raise UploadError("Uploaded file has no name")
+    if not name.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise UploadError(f"Unsupported file format: {name} (expected {', '.join(SUPPORTED_EXTENSIONS)})")
+    return name
+
+
+def spool_file(source: BinaryIO, filename: str, max_bytes: int = UPLOAD_MAX_FILE_MB << 20) -> Tuple[str, int]:
+    """
+    Copy an uploaded file to a new, uniquely named file under UPLOAD_DIR, one chunk at a time.
+
+    Only UPLOAD_CHUNK_SIZE bytes are held in memory, whatever the file size, and concurrent
+    uploads of files with the same name never overwrite each other. The file keeps its
+    extension, which selects the loader.
+
+    Args:
+        source (BinaryIO): The uploaded file object.
+        filename (str): The client-supplied file name.
+        max_bytes (int): Size limit; the partial copy is removed when it is exceeded.
+
+    Returns:
+        tuple: The path of the spooled file and its size in bytes.
+
+    Raises:
+        UploadTooLargeError: If the file is larger than `max_bytes`.
+    """
+    name = upload_name(filename)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix="upload-", suffix=os.path.splitext(name)[1].lower())
+    size = 0
+    try:
+        with os.fdopen(descriptor, "wb") as spooled_file:
+            for chunk in iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"{name} is larger than {max_bytes >> 20} MB")
+                spooled_file.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size
+
+
+def spool_files(uploads: Iterable[Tuple[BinaryIO, str]], max_file_bytes: int = UPLOAD_MAX_FILE_MB << 20,
+                max_total_bytes: int = UPLOAD_MAX_TOTAL_MB << 20,
+                max_files: int = UPLOAD_MAX_FILES) -> List[Tuple[str, str]]:
+    """
+    Spool a batch of uploads (see `spool_file`), enforcing per-file, per-batch and file-count limits.
+
+    Either every file is spooled or, on error, none is left behind.
+
+    Args:
+        uploads (Iterable[Tuple[BinaryIO, str]]): (file object, client-supplied file name) pairs.
+
+    Returns:
+        list: (spooled path, file name) pairs, in upload order.
+
+    Raises:
+        UploadError: On an unsupported, unnamed or duplicate file, or too many files.
+        UploadTooLargeError: If a file or the whole batch is too large.
+    """
+    spooled, names, total = [], set(), 0
+    try:
+        for source, filename in uploads:
+            name = upload_name(filename)
+            if name in names:
+                raise UploadError(f"Duplicate file name: {name}")
+            if len(spooled) >= max_files:
+                raise UploadError(f"Too many files (at most {max_files} per upload)")
+            names.add(name)
+            limit = min(max_file_bytes, max_total_bytes - total)
+            try:
+                path, size = spool_file(source, name, max_bytes=limit)
+            except UploadTooLargeError:
+                if limit < max_file_bytes:
+                    raise UploadTooLargeError(f"The upload exceeds {max_total_bytes >> 20} MB in total") from None
+                raise
+            spooled.append((path, name))
+            total += size
+    except BaseException:
+        remove_spooled(path for path, _ in spooled)
+        raise
+    return spooled
+
+
+def remove_spooled(paths: Iterable[str]):
+    """
+    Delete spooled files, ignoring the ones that are already gone.
+    """
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
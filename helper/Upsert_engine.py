@@ -0,0 +1,282 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+from langchain_core.documents import Document
+from helper.Chunk_ids import vector_id
+from helper.Metrics import metrics
+from helper.Pipeline import run_pipeline
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+UPSERT_MAX_IN_FLIGHT = int(os.getenv("UPSERT_MAX_IN_FLIGHT", "4"))
+UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "5"))
+# Passes of `UpsertEngine.resume` over the chunks that still failed, before giving up
+UPSERT_RESUME_PASSES = int(os.getenv("UPSERT_RESUME_PASSES", "1"))
+
+
+class UpsertReport:
+    """
+    Outcome of an `UpsertEngine` run.
+
+    `failed` keeps the chunks of every batch that still failed after all retries, so the
+    run can be resumed with `UpsertEngine.resume(report)` without redoing the batches
+    that succeeded. `callback_failed` keeps the records (without their vectors) that were
+    stored but whose `on_upserted` callback raised; they count as upserted and `resume`
+    only runs the callback for them again.
+    """
+
+    def __init__(self):
+        self.chunks = 0
+        self.batches = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.failed: List[Document] = []
+        self.callback_failed: List[dict] = []
+        self.errors: List[str] = []
+        self.skipped_files: List[str] = []
+        self.failed_files: List[str] = []
+        self.skipped_chunks = 0
+        self.deleted = 0
+
+    def absorb(self, resumed: "UpsertReport"):
+        """
+        Fold in the report of `UpsertEngine.resume(self)`: its counters are added, and
+        what still failed after the resume replaces what had failed before it.
+        """
+        self.chunks += resumed.chunks
+        self.batches += resumed.batches
+        self.retries += resumed.retries
+        self.seconds += resumed.seconds
+        self.failed = resumed.failed
+        self.callback_failed = resumed.callback_failed
+        self.errors.extend(resumed.errors)
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {"chunks": self.chunks, "batches": self.batches, "retries": self.retries,
+                "failed_chunks": len(self.failed), "callback_failed_chunks": len(self.callback_failed),
+                "seconds": round(self.seconds, 3),
+                "chunks_per_sec": round(self.chunks_per_sec, 1), "errors": self.errors[-5:],
+                "skipped_files": self.skipped_files, "failed_files": self.failed_files,
+                "skipped_chunks": self.skipped_chunks, "deleted": self.deleted}
+
+
+class UpsertError(RuntimeError):
+    """
+    Raised when some batches still failed after all retries (or their `on_upserted` callback
+    failed); carries the `UpsertReport`.
+    """
+
+    def __init__(self, report: UpsertReport):
+        super().__init__(f"{len(report.failed)} chunks failed to upsert, {len(report.callback_failed)} to index "
+                         f"after upsert: {report.errors[-1] if report.errors else ''}")
+        self.report = report
+
+
+class UpsertEngine:
+    """
+    Embed and upsert chunks in batches with bounded concurrency and per-batch retries.
+
+    Chunks are read lazily from the source, embedded in batches of `embed_batch_size` and
+    upserted in batches of `upsert_batch_size`. At most `max_in_flight` upsert batches run
+    at once; when they are all busy, embedding (and loading upstream of it) waits, so a slow
+    vector store applies backpressure instead of piling chunks up in memory. Each embed and
+    upsert call is retried with exponential backoff and jitter.
+
+    `index` is anything with an `upsert(vectors=[...], namespace=...)` method: a Pinecone
+    `Index`, or `InMemoryIndex` for local runs. `on_progress` is called with the number of
+    chunks upserted so far after every batch, and `on_upserted` with the records of every
+    batch once it is stored (e.g. to update the lexical index).
+    """
+
+    def __init__(self, embeddings, index, embed_batch_size: int = EMBED_BATCH_SIZE,
+                 upsert_batch_size: int = UPSERT_BATCH_SIZE, max_in_flight: int = UPSERT_MAX_IN_FLIGHT,
+                 max_retries: int = UPSERT_MAX_RETRIES, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 namespace: Optional[str] = None, on_progress: Optional[Callable[[int], None]] = None,
+                 on_upserted: Optional[Callable[[List[dict]], None]] = None):
+        self.embeddings = embeddings
+        self.index = index
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.namespace = namespace
+        self.on_progress = on_progress
+        self.on_upserted = on_upserted
+
+    def _retry(self, work, report: UpsertReport):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return work()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"⚠️ {type(e).__name__}: {e}. Retrying in {delay:.1f}s "
+                      f"({attempt + 1}/{self.max_retries})")
+                report.retries += 1
+                metrics.inc("rag_upsert_retries_total")
+                time.sleep(delay)
+
+    def _notify(self, records: List[dict], report: UpsertReport, lock: threading.Lock):
+        """
+        Run `on_upserted` for stored records; a failure is recorded in `report.callback_failed`,
+        not `report.failed`, since the vectors themselves are stored.
+        """
+        if not self.on_upserted:
+            return
+        try:
+            self.on_upserted(records)
+        except Exception as e:
+            with lock:
+                report.callback_failed.extend({"id": record["id"], "metadata": record["metadata"]}
+                                              for record in records)
+                report.errors.append(f"on_upserted: {e}")
+            metrics.inc("rag_upsert_callback_failures_total", len(records))
+
+    @staticmethod
+    def _batched(documents: Iterable[Document], batch_size: int) -> Iterator[Dict[str, Document]]:
+        batch = {}
+        for document in documents:
+            batch.setdefault(vector_id(document.page_content), document)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = {}
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _to_records(batch: Dict[str, Document], vectors: List[List[float]]):
+        """
+        Build upsert records; the chunk text is stored under the `text` metadata key read
+        back by `PineconeVectorStore`. Pinecone rejects null metadata values, so they are dropped.
+        """
+        records = []
+        for (chunk_id, document), vector in zip(batch.items(), vectors):
+            metadata = {key: value for key, value in document.metadata.items() if value is not None}
+            metadata["text"] = document.page_content
+            records.append({"id": chunk_id, "values": vector, "metadata": metadata})
+        return records
+
+    def run(self, documents: Iterable[Document]) -> UpsertReport:
+        """
+        Embed and upsert `documents`.
+
+        Args:
+            documents (Iterable[Document]): Chunks to index, typically `Load_data.stream_data(...)`.
+
+        Returns:
+            UpsertReport: Counters, throughput and the chunks of batches that failed.
+        """
+        report = UpsertReport()
+        lock = threading.Lock()
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        started = time.perf_counter()
+
+        def embed(batch):
+            try:
+                texts = [document.page_content for document in batch.values()]
+                with metrics.span("embed_batch"):
+                    vectors = self._retry(lambda: self.embeddings.embed_documents(texts), report)
+                return batch, self._to_records(batch, vectors)
+            except Exception as e:
+                with lock:
+                    report.failed.extend(batch.values())
+                    report.errors.append(f"embed: {e}")
+                metrics.inc("rag_chunks_failed_total", len(batch))
+                return batch, []
+
+        def upsert(batch, records):
+            try:
+                with metrics.span("upsert_batch"):
+                    self._retry(lambda: self.index.upsert(vectors=records, namespace=self.namespace), report)
+            except Exception as e:
+                with lock:
+                    report.failed.extend(batch[record["id"]] for record in records)
+                    report.errors.append(f"upsert: {e}")
+                metrics.inc("rag_chunks_failed_total", len(records))
+                slots.release()
+                return
+
+            try:
+                metrics.inc("rag_chunks_upserted_total", len(records))
+                self._notify(records, report, lock)
+                with lock:
+                    report.chunks += len(records)
+                    report.batches += 1
+                    chunks = report.chunks
+                if self.on_progress:
+                    self.on_progress(chunks)
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            def submit(item):
+                batch, records = item
+                for start in range(0, len(records), self.upsert_batch_size):
+                    slots.acquire()
+                    executor.submit(upsert, batch, records[start:start + self.upsert_batch_size])
+
+            _ = run_pipeline(self._batched(documents, self.embed_batch_size), [embed, submit])
+
+        report.seconds = time.perf_counter() - started
+        print(f"📊 Upserted {report.chunks} chunks in {report.seconds:.2f}s "
+              f"({report.chunks_per_sec:.1f} chunks/s, {report.retries} retries, {len(report.failed)} failed)")
+        return report
+
+    def resume(self, report: UpsertReport) -> UpsertReport:
+        """
+        Retry only the chunks that failed in a previous run: failed batches are embedded and
+        upserted again, and stored chunks whose `on_upserted` callback failed only get the
+        callback again (they are not re-embedded or re-upserted).
+        """
+        resumed = self.run(report.failed)
+        if report.callback_failed:
+            self._notify(report.callback_failed, resumed, threading.Lock())
+        return resumed
+
+
+class InMemoryIndex:
+    """
+    Local stand-in for a Pinecone `Index`, for running the ingestion path without Pinecone.
+
+    `fail_every` makes every n-th upsert call raise, to exercise retries and resume.
+    """
+
+    def __init__(self, fail_every: int = 0, latency: float = 0.0):
+        self.vectors: Dict[Optional[str], Dict[str, dict]] = {}
+        self.fail_every = fail_every
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors: List[dict], namespace: Optional[str] = None):
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_every and calls % self.fail_every == 0:
+            raise ConnectionError("simulated upsert failure")
+        with self._lock:
+            store = self.vectors.setdefault(namespace, {})
+            for record in vectors:
+                store[record["id"]] = record
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids: List[str], namespace: Optional[str] = None):
+        with self._lock:
+            store = self.vectors.get(namespace, {})
+            for chunk_id in ids:
+                store.pop(chunk_id, None)
+
+    def count(self, namespace: Optional[str] = None) -> int:
+        return len(self.vectors.get(namespace, {}))
@@ -1,9 +1,17 @@
 import os
+from typing import Callable, Dict, Iterable, List, Optional
 from dotenv import load_dotenv
-from pinecone import PineconeProtocolError
-from pinecone import Pinecone, ServerlessSpec
-from langchain_pinecone import PineconeVectorStore
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_core.documents import Document
+from helper.Clients import registry, get_pinecone_client, vector_backend, INDEX_NAME
+from helper.Chunk_ids import vector_id
+from helper.Answer_cache import get_answer_cache
+from helper.Lexical_index import get_lexical_index
+from helper.Metrics import metrics
+from helper.Manifest import get_manifest, file_fingerprint
+from helper.Load_data import stream_data, PARSE_WORKERS
+from helper.Upsert_engine import UpsertEngine, UpsertError, UpsertReport, UPSERT_MAX_IN_FLIGHT, UPSERT_RESUME_PASSES
+
+DELETE_BATCH_SIZE = 1000
 
 _ = load_dotenv(override=True)
 
@@ -11,9 +19,9 @@ def create_index(index_name: str, vect_length: int=1536):
     """
     Create an index in Pinecone for storing vectors.
 
-    This function deletes all existing indexes and creates a new index
-    if it does not already exist. The index is created with the specified
-    name and vector length, using the 'cosine' similarity metric.
+    The index is created with the specified name and vector length, using the 'cosine'
+    similarity metric, only if it does not already exist: existing indexes (and the
+    tenants' namespaces in them) are never deleted.
 
     Args:
         index_name (str): The name of the index to create.
@@ -23,94 +31,266 @@ def create_index(index_name: str, vect_length: int=1536):
     # Run this function to create a new index in Pinecone  
     # create_index(index_name="rag-customer-support", vect_length=768)
     """
+    from pinecone import Pinecone, ServerlessSpec
     pinecone = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-    try:
-        print('Deleting all indexes')
-        _ = [pinecone.delete_index(name=index_name['name']) for index_name in pinecone.list_indexes()]
-    except Exception as e:
-        print('Error In Deleting Indexes: {}'.format(e))
-        
-    if index_name not in pinecone.list_indexes():
-        print('Creating Index: {}'.format(index_name))
-        pinecone.create_index(
-            name=index_name,
-            dimension=vect_length,
-            metric='cosine',
-            spec=ServerlessSpec(cloud='aws', region='us-east-1')
-        )
-        print('Done Creating Index: {}'.format(index_name))
+    if index_name in [index['name'] for index in pinecone.list_indexes()]:
+        print('Index already exists: {}'.format(index_name))
+        return
+
+    print('Creating Index: {}'.format(index_name))
+    pinecone.create_index(
+        name=index_name,
+        dimension=vect_length,
+        metric='cosine',
+        spec=ServerlessSpec(cloud='aws', region='us-east-1')
+    )
+    print('Done Creating Index: {}'.format(index_name))
         
 
-def add_documents_to_pinecone(documents: str):
+def _open_vector_index(backend: str, client=None):
+    if backend == "local":
+        from helper.Local_vector_store import get_local_index
+        print("✅ Using the local vector index")
+        return get_local_index()
+
+    print(f"🔹 Using PINECONE_API_KEY: {os.getenv('PINECONE_API_KEY', '')[:5]}... (hidden for security)")
+    from pinecone import PineconeProtocolError
+    try:
+        index = client.Index(INDEX_NAME)
+    except PineconeProtocolError:
+        print("⚠️ Pinecone connection timed out. Reinitializing...")
+        registry.clear("pinecone_client")
+        index = get_pinecone_client().Index(INDEX_NAME)
+
+    print("✅ Connect with Pinecone")
+    return index
+
+
+def get_vector_index():
     """
-    Adds documents to a Pinecone vector store.
+    Return the index chunks are upserted into: the Pinecone index, or the local
+    memory-mapped index when VECTOR_BACKEND=local.
+
+    The index handle is opened once per client through the registry, so calling this on
+    every request or upsert costs a dictionary lookup.
     """
-    try:
-        if not documents:
-            print("⚠️ No valid documents found for processing.")
-            return
-
-        # Debugging API Keys
-        google_api_key = os.getenv("GOOGLE_API_KEY")
-        pinecone_api_key = os.getenv("PINECONE_API_KEY")
-
-        if not google_api_key:
-            print("❌ Missing GOOGLE_API_KEY. Please check your .env file.")
-            return
-        if not pinecone_api_key:
-            print("❌ Missing PINECONE_API_KEY. Please check your .env file.")
-            return
-
-        # Debugging output
-        print(f"🔹 Using GOOGLE_API_KEY: {google_api_key[:5]}... (hidden for security)")
-        print(f"🔹 Using PINECONE_API_KEY: {pinecone_api_key[:5]}... (hidden for security)")
-
-        # Initialize Embeddings and Pinecone
-        embedding_model = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=google_api_key
-        )
-        
-        pinecone = Pinecone(api_key=pinecone_api_key)
-        index_name = "rag-customer-support"
-        
-        print("✅ Connect with Pinecone")
-
-        # index_list = pinecone.list_indexes()
-        # print(f"🔹 Available indexes: {index_list}")
-            
-        # if index_name not in index_list:
-        #     print(f"❌ Index '{index_name}' does not exist. Create the index first.")
-        #     return
-
-        # Initialize Vector Store
-        try:
-            print("🔥 Initialize vector-store \n")
-            index = pinecone.Index(index_name)
-            vector_store = PineconeVectorStore(
-                index_name=index,
-                embedding=embedding_model,
-                pinecone_api_key=pinecone_api_key,
-            )
-            print("Done Loading Vecotr-store")
-            
-        except PineconeProtocolError:
-            print("⚠️ Pinecone connection timed out. Reinitializing...")
-            pinecone = Pinecone(api_key=pinecone_api_key)
-            vector_store = PineconeVectorStore(
-                index_name=index_name,
-                embedding=embedding_model,
-                pinecone_api_key=pinecone_api_key,
-            )
-            vector_store.add_documents(documents=documents)
-            print("✅ Successfully added new documents after retrying.")
-            return
-
-
-        print("🚀 Adding new documents to Pinecone...")
-        vector_store.add_documents(documents=documents)
-        print("✅ Successfully added new documents to Pinecone.")
-
-    except Exception as e:
-        print(f"❌ Error while adding documents to Pinecone: {e}")
+    backend = vector_backend()
+    if backend == "local":
+        from helper.Local_vector_store import get_local_index
+        local_index = get_local_index()
+        return registry.get("vector_index", lambda: _open_vector_index(backend), config=(backend, local_index))
+
+    if not os.getenv("PINECONE_API_KEY"):
+        raise ValueError("❌ Missing PINECONE_API_KEY. Please check your .env file.")
+    client = get_pinecone_client()
+    return registry.get("vector_index", lambda: _open_vector_index(backend, client), config=(backend, client))
+
+
+def add_documents_to_pinecone(documents: Iterable[Document], max_in_flight: int = UPSERT_MAX_IN_FLIGHT,
+                              on_progress: Optional[Callable[[int], None]] = None, tenant: Optional[str] = None):
+    """
+    Adds documents to a Pinecone vector store (or the local index, see `get_vector_index`).
+
+    A tenant's chunks go to its own namespace and lexical index (see `Tenants.py`), so
+    its searches only scan its own content, however large the other tenants grow.
+
+    `documents` may be a list or a generator (see `Load_data.stream_data`). Chunks are
+    streamed through the `UpsertEngine`: embedded and upserted in batches, with a bounded
+    number of batches in flight and exponential-backoff retries per batch.
+
+    Chunks are embedded through the on-disk embedding cache and upserted under
+    deterministic content-hash IDs, so re-uploading the same file neither re-embeds
+    its chunks nor inserts duplicate vectors. Every stored batch is also added to the
+    BM25 lexical index used by hybrid retrieval.
+
+    Args:
+        documents (Iterable[Document]): The chunks to index.
+        max_in_flight (int): Upsert batches allowed to run at once for this call.
+        on_progress (Callable[[int], None], optional): Called with the number of chunks upserted so far.
+        tenant (str, optional): The tenant to index into; None for the default namespace.
+
+    Returns:
+        UpsertReport: Counters and chunks/sec throughput of the run.
+
+    Chunks that still failed after their retries get UPSERT_RESUME_PASSES more passes
+    (`UpsertEngine.resume`), which redo only those chunks, before the call gives up.
+
+    Raises:
+        UpsertError: If some chunks still failed after the resume passes, or could not be
+            added to the lexical index; its `report` lists them.
+    """
+    if documents is None:
+        print("⚠️ No valid documents found for processing.")
+        return None
+
+    # Debugging API Keys
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    if not google_api_key:
+        raise ValueError("❌ Missing GOOGLE_API_KEY. Please check your .env file.")
+    print(f"🔹 Using GOOGLE_API_KEY: {google_api_key[:5]}... (hidden for security)")
+
+    # Shared (cached) Embeddings and vector index clients
+    from helper.Embedding_cache import get_cached_embedding_model
+    embedding_model = get_cached_embedding_model()
+    index = get_vector_index()
+    lexical_index = get_lexical_index(tenant)
 
+    print("🚀 Adding new documents to Pinecone..." if not tenant else f"🚀 Adding new documents for {tenant}...")
+    engine = UpsertEngine(embedding_model, index, namespace=tenant, max_in_flight=max_in_flight,
+                          on_progress=on_progress, on_upserted=lexical_index.add_records)
+    with metrics.span("ingest"):
+        report = engine.run(documents)
+        for _ in range(UPSERT_RESUME_PASSES):
+            if not (report.failed or report.callback_failed):
+                break
+            print(f"🔁 Resuming {len(report.failed)} failed chunks "
+                  f"({len(report.callback_failed)} not added to the lexical index)...")
+            report.absorb(engine.resume(report))
+    if report.chunks:
+        lexical_index.save()
+        # Cached answers may be stale now that the corpus changed
+        get_answer_cache(tenant).invalidate()
+    if report.failed or report.callback_failed:
+        raise UpsertError(report)
+
+    if not report.chunks:
+        print("⚠️ No valid documents found for processing.")
+    else:
+        print(f"✅ Successfully added {report.chunks} chunks to Pinecone.")
+    return report
+
+
+def delete_vectors(chunk_ids: List[str], tenant: Optional[str] = None):
+    """
+    Delete a tenant's vectors from the index and the lexical index, in batches.
+    """
+    if not chunk_ids:
+        return
+    index = get_vector_index()
+    for start in range(0, len(chunk_ids), DELETE_BATCH_SIZE):
+        index.delete(ids=chunk_ids[start:start + DELETE_BATCH_SIZE], namespace=tenant)
+    lexical_index = get_lexical_index(tenant)
+    lexical_index.remove(chunk_ids)
+    lexical_index.save()
+    get_answer_cache(tenant).invalidate()
+    print(f"🗑️ Deleted {len(chunk_ids)} stale chunks")
+
+
+def add_files_to_pinecone(file_paths: List[str], parse_workers: int = PARSE_WORKERS,
+                          max_in_flight: int = UPSERT_MAX_IN_FLIGHT,
+                          on_progress: Optional[Callable[[int], None]] = None,
+                          sources: Optional[List[str]] = None, tenant: Optional[str] = None):
+    """
+    Incrementally (re-)ingest files, keeping the index in sync with their current content.
+
+    The manifest (see `Manifest.py`) remembers each file's fingerprint and chunk IDs:
+
+    - files whose content did not change since they were last ingested are skipped,
+    - only chunks that are not in the index yet are embedded and upserted,
+    - vectors of chunks that a new version of a file no longer contains are deleted
+      (unless another file still has the same chunk).
+
+    The manifest is only updated once the upsert succeeded, so a failed run is simply
+    retried from the same state. Chunks skipped as already indexed are checked again under
+    the manifest lock, and upserted if a concurrent delete released them in the meantime. A file that could not be parsed completely (a page or
+    page range failed) keeps its previous version: it is listed in `failed_files`, the
+    chunks it did produce are not kept unless another file has them, and it is parsed
+    again on the next run.
+
+    Args:
+        file_paths (List[str]): The files to ingest.
+        parse_workers (int): See `Load_data.stream_data`.
+        max_in_flight (int): Upsert batches allowed to run at once for this call.
+        on_progress (Callable[[int], None], optional): Called with the number of chunks upserted so far.
+        sources (List[str], optional): The name identifying each file (its chunks' `source` metadata
+            and manifest entry), e.g. the original name of an uploaded file. Defaults to the paths.
+        tenant (str, optional): The tenant to index into; each tenant has its own manifest, so
+            the same file name in two tenants is two documents.
+
+    Returns:
+        UpsertReport: Counters of the run, including skipped and failed files, skipped chunks and
+            deleted vectors.
+
+    Raises:
+        UpsertError: If some batches still failed after all retries.
+    """
+    manifest = get_manifest(tenant)
+    manifest.reload_if_changed()
+    report = UpsertReport()
+    source_of = dict(zip(file_paths, sources or file_paths))
+    fingerprints, changed = {}, []
+    for path in file_paths:
+        source = source_of[path]
+        fingerprints[source] = file_fingerprint(path)
+        if manifest.fingerprint(source) == fingerprints[source]:
+            print(f"⏭️ Unchanged, skipping: {source}")
+            report.skipped_files.append(source)
+        else:
+            changed.append(path)
+    if not changed:
+        return report
+
+    chunk_ids: Dict[str, List[str]] = {source_of[path]: [] for path in changed}
+    skipped: Dict[str, Document] = {}
+    parsed: Dict[str, dict] = {}
+
+    def new_chunks():
+        for chunk in stream_data(file_paths=changed, parse_workers=parse_workers, report=parsed):
+            chunk.metadata["source"] = source = source_of[chunk.metadata["source"]]
+            chunk_id = vector_id(chunk.page_content)
+            chunk_ids[source].append(chunk_id)
+            if manifest.is_indexed(chunk_id):
+                skipped[chunk_id] = chunk
+                continue
+            yield chunk
+
+    upserted = add_documents_to_pinecone(new_chunks(), max_in_flight=max_in_flight, on_progress=on_progress,
+                                         tenant=tenant)
+    upserted.skipped_files, upserted.skipped_chunks = report.skipped_files, len(skipped)
+    parse_errors = {source_of[path]: stats["errors"] for path, stats in parsed.items() if stats["errors"]}
+
+    released = []
+    with manifest.locked():
+        # The skipped chunks were checked before taking the lock: a file deleted since may have released them
+        released_meanwhile = [chunk for chunk_id, chunk in skipped.items()
+                              if chunk.metadata["source"] not in parse_errors and not manifest.is_indexed(chunk_id)]
+        if released_meanwhile:
+            print(f"🔁 Re-adding {len(released_meanwhile)} skipped chunks released by a concurrent delete...")
+            readded = add_documents_to_pinecone(released_meanwhile, max_in_flight=max_in_flight, tenant=tenant)
+            upserted.chunks += readded.chunks
+            upserted.skipped_chunks -= len(released_meanwhile)
+        for source in chunk_ids:
+            if source in parse_errors:
+                print(f"⚠️ {source} was not fully loaded ({parse_errors[source][0]}), keeping its previous version.")
+                upserted.failed_files.append(source)
+                upserted.errors.extend(f"{source}: {error}" for error in parse_errors[source])
+                continue
+            if not chunk_ids[source]:
+                print(f"⚠️ No chunks loaded from {source}, keeping its previous version.")
+                continue
+            released.extend(manifest.update(source, fingerprints[source], chunk_ids[source]))
+        # Chunks upserted from partly loaded files are dropped unless a recorded file has them
+        released.extend(chunk_id for source in upserted.failed_files for chunk_id in chunk_ids[source]
+                        if not manifest.is_indexed(chunk_id))
+        released = list(dict.fromkeys(released))
+        delete_vectors(released, tenant)
+    upserted.deleted = len(released)
+    return upserted
+
+
+def delete_file_from_pinecone(source: str, tenant: Optional[str] = None) -> int:
+    """
+    Remove a previously ingested file: its vectors (unless shared with another file) and its manifest entry.
+
+    Args:
+        source (str): The file's path, or the name it was ingested under (see `add_files_to_pinecone`).
+        tenant (str, optional): The tenant it was ingested into.
+
+    Returns:
+        int: The number of vectors deleted.
+    """
+    manifest = get_manifest(tenant)
+    with manifest.locked():
+        released = manifest.remove(source)
+        delete_vectors(released, tenant)
+    return len(released)
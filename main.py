@@ -1,7 +1,6 @@
-import os
 import streamlit as st
-from helper.Load_data import load_data
-from helper.Vector_db import add_documents_to_pinecone
+from helper.Vector_db import add_files_to_pinecone
+from helper.Uploads import spool_files, remove_spooled, UploadError
 
 def main():
     st.set_page_config(page_title="RAG Customer Support", page_icon=":robot_face:", layout="wide")
@@ -11,17 +10,18 @@ def main():
     url = st.text_input("Enter a YouTube URL:", placeholder="https://www.youtube.com/watch?v=dQw4w9WgXcQ")
     
     if uploaded_files:
-        file_paths = []
-        for path in uploaded_files:
-            temp_file_path = os.path.join(os.getcwd(), path.name)
-            with open(temp_file_path, "wb") as temp_file:
-                temp_file.write(path.read())
-            file_paths.append(temp_file.name)
+        try:
+            spooled = spool_files((uploaded_file, uploaded_file.name) for uploaded_file in uploaded_files)
+        except UploadError as e:
+            st.error(f"❌ {e}")
+            return
+        file_paths = [path for path, _ in spooled]
         
         with st.spinner("Processing files...", show_time=True):
-            data = load_data(file_paths=file_paths)
-            add_documents_to_pinecone(data)
-            _ = [os.remove(file_path) for file_path in file_paths]
+            try:
+                add_files_to_pinecone(file_paths, sources=[name for _, name in spooled])
+            finally:
+                remove_spooled(file_paths)
         st.success("✅ Files uploaded and processed successfully. 📁")
     
     elif url:
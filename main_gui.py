@@ -1,5 +1,5 @@
 import streamlit as st
-from helper.Full_chain import get_response
+from helper.Full_chain import stream_response
 
 def main():
     st.set_page_config(page_title="RAG Customer Support", page_icon=":robot_face:", layout="wide")
@@ -10,16 +10,23 @@ def main():
         
     user_query = st.chat_input("Ask a question:")
     if user_query:
-        response = get_response(user_query=user_query, user_id="None")
-        
-        st.session_state.chat_history.append({"user": user_query, 
-                                              "assistant": response['answer'].replace("```markdown", "").replace("```", "").strip()})
-        
         for chat in st.session_state.chat_history:
             with st.chat_message("user"):
                 st.write(chat["user"])
             with st.chat_message("assistant"):
                 st.write(chat["assistant"])
 
+        with st.chat_message("user"):
+            st.write(user_query)
+        with st.chat_message("assistant"):
+            events = stream_response(user_query=user_query, user_id="None")
+            sources = next(events)
+            if sources["video-url"]:
+                st.caption(f"🔗 Source: {sources['video-url']}")
+            answer = st.write_stream(event["data"] for event in events if event["event"] == "token")
+
+        st.session_state.chat_history.append({"user": user_query, 
+                                              "assistant": answer.replace("```markdown", "").replace("```", "").strip()})
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+Every test runs against the local stand-ins of `benchmarks/Fakes.py` (Gemini, Pinecone,
+MySQL, YouTube), installed before any `helper` module reads its settings.
+"""
+import shutil
+import tempfile
+import pytest
+from benchmarks import Fakes
+
+WORKDIR = tempfile.mkdtemp(prefix="rag-tests-")
+FAKES = Fakes.install(WORKDIR)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir():
+    yield WORKDIR
+    from helper.MySQL_DB import close_chat_history
+    close_chat_history()  # flush buffered turns while their database still exists
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture
+def fakes():
+    return FAKES
@@ -0,0 +1,50 @@
+import numpy as np
+
+from helper.Answer_cache import AnswerCache, cached_answer
+
+
+def embed_without_digits(query):
+    """An embedding blind to numbers: every order-status question looks the same."""
+    vector = np.zeros(8)
+    for char in query:
+        if not char.isdigit():
+            vector[ord(char) % 8] += 1.0
+    return list(vector)
+
+
+def test_semantic_hits_require_the_same_numbers_and_codes():
+    cache = AnswerCache(similarity_threshold=0.9)
+    compute = lambda order: (lambda: {"answer": f"order {order} shipped"})
+    cached_answer("status of order 12345", compute(12345), embed_without_digits, cache)
+
+    answer, tier = cached_answer("status of order 67890", compute(67890), embed_without_digits, cache)
+    assert (answer["answer"], tier) == ("order 67890 shipped", None)
+    answer, tier = cached_answer("Status of order 12345?", compute(0), embed_without_digits, cache)
+    assert (answer["answer"], tier) == ("order 12345 shipped", "exact")
+    answer, tier = cached_answer("status for order 12345", compute(0), embed_without_digits, cache)
+    assert (answer["answer"], tier) == ("order 12345 shipped", "semantic")
+
+
+def test_invalidation_reaches_caches_in_other_processes(tmp_path):
+    stamp_path = str(tmp_path / "answer_cache.stamp")
+    worker, ingester = AnswerCache(stamp_path=stamp_path), AnswerCache(stamp_path=stamp_path)
+    cached_answer("what is the refund policy", lambda: {"answer": "30 days"}, cache=worker)
+    ingester.invalidate()
+
+    answer, tier = cached_answer("what is the refund policy", lambda: {"answer": "60 days"}, cache=worker)
+    assert (answer["answer"], tier) == ("60 days", None)
+    assert worker.stats()["invalidations"] == 1
+
+
+def test_answers_computed_before_an_invalidation_are_not_stored(tmp_path):
+    stamp_path = str(tmp_path / "answer_cache.stamp")
+    worker, ingester = AnswerCache(stamp_path=stamp_path), AnswerCache(stamp_path=stamp_path)
+
+    def compute():
+        ingester.invalidate()  # documents were added while the answer was being generated
+        return {"answer": "stale"}
+
+    cached_answer("what is the refund policy", compute, cache=worker)
+    answer, tier = cached_answer("what is the refund policy", lambda: {"answer": "fresh"}, cache=worker)
+    assert (answer["answer"], tier) == ("fresh", None)
+    assert worker.stale_stores == 1
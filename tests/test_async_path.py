@@ -0,0 +1,47 @@
+import asyncio
+import json
+import time
+from fastapi.testclient import TestClient
+import backend
+from helper.Full_chain import aget_response, astream_response, get_retriever_chain
+
+
+def test_conversations_overlap_on_one_event_loop(fakes, monkeypatch):
+    get_retriever_chain()
+    monkeypatch.setattr(fakes["llm"], "latency", 0.2)
+
+    async def scenario():
+        started = time.perf_counter()
+        answers = await asyncio.gather(*(aget_response(f"How long does order {number} take to ship?")
+                                         for number in range(20)))
+        return answers, time.perf_counter() - started
+
+    answers, seconds = asyncio.run(scenario())
+    assert all(answer["answer"] for answer in answers)
+    assert seconds < 20 * 0.2 / 4
+
+
+def test_streamed_tokens_add_up_to_the_answer():
+    async def scenario():
+        return [event async for event in astream_response("Which colours does the Kindix kettle come in?")]
+
+    events = asyncio.run(scenario())
+    assert events[0]["event"] == "sources" and events[-1]["event"] == "done"
+    tokens = [event["data"] for event in events[1:-1]]
+    assert tokens and all(event["event"] == "token" for event in events[1:-1])
+    assert "".join(tokens) == events[-1]["answer"]
+
+
+def test_endpoints_serve_the_async_path():
+    assert backend.ASYNC_QUERY_PATH
+    with TestClient(backend.app) as client:
+        answer = client.post("/get_response", data={"user_query": "Do you ship abroad?", "user_id": "carol"})
+        assert answer.status_code == 200 and answer.json()["message"]["answer"]
+
+        stream = client.post("/get_response/stream", data={"user_query": "And how long does it take?",
+                                                            "user_id": "carol"})
+        events = [line[len("event: "):] for line in stream.text.splitlines() if line.startswith("event: ")]
+        assert events[0] == "sources" and events[-1] == "done" and "error" not in events
+        done = json.loads(stream.text.strip().splitlines()[-1][len("data: "):])
+        turns = client.get("/chat_history/carol").json()["turns"]
+        assert [turn["chatbot_answer"] for turn in turns[:1]] == [done["answer"]]
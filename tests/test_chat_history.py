@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+import time
+import pytest
+from helper.Full_chain import _chat_history
+from helper.MySQL_DB import (CREATE_TABLE_SQL, ChatHistoryStore, ChatHistoryWriter, ConnectionLimiter,
+                             PoolTimeoutError, RecentTurnsCache, _select_sql, get_chat_history_page,
+                             migrate_chat_history)
+
+
+@pytest.fixture
+def store(tmp_path):
+    database = str(tmp_path / "chat_history.sqlite3")
+    store = ChatHistoryStore(lambda: sqlite3.connect(database), dialect="sqlite")
+    store.create_table()
+    # Interleave two users so a user's IDs are not contiguous
+    store.insert_many([(f"question {i}", f"answer {i}", "alice" if i % 2 else "bob") for i in range(50)])
+    return store
+
+
+def test_select_sql_pages_on_user_and_id():
+    sql, params = _select_sql("?", "alice", 10, 42)
+    assert "user_id = ? AND id < ?" in sql and "ORDER BY id DESC" in sql and "LIMIT ?" in sql
+    assert params == ("alice", 42, 10)
+    sql, params = _select_sql("%s", "alice", None, None)
+    assert "id <" not in sql and "LIMIT" not in sql and params == ("alice",)
+
+
+def test_keyset_pages_cover_a_users_rows_once_newest_first(store):
+    pages, before_id = [], None
+    while True:
+        rows = store.fetch("alice", limit=10, before_id=before_id)
+        pages.append(rows)
+        if len(rows) < 10:
+            break
+        before_id = rows[-1][0]
+    queries = [row[1] for page in pages for row in page]
+    assert queries == [f"question {i}" for i in range(49, 0, -2)]
+
+
+def test_select_uses_the_user_id_index(store):
+    sql, params = _select_sql("?", "alice", 10, 30)
+    plan = store._execute(lambda cursor, conn: cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall())
+    assert "idx_chat_history_user_id" in " ".join(str(row) for row in plan)
+
+
+def test_first_page_includes_unwritten_turns(store, monkeypatch):
+    writer = ChatHistoryWriter(store, flush_size=1000, flush_interval=60)
+    monkeypatch.setattr("helper.MySQL_DB.get_chat_history_writer", lambda: writer)
+    try:
+        writer.add("unwritten question", "unwritten answer", "alice")
+        page = get_chat_history_page("alice", limit=3)
+        assert [turn[1] for turn in page["turns"]] == ["unwritten question", "question 49", "question 47"]
+        assert page["turns"][0][0] is None
+        older = get_chat_history_page("alice", limit=3, before_id=page["next_before_id"])
+        assert [turn[1] for turn in older["turns"]] == ["question 45", "question 43", "question 41"]
+    finally:
+        writer.close()
+
+
+def test_callers_wait_for_a_free_connection_instead_of_failing(tmp_path):
+    database = str(tmp_path / "chat_history.sqlite3")
+    limiter = ConnectionLimiter(lambda: sqlite3.connect(database, check_same_thread=False), size=1, timeout=5)
+    held = limiter()
+    threading.Timer(0.1, held.close).start()
+    started = time.monotonic()
+    conn = limiter()
+    assert time.monotonic() - started >= 0.05
+    conn.close()
+    conn.close()  # closing twice gives the slot back once
+
+    limiter.timeout = 0.05
+    held = limiter()
+    with pytest.raises(PoolTimeoutError):
+        limiter()
+    held.close()
+    limiter().close()
+
+
+def test_history_errors_are_not_swallowed(monkeypatch):
+    def unavailable(user_id):
+        raise PoolTimeoutError("No database connection became free within 10s")
+    monkeypatch.setattr("helper.Full_chain.chat_history_enabled", lambda: True)
+    monkeypatch.setattr("helper.Full_chain.get_recent_turns", unavailable)
+    with pytest.raises(PoolTimeoutError):
+        _chat_history("alice")
+
+
+def test_cached_turns_expire_so_other_workers_turns_are_seen():
+    cache = RecentTurnsCache(ttl=0.05)
+    _, token = cache.get("alice")
+    cache.put("alice", [("hi", "hello")], token)
+    assert cache.get("alice") == ([("hi", "hello")], None)
+    time.sleep(0.1)
+    turns, token = cache.get("alice")
+    assert turns is None and token is not None
+
+
+def test_a_turn_appended_during_a_load_is_not_overwritten():
+    cache = RecentTurnsCache()
+    _, token = cache.get("alice")
+    rows_read_before_the_turn = [("hi", "hello")]
+    cache.append("alice", ("and now?", "answered meanwhile"))
+    cache.put("alice", rows_read_before_the_turn, token)
+    assert cache.get("alice")[0] is None
+
+
+def test_the_index_is_created_at_startup(tmp_path, monkeypatch):
+    database = str(tmp_path / "legacy.sqlite3")
+    conn = sqlite3.connect(database)
+    conn.execute(CREATE_TABLE_SQL["sqlite"])
+    conn.close()
+    writer = ChatHistoryWriter(ChatHistoryStore(lambda: sqlite3.connect(database), dialect="sqlite"))
+    monkeypatch.setattr("helper.MySQL_DB.get_chat_history_writer", lambda: writer)
+    try:
+        migrate_chat_history()
+        migrate_chat_history()
+    finally:
+        writer.close()
+    conn = sqlite3.connect(database)
+    indexes = [row[1] for row in conn.execute("PRAGMA index_list(chat_history)")]
+    conn.close()
+    assert indexes == ["idx_chat_history_user_id"]
@@ -0,0 +1,70 @@
+import asyncio
+import pytest
+from helper.Coalescing import QueryEmbeddingBatcher, SingleFlight
+
+
+async def slow_answer(calls, value=42, delay=0.05):
+    calls.append(value)
+    await asyncio.sleep(delay)
+    return value
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight, calls = SingleFlight("test"), []
+        leader = asyncio.create_task(flight.ado("key", lambda: slow_answer(calls)))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.ado("key", lambda: slow_answer(calls)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == (42, True)
+        assert calls == [42] and flight.stats()["in_flight"] == 0
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+    asyncio.run(scenario())
+
+
+def test_computation_is_cancelled_with_its_last_caller():
+    async def scenario():
+        flight, calls = SingleFlight("test"), []
+        caller = asyncio.create_task(flight.ado("key", lambda: slow_answer(calls, delay=10)))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        assert flight.stats()["in_flight"] == 0
+        assert await flight.ado("key", lambda: slow_answer(calls, value=7, delay=0)) == (7, False)
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_caller():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(flight.ado("key", fail), flight.ado("key", fail), return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError, ValueError]
+    asyncio.run(scenario())
+
+
+class LengthEmbeddings:
+    def embed_documents(self, texts, task_type=None):
+        return [[float(len(text))] for text in texts]
+
+    async def aembed_documents(self, texts, task_type=None):
+        await asyncio.sleep(0.02)
+        return self.embed_documents(texts, task_type)
+
+
+def test_cancelled_query_does_not_cancel_its_batch():
+    async def scenario():
+        batcher = QueryEmbeddingBatcher(LengthEmbeddings(), window_ms=10)
+        first = asyncio.create_task(batcher.aembed_query("aa"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(batcher.aembed_query("bbb"))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == [3.0]
+        assert batcher.stats()["calls"] == 1
+    asyncio.run(scenario())
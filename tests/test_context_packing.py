@@ -0,0 +1,55 @@
+from langchain_core.documents import Document
+from helper.Context_packing import (MIN_TRUNCATED_TOKENS, estimate_tokens, fit_to_budget, merge_adjacent,
+                                    pack_context, packing_stats, remove_near_duplicates)
+
+PAGE = " ".join(f"Kindix hub step {number}: press the button and wait for the light." for number in range(12))
+
+
+def chunks(text, size=120, overlap=30, source="manual.pdf", page=1):
+    """Split like the splitter does: overlapping chunks recording their start offset."""
+    return [Document(page_content=text[start:start + size],
+                     metadata={"source": source, "page": page, "start_index": start})
+            for start in range(0, len(text) - overlap, size - overlap)]
+
+
+def test_overlapping_chunks_of_a_page_are_merged_once():
+    parts = chunks(PAGE)
+    other = Document(page_content="Shipping takes three days.", metadata={"source": "faq.txt", "start_index": 0})
+    merged = merge_adjacent([parts[2], other, parts[0], parts[1], parts[3]])
+    assert [document.page_content for document in merged] == [PAGE[:parts[3].metadata["start_index"] + 120],
+                                                              other.page_content]
+
+
+def test_chunks_that_do_not_overlap_stay_apart():
+    parts = chunks(PAGE)
+    assert len(merge_adjacent([parts[0], parts[4]])) == 2
+    moved = Document(page_content="something else entirely", metadata=dict(parts[1].metadata))
+    assert len(merge_adjacent([parts[0], moved])) == 2
+
+
+def test_passages_contained_in_a_better_one_are_dropped():
+    long = Document(page_content=PAGE)
+    repeated = Document(page_content=PAGE[200:400])
+    different = Document(page_content="Refunds are paid within five business days of the return.")
+    assert remove_near_duplicates([long, repeated, different]) == [long, different]
+
+
+def test_budget_truncates_at_a_word_or_skips_to_a_shorter_passage():
+    long, short = Document(page_content=PAGE), Document(page_content="Short answer.")
+    packed = fit_to_budget([long, short], token_budget=MIN_TRUNCATED_TOKENS + 10)
+    assert PAGE.startswith(packed[0].page_content) and PAGE[len(packed[0].page_content)] == " "
+    assert sum(estimate_tokens(document.page_content) for document in packed) <= MIN_TRUNCATED_TOKENS + 10
+
+    first = Document(page_content="x" * 4 * (MIN_TRUNCATED_TOKENS + 5))
+    assert fit_to_budget([first, long, short], token_budget=MIN_TRUNCATED_TOKENS + 50) == [first, short]
+
+
+def test_packing_records_the_tokens_saved():
+    before = packing_stats.stats()
+    retrieved = chunks(PAGE) + [Document(page_content=PAGE[100:300])]
+    packed = pack_context(retrieved, token_budget=10000)
+    after = packing_stats.stats()
+    assert [document.page_content for document in packed] == [PAGE]
+    assert after["queries"] == before["queries"] + 1
+    assert after["tokens_in"] - before["tokens_in"] == sum(estimate_tokens(d.page_content) for d in retrieved)
+    assert after["tokens_out"] - before["tokens_out"] == estimate_tokens(PAGE)
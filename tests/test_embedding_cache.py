@@ -0,0 +1,48 @@
+from benchmarks.Fakes import HashingEmbeddings
+from helper.Embedding_cache import CachedEmbeddings, EmbeddingCache
+from helper.Vector_db import get_vector_index
+
+
+class RecordingEmbeddings(HashingEmbeddings):
+    def __init__(self):
+        super().__init__(dimensions=16)
+        self.embedded = []
+
+    def embed_documents(self, texts, task_type=None):
+        self.embedded.append(list(texts))
+        return super().embed_documents(texts, task_type)
+
+
+def test_only_chunks_missing_from_the_cache_are_embedded(tmp_path):
+    model = RecordingEmbeddings()
+    cached = CachedEmbeddings(model, EmbeddingCache(str(tmp_path / "embeddings.sqlite3")), model="test")
+    first = cached.embed_documents(["alpha", "beta", "alpha"])
+    second = cached.embed_documents(["beta", "gamma"])
+    assert model.embedded == [["alpha", "beta"], ["gamma"]]
+    assert second[0] == first[1] and first[0] == first[2]
+    assert (cached.hits, cached.misses) == (1, 3)
+
+
+def test_vectors_persist_across_processes_and_models_are_kept_apart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    CachedEmbeddings(RecordingEmbeddings(), EmbeddingCache(path), model="test").embed_documents(["alpha"])
+    model = RecordingEmbeddings()
+    CachedEmbeddings(model, EmbeddingCache(path), model="test").embed_documents(["alpha"])
+    CachedEmbeddings(model, EmbeddingCache(path), model="other").embed_documents(["alpha"])
+    assert model.embedded == [["alpha"]]
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), max_entries=2)
+    cache.put_many("test", {"a": [1.0]})
+    cache.put_many("test", {"b": [2.0]})
+    cache.get_many("test", ["a"])
+    cache.put_many("test", {"c": [3.0]})
+    assert len(cache) == 2 and set(cache.get_many("test", ["a", "b", "c"])) == {"a", "c"}
+
+
+def test_vector_index_is_opened_once(capsys):
+    first = get_vector_index()
+    capsys.readouterr()
+    assert get_vector_index() is first
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+import types
+import pytest
+import backend
+from helper.Job_queue import JobQueue, QueueFullError
+
+
+def wait_for(*jobs):
+    while any(job.finished_at is None for job in jobs):
+        time.sleep(0.005)
+
+
+def test_jobs_report_their_result_or_error():
+    queue = JobQueue(max_workers=1)
+    done = queue.submit("test", lambda job: job.kind.upper())
+    failed = queue.submit("test", lambda job: 1 / 0)
+    wait_for(done, failed)
+    queue.shutdown(wait=True)
+    assert (done.state, done.result) == ("succeeded", "TEST")
+    assert failed.state == "failed" and "division" in failed.error
+    assert queue.stats()["active"] == 0
+
+
+def test_queue_is_bounded():
+    queue, release = JobQueue(max_workers=1, max_queued=1), threading.Event()
+    queue.submit("test", lambda job: release.wait())
+    with pytest.raises(QueueFullError):
+        queue.submit("test", lambda job: None)
+    release.set()
+    queue.shutdown(wait=True)
+
+
+def test_shutdown_cancels_queued_jobs_and_releases_their_inputs():
+    queue, started, release = JobQueue(max_workers=1), threading.Event(), threading.Event()
+    released = []
+    running = queue.submit("test", lambda job: started.set() or release.wait())
+    started.wait()
+    queued = queue.submit("test", lambda job: "ran", on_cancel=lambda: released.append("spool"))
+    threading.Timer(0.05, release.set).start()
+    queue.shutdown(wait=True)
+    assert running.state == "succeeded"
+    assert queued.state == "cancelled" and queued.finished_at is not None and released == ["spool"]
+    assert queue.stats()["active"] == 0
+
+
+def test_document_job_fails_when_no_file_could_be_loaded(tmp_path):
+    path = str(tmp_path / "upload-1.xlsx")
+    with open(path, "w") as upload:
+        upload.write("not a supported format")
+    with pytest.raises(ValueError, match="Could not load any file"):
+        backend._ingest(types.SimpleNamespace(progress=0), file_paths=[path], sources=["sheet.xlsx"],
+                        tenant="job-failed-files")
+    assert not os.path.exists(path)  # the spooled upload is removed either way
@@ -0,0 +1,56 @@
+import time
+
+from helper.Lexical_index import LexicalIndex, tokenize
+
+
+def ids(results):
+    return [document.id for document, _ in results]
+
+
+def test_codes_are_indexed_whole_and_by_their_parts():
+    assert tokenize("Order SKU-12345 shipped") == ["order", "sku-12345", "sku", "12345", "shipped"]
+    assert tokenize("الطلب رقم ١٢٣") == ["طلب", "رقم", "123"]
+
+
+def test_bm25_ranks_rare_exact_terms_first():
+    index = LexicalIndex(path=None)
+    index.add("a", "shipping takes three days for every order")
+    index.add("b", "order SKU-12345 is a red kettle")
+    index.add("c", "every order can be returned within thirty days")
+    assert ids(index.search("sku-12345", k=3)) == ["b"]
+    assert ids(index.search("12345 order", k=3))[0] == "b"
+    assert index.search("unknown", k=3) == []
+
+
+def test_removed_chunks_are_not_returned_and_compacted_on_save(tmp_path):
+    index = LexicalIndex(path=str(tmp_path / "lexical.pkl"))
+    for number in range(10):
+        index.add(f"chunk-{number}", f"refund policy number {number}")
+    index.remove(["chunk-3", "chunk-4", "chunk-5"])
+    assert len(index) == 7 and "chunk-3" not in ids(index.search("refund", k=10))
+    index.save()
+    assert index._deleted == set() and len(index._ids) == 7
+    assert ids(index.search("3", k=10)) == []
+
+
+def test_saves_from_two_processes_are_merged(tmp_path):
+    path = str(tmp_path / "lexical.pkl")
+    api, ingestion = LexicalIndex(path=path), LexicalIndex(path=path)
+    api.add("a", "warranty lasts two years")
+    api.save()
+    ingestion.add("b", "warranty claims need the receipt")
+    ingestion.save()
+    assert sorted(ids(LexicalIndex(path=path).search("warranty", k=5))) == ["a", "b"]
+
+
+def test_changes_saved_elsewhere_are_reloaded_in_the_background(tmp_path):
+    path = str(tmp_path / "lexical.pkl")
+    reader, writer = LexicalIndex(path=path), LexicalIndex(path=path)
+    writer.add("a", "gift cards never expire")
+    writer.save()
+
+    reader.reload_in_background()
+    deadline = time.monotonic() + 5
+    while not reader.search("gift", k=1) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ids(reader.search("gift", k=1)) == ["a"]
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pytest
+from helper import Local_vector_store
+from helper.Local_vector_store import LocalVectorStore, maximal_marginal_relevance
+
+
+def rows(vectors):
+    return np.array(vectors, dtype=np.float32)
+
+
+def add(store, ids, vectors):
+    store.add_vectors(ids, rows(vectors), [f"text {chunk_id}" for chunk_id in ids],
+                      [{"id": chunk_id} for chunk_id in ids])
+
+
+def test_search_matches_brute_force_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(Local_vector_store, "SEARCH_BLOCK_ROWS", 7)
+    vectors = np.random.default_rng(0).normal(size=(50, 8)).astype(np.float32)
+    store = LocalVectorStore(str(tmp_path))
+    add(store, [str(row) for row in range(50)], vectors)
+    store.delete(["3", "17"])
+
+    queries = vectors[[3, 10]] + 0.01
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for query, hits in zip(queries, store.search_vectors(queries, k=5)):
+        scores = normalized @ (query / np.linalg.norm(query))
+        scores[[3, 17]] = -np.inf
+        assert [row for row, _ in hits] == list(np.argsort(-scores)[:5])
+
+
+def test_upserts_overwrite_and_other_processes_see_writes(tmp_path):
+    writer = LocalVectorStore(str(tmp_path))
+    add(writer, ["a", "b"], [[1, 0], [0, 1]])
+    reader = LocalVectorStore(str(tmp_path))
+    add(writer, ["a"], [[0, 1]])
+    add(writer, ["c"], [[1, 1]])
+    assert len(reader) == 3
+    hits = reader.similarity_search_by_vector_with_score([0, 1], k=3)
+    assert [document.id for document, _ in hits][:2] in (["a", "b"], ["b", "a"])
+    assert hits[0][1] == pytest.approx(1.0)
+
+
+def test_mmr_prefers_diverse_results():
+    candidates = rows([[1, 0, 0], [0.99, 0.14, 0], [0.7, 0, 0.71]])
+    candidates /= np.linalg.norm(candidates, axis=1, keepdims=True)
+    query = rows([1, 0, 0.1]) / np.linalg.norm([1, 0, 0.1])
+    assert maximal_marginal_relevance(query, candidates, k=2, lambda_mult=1.0) == [0, 1]
+    assert maximal_marginal_relevance(query, candidates, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_an_interrupted_write_is_repaired(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    add(store, ["a"], [[1, 0]])
+    with open(tmp_path / "vectors.f32", "ab") as vectors_file:
+        vectors_file.write(rows([[0, 1]]).tobytes())  # vector appended, record never written
+    with open(tmp_path / "records.jsonl", "a", encoding="utf-8") as records_file:
+        records_file.write('{"row": 1, "id": "b"')  # record cut short
+
+    reopened = LocalVectorStore(str(tmp_path))
+    assert len(reopened) == 1
+    assert os.path.getsize(tmp_path / "vectors.f32") == 2 * 4
+    add(reopened, ["c"], [[0, 1]])
+    assert reopened.similarity_search_by_vector([0, 1], k=1)[0].id == "c"
+
+
+def test_missing_vector_rows_are_refused(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    add(store, ["a", "b"], [[1, 0], [0, 1]])
+    os.truncate(tmp_path / "vectors.f32", 2 * 4)
+    with pytest.raises(RuntimeError, match="corrupt"):
+        LocalVectorStore(str(tmp_path))
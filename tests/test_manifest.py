@@ -0,0 +1,111 @@
+import os
+from langchain_core.documents import Document
+import helper.Load_data as Load_data
+import helper.Vector_db as Vector_db
+from helper.Chunk_ids import vector_id
+from helper.Manifest import Manifest, get_manifest
+from helper.Vector_db import add_files_to_pinecone, delete_file_from_pinecone
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as source_file:
+        source_file.write(text)
+    return str(path)
+
+
+def test_shared_chunks_are_released_by_the_last_source(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    with manifest.locked():
+        assert manifest.update("a.txt", "fa", ["shared", "only-a"]) == []
+        assert manifest.update("b.txt", "fb", ["shared", "only-b"]) == []
+        assert manifest.update("a.txt", "fa2", ["only-a2"]) == ["only-a"]
+    with manifest.locked():
+        assert manifest.remove("b.txt") == ["shared", "only-b"]
+    assert Manifest(manifest.path).is_indexed("only-a2")
+    assert not Manifest(manifest.path).is_indexed("shared")
+
+
+def test_concurrent_writers_keep_each_others_sources(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    first, second = Manifest(path), Manifest(path)
+    with first.locked():
+        first.update("a.txt", "fa", ["a"])
+    with second.locked():
+        second.update("b.txt", "fb", ["b"])
+    assert len(Manifest(path)) == 2
+
+
+def test_failed_block_leaves_the_saved_manifest(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.json"))
+    try:
+        with manifest.locked():
+            manifest.update("a.txt", "fa", ["a"])
+            raise RuntimeError("delete failed")
+    except RuntimeError:
+        pass
+    assert manifest.fingerprint("a.txt") is None
+
+
+def test_unchanged_files_are_skipped_and_stale_vectors_deleted(tmp_path, fakes):
+    index = fakes["pinecone_client"].index
+    path = write(tmp_path / "guide.txt", "Kindix setup guide. Plug in the hub.")
+    first = add_files_to_pinecone([path], parse_workers=0, tenant="manifest-skip")
+    assert first.chunks == 1 and not first.skipped_files
+
+    again = add_files_to_pinecone([path], parse_workers=0, tenant="manifest-skip")
+    assert again.skipped_files == [path] and again.chunks == 0
+
+    old_id = vector_id("Kindix setup guide. Plug in the hub.")
+    write(path, "Kindix setup guide, second edition.")
+    updated = add_files_to_pinecone([path], parse_workers=0, tenant="manifest-skip")
+    assert updated.chunks == 1 and updated.deleted == 1
+    assert not get_manifest("manifest-skip").is_indexed(old_id)
+    assert index.count("manifest-skip") == 1
+
+    assert delete_file_from_pinecone(path, tenant="manifest-skip") == 1
+    assert get_manifest("manifest-skip").fingerprint(path) is None
+
+
+def test_partly_parsed_file_keeps_its_previous_version(tmp_path, monkeypatch):
+    path = write(tmp_path / "manual.txt", "Kindix manual, first edition.")
+    add_files_to_pinecone([path], parse_workers=0, tenant="manifest-partial")
+    fingerprint = get_manifest("manifest-partial").fingerprint(path)
+
+    class BrokenLoader:
+        def lazy_load(self):
+            yield Document(page_content="Kindix manual, second edition, page one.", metadata={})
+            raise ValueError("corrupt page 2")
+
+    write(path, "Kindix manual, second edition.")
+    monkeypatch.setattr(Load_data, "_get_loader", lambda file_path: BrokenLoader())
+    report = add_files_to_pinecone([path], parse_workers=0, tenant="manifest-partial")
+
+    manifest = get_manifest("manifest-partial")
+    assert report.failed_files == [path]
+    assert manifest.fingerprint(path) == fingerprint
+    assert manifest.is_indexed(vector_id("Kindix manual, first edition."))
+    assert report.deleted == 1  # the chunk upserted from the partial parse
+
+
+def test_skipped_chunks_released_by_a_concurrent_delete_are_upserted_again(tmp_path, monkeypatch, fakes):
+    index = fakes["pinecone_client"].index
+    text = "Kindix returns policy. Keep the receipt."
+    first, copy = write(tmp_path / "returns.txt", text), write(tmp_path / "returns-copy.txt", text)
+    add_files_to_pinecone([first], parse_workers=0, tenant="manifest-race")
+
+    upsert = Vector_db.add_documents_to_pinecone
+    calls = []
+
+    def upsert_then_delete(documents, **kwargs):
+        calls.append(kwargs)
+        report = upsert(documents, **kwargs)
+        if len(calls) == 1:
+            # Another job deletes the original while the copy's chunks are being (not) upserted
+            delete_file_from_pinecone(first, tenant="manifest-race")
+        return report
+
+    monkeypatch.setattr(Vector_db, "add_documents_to_pinecone", upsert_then_delete)
+    report = add_files_to_pinecone([copy], parse_workers=0, tenant="manifest-race")
+    assert len(calls) == 2 and report.chunks == 1 and report.skipped_chunks == 0
+    assert get_manifest("manifest-race").is_indexed(vector_id(text))
+    assert index.count("manifest-race") == 1
@@ -0,0 +1,19 @@
+from benchmarks.Corpus import generate_corpus
+from helper.Load_data import _pdf_metadata, iter_documents, iter_documents_parallel
+
+
+def test_page_ranges_match_the_serial_loader(tmp_path):
+    paths = generate_corpus(str(tmp_path), documents=6, pages=5)
+    serial = list(iter_documents(paths))
+    report = {}
+    parallel = list(iter_documents_parallel(paths, max_workers=2, pages_per_task=2, report=report))
+    assert [(page.page_content, page.metadata) for page in parallel] == \
+        [(page.page_content, page.metadata) for page in serial]
+    assert all(not stats["errors"] for stats in report.values())
+
+
+def test_pdf_metadata_is_normalized_like_pypdf_loader():
+    metadata = _pdf_metadata({"/Producer": " pypdf ", "/CreationDate": "D:20240102030405+01'00'",
+                              "/ModDate": "yesterday", "/Pages": 3, "/Custom": 1.5})
+    assert metadata == {"producer": "pypdf", "creationdate": "2024-01-02T03:04:05+01:00",
+                        "moddate": "yesterday", "pages": 3, "custom": "1.5"}
@@ -0,0 +1,61 @@
+import threading
+import time
+import pytest
+from helper.Pipeline import run_pipeline
+
+
+class Source:
+    """A long generator counting the items it produced."""
+
+    def __init__(self, count=1000, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.produced = 0
+
+    def __iter__(self):
+        for item in range(self.count):
+            if item == self.fail_at:
+                raise OSError("source failed")
+            self.produced += 1
+            yield item
+
+
+def test_items_go_through_every_stage_in_order():
+    collected = []
+    assert run_pipeline(range(100), [lambda item: item * 2, collected.append]) == 100
+    assert collected == [item * 2 for item in range(100)]
+
+
+def test_a_slow_stage_bounds_the_items_in_memory():
+    source, in_flight = Source(count=300), []
+
+    def slow_sink(item):
+        time.sleep(0.001)
+        in_flight.append(source.produced - item)
+
+    assert run_pipeline(source, [lambda item: item, slow_sink], queue_size=4) == 300
+    assert max(in_flight) <= (2 + 1) * 4
+
+
+@pytest.mark.parametrize("failing_stage", [0, 1])
+def test_a_stage_error_propagates_and_stops_the_source(failing_stage):
+    source, threads = Source(), threading.active_count()
+
+    def fail_at_ten(item):
+        if item == 10:
+            raise ValueError("bad chunk")
+        return item
+
+    stages = [lambda item: item, lambda item: None]
+    stages[failing_stage] = fail_at_ten
+    with pytest.raises(ValueError, match="bad chunk"):
+        run_pipeline(source, stages, queue_size=4)
+    assert source.produced < 100
+    assert threading.active_count() == threads
+
+
+def test_a_source_error_propagates():
+    collected = []
+    with pytest.raises(OSError, match="source failed"):
+        run_pipeline(Source(fail_at=50), [lambda item: item, collected.append])
+    assert len(collected) <= 50
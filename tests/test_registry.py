@@ -0,0 +1,39 @@
+import threading
+import time
+from helper.Clients import Registry, registry
+from helper.Full_chain import get_response, get_retriever_chain
+
+
+def test_entries_are_built_once_across_threads():
+    clients, builds = Registry(), []
+
+    def build():
+        time.sleep(0.05)
+        builds.append(object())
+        return builds[-1]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients.get("llm", build, config=("key",))))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1 and all(result is builds[0] for result in results)
+    assert clients.stats()["llm"]["builds"] == 1 and clients.stats()["llm"]["reuses"] == 7
+
+
+def test_entries_are_rebuilt_when_their_config_changes():
+    clients = Registry()
+    first = clients.get("llm", object, config=("old-key",))
+    assert clients.get("llm", object, config=("old-key",)) is first
+    assert clients.get("llm", object, config=("new-key",)) is not first
+
+
+def test_requests_reuse_the_retrieval_chain():
+    chain = get_retriever_chain()
+    builds = registry.stats()["retriever_chain"]["builds"]
+    for number in range(3):
+        get_response(f"How do I reset my Kindix hub? ({number})")
+    assert get_retriever_chain() is chain
+    assert registry.stats()["retriever_chain"]["builds"] == builds
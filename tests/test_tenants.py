@@ -0,0 +1,74 @@
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+import backend
+import helper.Tenants as Tenants
+from helper.Full_chain import get_retriever
+from helper.Tenants import ActiveTenants, InvalidTenantError, normalize_tenant, tenant_user
+from helper.Vector_db import add_documents_to_pinecone
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(backend.app) as client:
+        yield client
+
+
+def catalog(brand, count=20):
+    return [Document(page_content=f"{brand} product {brand}-{i} costs {i} dollars.", metadata={"source": f"{brand}.txt"})
+            for i in range(count)]
+
+
+def test_user_ids_cannot_name_another_tenants_user():
+    assert tenant_user("alice", "acme") == "|acme|alice"
+    assert tenant_user("whatsapp:+15551234567", None) == "whatsapp:+15551234567"
+    user_ids = ["alice", "|acme|alice", "\\|acme|alice", "acme|alice", "\\", "\\|", "|", "whatsapp:+1555"]
+    scoped = [tenant_user(user_id, tenant) for user_id in user_ids for tenant in (None, "acme", "acme-1")]
+    assert len(set(scoped)) == len(scoped)
+
+
+def test_allow_list(monkeypatch):
+    monkeypatch.setattr(Tenants, "ALLOWED_TENANTS", {"acme"})
+    assert normalize_tenant("ACME") == "acme"
+    assert normalize_tenant("") is None
+    with pytest.raises(InvalidTenantError):
+        normalize_tenant("globex")
+
+
+def test_least_recently_used_tenant_is_evicted():
+    tenants, evicted = ActiveTenants(capacity=2), []
+    tenants.on_evict(evicted.append)
+    for tenant in ("acme", "globex", "acme", "initech", None):
+        tenants.use(tenant)
+    assert evicted == ["globex"]
+    assert tenants.stats() == {"active": 2, "capacity": 2, "evictions": 1}
+
+
+def test_retrieval_only_searches_the_tenants_documents():
+    add_documents_to_pinecone(catalog("acme"), tenant="acme")
+    add_documents_to_pinecone(catalog("globex"), tenant="globex")
+    for tenant in ("acme", "globex"):
+        found = get_retriever(tenant).invoke("product costs dollars")
+        assert found and {document.metadata["source"] for document in found} == {f"{tenant}.txt"}
+
+
+def test_chat_history_is_kept_per_tenant(client):
+    response = client.post("/get_response", data={"user_query": "What does product 3 cost?",
+                                                  "user_id": "alice", "tenant": "acme"})
+    assert response.status_code == 200
+
+    acme = client.get("/chat_history/alice", params={"tenant": "acme"}).json()["turns"]
+    assert [turn["user_query"] for turn in acme] == ["What does product 3 cost?"]
+    assert client.get("/chat_history/alice", params={"tenant": "globex"}).json()["turns"] == []
+    assert client.get("/chat_history/alice").json()["turns"] == []
+
+
+def test_user_ids_with_separators_are_accepted(client):
+    user_id = "whatsapp:+15551234567"
+    response = client.post("/get_response", data={"user_query": "What does product 4 cost?",
+                                                  "user_id": user_id, "tenant": "acme"})
+    assert response.status_code == 200
+    turns = client.get(f"/chat_history/{user_id}", params={"tenant": "acme"}).json()["turns"]
+    assert [turn["user_query"] for turn in turns] == ["What does product 4 cost?"]
+    assert client.get("/chat_history/|acme|whatsapp:+15551234567").json()["turns"] == []
+    assert client.post("/get_response", data={"user_query": "hi", "tenant": "Bad Name!"}).status_code == 400
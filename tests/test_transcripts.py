@@ -0,0 +1,63 @@
+import types
+import pytest
+import backend
+from helper.Transcripts import (RateLimiter, TranscriptCache, TranscriptUnavailable, fetch_transcript,
+                                iter_transcripts, split_urls)
+
+
+class FlakySource:
+    """Fails with a transient error `failures` times, then returns a transcript."""
+
+    def __init__(self, failures=0, unavailable=False):
+        self.failures = failures
+        self.unavailable = unavailable
+        self.calls = 0
+
+    def fetch(self, video_id, languages):
+        self.calls += 1
+        if self.unavailable:
+            raise TranscriptUnavailable(f"NoTranscriptFound: {video_id}")
+        if self.calls <= self.failures:
+            raise ConnectionError("request blocked")
+        return "en", f"transcript of {video_id}"
+
+
+def test_form_values_are_split_and_deduplicated():
+    assert split_urls(["https://youtu.be/aaaaaaaaaaa\nhttps://youtu.be/bbbbbbbbbbb", "x, https://youtu.be/aaaaaaaaaaa"]) \
+        == ["https://youtu.be/aaaaaaaaaaa", "https://youtu.be/bbbbbbbbbbb", "x"]
+
+
+def test_transient_errors_are_retried_and_transcripts_cached(tmp_path):
+    cache, source = TranscriptCache(str(tmp_path / "transcripts.sqlite3")), FlakySource(failures=1)
+    assert fetch_transcript("retry000001", ["en"], source, cache, RateLimiter(0), max_retries=1) == \
+        ("en", "transcript of retry000001")
+    assert fetch_transcript("retry000001", ["ar", "en"], source, cache, RateLimiter(0)) == \
+        ("en", "transcript of retry000001")
+    assert source.calls == 2
+
+    missing = FlakySource(unavailable=True)
+    with pytest.raises(TranscriptUnavailable):
+        fetch_transcript("missing0001", ["en"], missing, cache, RateLimiter(0), max_retries=3)
+    assert missing.calls == 1
+
+
+def test_failed_videos_are_reported_without_stopping_the_others(fakes):
+    source = fakes["transcript_source"]
+    source.unavailable.add("private0001")
+    calls = source.calls
+    report = {}
+    urls = ["https://youtu.be/tourvideo01", "not a video", "https://www.youtube.com/watch?v=private0001",
+            "https://www.youtube.com/watch?v=tourvideo01", "tourvideo02"]
+    documents = list(iter_transcripts(urls, languages=["en"], report=report))
+    assert [document.metadata["video_id"] for document in documents] == ["tourvideo01", "tourvideo02"]
+    assert set(report) == {"not a video", "https://www.youtube.com/watch?v=private0001"}
+    assert source.calls - calls == 3
+
+
+def test_url_jobs_fail_only_when_nothing_was_ingested(fakes):
+    fakes["transcript_source"].unavailable.add("private0002")
+    job = types.SimpleNamespace(progress=0)
+    result = backend._ingest(job, urls=["https://youtu.be/tourvideo03", "https://youtu.be/private0002"])
+    assert result["chunks"] > 0 and list(result["failed_urls"]) == ["https://youtu.be/private0002"]
+    with pytest.raises(ValueError, match="Could not retrieve any transcript"):
+        backend._ingest(job, urls=["https://youtu.be/private0002"])
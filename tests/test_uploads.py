@@ -0,0 +1,63 @@
+import io
+import os
+import pytest
+from fastapi.testclient import TestClient
+import backend
+from helper.Uploads import (UPLOAD_CHUNK_SIZE, UPLOAD_DIR, UploadError, UploadTooLargeError, spool_file, spool_files,
+                            upload_name)
+
+
+class RecordingFile(io.BytesIO):
+    """An upload that records how much was read at once."""
+
+    def __init__(self, size):
+        super().__init__(b"x" * size)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def leftovers():
+    return sorted(os.listdir(UPLOAD_DIR)) if os.path.isdir(UPLOAD_DIR) else []
+
+
+def test_names_never_become_paths():
+    assert upload_name("../../etc/guide.TXT") == "guide.TXT"
+    assert upload_name("C:\\Users\\me\\manual.pdf") == "manual.pdf"
+    with pytest.raises(UploadError):
+        upload_name("script.sh")
+
+
+def test_files_are_copied_in_bounded_chunks():
+    upload = RecordingFile(3 * UPLOAD_CHUNK_SIZE + 5)
+    path, size = spool_file(upload, "catalog.pdf")
+    try:
+        assert size == os.path.getsize(path) == 3 * UPLOAD_CHUNK_SIZE + 5 and path.endswith(".pdf")
+        assert set(upload.reads) == {UPLOAD_CHUNK_SIZE}
+    finally:
+        os.remove(path)
+
+
+def test_limits_leave_no_partial_files_behind():
+    before = leftovers()
+    with pytest.raises(UploadTooLargeError, match="a.txt is larger"):
+        spool_files([(io.BytesIO(b"x" * 10), "a.txt")], max_file_bytes=5)
+    with pytest.raises(UploadTooLargeError, match="in total"):
+        spool_files([(io.BytesIO(b"x" * 4), "a.txt"), (io.BytesIO(b"x" * 4), "b.txt")],
+                    max_file_bytes=5, max_total_bytes=6)
+    with pytest.raises(UploadError, match="Duplicate"):
+        spool_files([(io.BytesIO(b"a"), "a.txt"), (io.BytesIO(b"b"), "dir/a.txt")])
+    with pytest.raises(UploadError, match="Too many files"):
+        spool_files([(io.BytesIO(b"a"), f"{number}.txt") for number in range(3)], max_files=2)
+    assert leftovers() == before
+
+
+def test_unsupported_uploads_are_rejected_before_ingestion():
+    before = leftovers()
+    with TestClient(backend.app) as client:
+        response = client.post("/add_data", data={"case": "Document"},
+                               files=[("files_data", ("notes.txt", b"ok")), ("files_data", ("run.exe", b"no"))])
+    assert response.status_code == 400 and "run.exe" in response.json()["detail"]
+    assert leftovers() == before
@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from langchain_core.documents import Document
+from benchmarks.Fakes import HashingEmbeddings
+import helper.Vector_db as Vector_db
+from helper.Upsert_engine import InMemoryIndex, UpsertEngine, UpsertError
+
+
+def chunks(count):
+    return [Document(page_content=f"chunk number {i}", metadata={"source": "doc.txt"}) for i in range(count)]
+
+
+def engine(index, **kwargs):
+    options = dict(embed_batch_size=10, upsert_batch_size=10, max_in_flight=2, max_retries=0, backoff_base=0)
+    return UpsertEngine(HashingEmbeddings(dimensions=8), index, **{**options, **kwargs})
+
+
+def test_resume_redoes_only_the_failed_batches():
+    index = InMemoryIndex(fail_every=3)
+    upserts = engine(index)
+    report = upserts.run(chunks(60))
+    assert report.failed and report.chunks + len(report.failed) == 60
+
+    index.fail_every = 0
+    calls = index.calls
+    report.absorb(upserts.resume(report))
+    assert report.chunks == 60 and not report.failed
+    assert index.calls - calls == 2  # the two failed batches, not all six
+    assert len(index.vectors[None]) == 60
+
+
+def test_callback_failures_are_kept_apart_and_only_rerun_the_callback():
+    indexed, fail = [], [True]
+
+    def on_upserted(records):
+        if fail[0]:
+            raise RuntimeError("lexical index unavailable")
+        indexed.extend(record["id"] for record in records)
+
+    index = InMemoryIndex()
+    upserts = engine(index, on_upserted=on_upserted)
+    report = upserts.run(chunks(20))
+    assert report.chunks == 20 and not report.failed and len(report.callback_failed) == 20
+
+    fail[0] = False
+    calls = index.calls
+    report.absorb(upserts.resume(report))
+    assert not report.callback_failed and len(indexed) == 20 and index.calls == calls
+
+
+def test_slow_index_bounds_the_batches_in_flight():
+    class SlowIndex(InMemoryIndex):
+        in_flight = peak = 0
+        lock = threading.Lock()
+
+        def upsert(self, vectors, namespace=None):
+            with self.lock:
+                SlowIndex.in_flight += 1
+                SlowIndex.peak = max(SlowIndex.peak, SlowIndex.in_flight)
+            time.sleep(0.01)
+            with self.lock:
+                SlowIndex.in_flight -= 1
+            return super().upsert(vectors, namespace)
+
+    report = engine(SlowIndex(), max_in_flight=2).run(chunks(100))
+    assert report.chunks == 100 and SlowIndex.peak <= 2
+
+
+class FlakyIndex(InMemoryIndex):
+    """Fails its first `failures` upserts, then works."""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            self.failures -= 1
+            failing = self.failures >= 0
+        if failing:
+            raise ConnectionError("simulated upsert failure")
+        return super().upsert(vectors, namespace)
+
+
+def test_ingestion_resumes_failed_chunks_before_failing(monkeypatch):
+    index = FlakyIndex(failures=2)
+    monkeypatch.setattr(Vector_db, "get_vector_index", lambda: index)
+    monkeypatch.setattr(Vector_db, "UpsertEngine",
+                        lambda *args, **kwargs: UpsertEngine(*args, **{**kwargs, "max_retries": 0, "upsert_batch_size": 10}))
+    report = Vector_db.add_documents_to_pinecone(chunks(40), tenant="upsert-resume")
+    assert report.chunks == 40 and not report.failed
+
+    index.failures = 100
+    with pytest.raises(UpsertError) as error:
+        Vector_db.add_documents_to_pinecone(chunks(45)[40:], tenant="upsert-resume")
+    assert len(error.value.report.failed) == 5